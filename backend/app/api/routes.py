@@ -1,84 +1,98 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Body, status
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Body, Query, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_, select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Any, Optional
 import os
+import base64
+import json
 import shutil
 from datetime import datetime, date
 
-from app.database import get_db, User, LeaveType, LeaveRequest, Policy,AnnualLeave
+from app.database import get_async_db, User, LeaveRequest, Policy, AnnualLeave, ChatHistory
 from app.rag.leave_recommender import LeaveRecommender
+from app.rag.knowledge_base import (
+    index_policy, remove_policy_from_index, get_cache_stats,
+    aget_qa_response, serialize_source, stream_qa_response
+)
+from app.rag.llm_gateway import LLMGatewayError
+from app.rag.ingest import SUPPORTED_EXTENSIONS
+from app.services.leave_catalog import leave_type_catalog
+from app.services.leave_intervals import leave_interval_index
+from app.services.team_coverage import absence_matrix
+from app.services.chat_history import chat_history_writer, conversation_context
+from app.services.passwords import password_hasher, PasswordHasherBusy
+from app.services.auth import (
+    create_access_token, ensure_user_access, get_admin_claims, get_current_claims, get_user_profile,
+    serialize_profile, user_profile_cache
+)
 from app.config import settings
 
 router = APIRouter()
 recommender = LeaveRecommender()
 
 @router.post('/auth/login')
-async def login( username: str = Body(...),password: str = Body(...),db: Session = Depends(get_db)):
-    
-    # 4. 查询年假数据
-    user = db.query(User).filter(User.username == username,User.hashed_password == password).first()
-    annual_leave =  db.query(AnnualLeave).filter(AnnualLeave.id == user.id).all()
-    
-    # 5. 构建响应数据
-    return  {
-        "id": user.id,
-        "username": user.username,
-        "email": user.email,
-        "full_name": user.full_name,
-        "department": user.department,
-        "position": user.position,
-        "employee_id": user.employee_id,
-        "hire_date": user.hire_date.strftime('%Y-%m-%d'),  # 格式化日期
-        "is_active": user.is_active,
-        "is_admin": user.is_admin,
-        "annual_leave": [
-            {
-            "total_days": lt.total_days,
-            "used_days": lt.used_days,
-            "remaining_days": lt.remaining_days    
-            }
-
-            for lt in annual_leave
-        ]
-   }
+async def login(username: str = Body(...), password: str = Body(...), db: AsyncSession = Depends(get_async_db)):
+    """用户登录，返回员工资料、当年年假和访问令牌（access_token）
+
+    用户和当年年假一次左连接查询（users.username 唯一索引 + ix_annual_leaves_user_year），
+    密码在专用的哈希线程池中校验，不阻塞事件循环；明文存储的旧密码校验通过后改写为哈希值。
+    """
+    row = (await db.execute(
+        select(User, AnnualLeave)
+        .outerjoin(AnnualLeave, and_(AnnualLeave.user_id == User.id, AnnualLeave.year == datetime.now().year))
+        .where(User.username == username)
+    )).first()
+    
+    try:
+        ok, new_hash = await password_hasher.verify(password, row[0].hashed_password if row else None)
+    except PasswordHasherBusy as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    if not ok:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="用户名或密码错误")
+    user, annual_leave = row
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="账号已停用")
+    
+    # 登录后的请求大多会读取员工资料，顺便放入缓存
+    profile = serialize_profile(user)
+    user_profile_cache.set(user.id, profile)
+    
+    return {
+        **profile,
+        "annual_leave": {
+            "total_days": annual_leave.total_days,
+            "used_days": annual_leave.used_days,
+            "remaining_days": annual_leave.remaining_days
+        } if annual_leave else None,
+        "access_token": create_access_token(user),
+        "token_type": "bearer"
+    }
+
 # 用户相关路由
 @router.get("/users/{user_id}")
-async def get_user(user_id: int, db: Session = Depends(get_db)):
-    """获取用户信息"""
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+async def get_user(
+    user_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    claims: Dict[str, Any] = Depends(get_current_claims)
+):
+    """获取用户信息（优先读员工资料缓存）"""
+    ensure_user_access(claims, user_id)
+    profile = await get_user_profile(db, user_id)
+    if not profile:
         raise HTTPException(status_code=404, detail="用户不存在")
     
-    return {
-        "id": user.id,
-        "username": user.username,
-        "email": user.email,
-        "full_name": user.full_name,
-        "department": user.department,
-        "position": user.position,
-        "employee_id": user.employee_id,
-        "hire_date": user.hire_date.strftime("%Y-%m-%d") if user.hire_date else None,
-        "is_active": user.is_active,
-        "is_admin": user.is_admin
-    }
+    return profile
 
 # 请假类型路由
 @router.get("/leave-types")
-async def get_leave_types(db: Session = Depends(get_db)):
+async def get_leave_types():
     """获取所有请假类型"""
-    leave_types = db.query(LeaveType).all()
-    return [
-        {
-            "id": lt.id,
-            "name": lt.name,
-            "description": lt.description,
-            "max_days": lt.max_days,
-            "need_approval": lt.need_approval,
-            "is_paid": lt.is_paid
-        }
-        for lt in leave_types
-    ]
+    return leave_type_catalog.all()
 
 # 请假推荐路由
 @router.post("/leave/recommend")
@@ -87,16 +101,20 @@ async def recommend_leave(
     start_date: str = Body(...),
     end_date: str = Body(...),
     reason: str = Body(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    claims: Dict[str, Any] = Depends(get_current_claims)
 ):
     """获取请假推荐方案"""
+    ensure_user_access(claims, user_id)
+    error = recommender.check_date_range(start_date, end_date)
+    if error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+    # 员工资料走缓存，推荐服务只需查询年假和请假记录
+    profile = await get_user_profile(db, user_id)
     try:
-        recommendations = recommender.generate_leave_recommendations(
-            db=db,
-            user_id=user_id,
-            start_date=start_date,
-            end_date=end_date,
-            reason=reason
+        # 推荐服务使用同步 Session 接口，run_sync 在异步连接上执行，不阻塞事件循环
+        recommendations = await db.run_sync(
+            recommender.generate_leave_recommendations, user_id, start_date, end_date, reason, profile
         )
         return recommendations
     except Exception as e:
@@ -105,6 +123,53 @@ async def recommend_leave(
             detail=f"生成推荐失败: {str(e)}"
         )
 
+# 批量请假推荐路由
+@router.post("/leave/recommend/batch")
+async def recommend_leave_batch(
+    items: List[Dict[str, Any]] = Body(..., embed=True),
+    db: AsyncSession = Depends(get_async_db),
+    claims: Dict[str, Any] = Depends(get_current_claims)
+):
+    """批量获取请假推荐方案
+
+    请求体为 {"items": [{"user_id", "start_date", "end_date", "reason"}, ...]}，
+    返回与 items 一一对应的结果，出错的条目为 {"error": ...}。
+    """
+    if len(items) > settings.LEAVE_RECOMMEND_BATCH_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单次最多 {settings.LEAVE_RECOMMEND_BATCH_MAX} 条"
+        )
+    for item in items:
+        ensure_user_access(claims, item.get("user_id"))
+    try:
+        results = await db.run_sync(recommender.generate_batch_recommendations, items)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"生成推荐失败: {str(e)}"
+        )
+    return {"results": results}
+
+# 批量计算请假天数
+@router.post("/leave/working-days")
+async def calculate_working_days(ranges: List[Dict[str, str]] = Body(...)):
+    """批量计算工作日数
+
+    请求体为 [{"start_date": "2025-01-01", "end_date": "2025-01-07"}, ...]，
+    返回与之一一对应的天数列表，用于薪资和报表批量计算。
+    """
+    try:
+        days = recommender.calculate_leave_days_batch(
+            [(item["start_date"], item["end_date"]) for item in ranges]
+        )
+    except (KeyError, ValueError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"日期格式错误: {str(e)}"
+        )
+    return {"days": days}
+
 # 请假申请路由
 @router.post("/leave/apply")
 async def apply_leave(
@@ -114,19 +179,102 @@ async def apply_leave(
     end_date: str = Body(...),
     reason: str = Body(...),
     ai_recommendation: Optional[str] = Body(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    claims: Dict[str, Any] = Depends(get_current_claims)
 ):
     """提交请假申请"""
-    result = recommender.submit_leave_request(
-        db=db,
-        user_id=user_id,
-        leave_type_id=leave_type_id,
-        start_date=start_date,
-        end_date=end_date,
-        reason=reason,
-        ai_recommendation=ai_recommendation
+    ensure_user_access(claims, user_id)
+    result = await db.run_sync(
+        recommender.submit_leave_request,
+        user_id, leave_type_id, start_date, end_date, reason, ai_recommendation
     )
     
+    if result.get("code") == "invalid":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result.get("message"))
+    if result.get("code") == "conflict":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=result.get("message")
+        )
+    if result.get("status") == "error":
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=result.get("message")
+        )
+    
+    return result
+
+# 请假审批路由：动作对应的目标状态
+LEAVE_ACTIONS = {"approve": "approved", "reject": "rejected", "cancel": "cancelled"}
+
+def resolve_leave_action(action: str) -> str:
+    if action not in LEAVE_ACTIONS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="不支持的审批操作")
+    return LEAVE_ACTIONS[action]
+
+def resolve_approver(new_status: str, claims: Dict[str, Any]) -> Optional[int]:
+    """审批和驳回只能由管理员操作，审批人取自令牌；取消不需要审批人"""
+    if new_status not in ("approved", "rejected"):
+        return None
+    if not claims.get("is_admin"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="只有管理员可以审批请假申请")
+    return claims["user_id"]
+
+def resolve_owner(new_status: str, claims: Dict[str, Any]) -> Optional[int]:
+    """员工只能取消本人的申请，返回限定的员工 id；管理员和审批操作不限定"""
+    if new_status != "cancelled":
+        return None
+    return None if claims.get("is_admin") else claims["user_id"]
+
+# 批量路由需要在 /leaves/{leave_id}/{action} 之前注册
+@router.post("/leaves/bulk/{action}")
+async def change_leave_status_bulk(
+    action: str,
+    ids: List[int] = Body(..., embed=True),
+    db: AsyncSession = Depends(get_async_db),
+    claims: Dict[str, Any] = Depends(get_current_claims)
+):
+    """批量审批、驳回或取消请假申请（一个事务、一条 UPDATE）
+
+    返回 updated（已更新的申请）和 skipped（不存在、正被其他审批处理、状态不允许变更或无权取消的申请）。
+    """
+    new_status = resolve_leave_action(action)
+    approver_id = resolve_approver(new_status, claims)
+    owner_id = resolve_owner(new_status, claims)
+    if len(ids) > settings.LEAVE_BULK_ACTION_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单次最多处理 {settings.LEAVE_BULK_ACTION_MAX} 条请假申请"
+        )
+    result = await db.run_sync(recommender.change_leave_status_bulk, ids, new_status, approver_id, owner_id)
+    
+    if result.get("status") == "error":
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=result.get("message")
+        )
+    
+    return result
+
+@router.post("/leaves/{leave_id}/{action}")
+async def change_leave_status(
+    leave_id: int,
+    action: str,
+    db: AsyncSession = Depends(get_async_db),
+    claims: Dict[str, Any] = Depends(get_current_claims)
+):
+    """审批（approve）、驳回（reject）或取消（cancel）一条请假申请"""
+    new_status = resolve_leave_action(action)
+    approver_id = resolve_approver(new_status, claims)
+    owner_id = resolve_owner(new_status, claims)
+    result = await db.run_sync(recommender.change_leave_status, leave_id, new_status, approver_id, owner_id)
+    
+    if result.get("code") == "not_found":
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=result.get("message"))
+    if result.get("code") == "forbidden":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=result.get("message"))
+    if result.get("code") == "conflict":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=result.get("message"))
     if result.get("status") == "error":
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -136,18 +284,58 @@ async def apply_leave(
     return result
 
 # 请假记录路由
+def encode_cursor(created_at: datetime, record_id: int) -> str:
+    """把 (created_at, id) 编码为分页游标"""
+    raw = f"{created_at.isoformat()}|{record_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str):
+    """解析分页游标，返回 (created_at, id)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, record_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(record_id)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的分页游标")
+
 @router.get("/leave/requests/{user_id}")
-async def get_leave_requests(user_id: int, db: Session = Depends(get_db)):
-    """获取用户的请假记录"""
-    # 以下SQLAlchemy 数据库查询的语句
-    # 添加排序条件：按 created_at（创建时间）字段降序排列（desc() 表示降序）
-    requests = db.query(LeaveRequest).filter(LeaveRequest.user_id == user_id).order_by(LeaveRequest.created_at.desc()).all()
+async def get_leave_requests(
+    user_id: int,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    claims: Dict[str, Any] = Depends(get_current_claims)
+):
+    """获取用户的请假记录
+
+    按 (created_at, id) 倒序做游标分页，下一页的游标放在响应头 X-Next-Cursor 中，
+    没有更多记录时不返回该响应头。
+    """
+    ensure_user_access(claims, user_id)
+    # 由 ix_leave_requests_user_created 索引支撑，请假类型名称从进程内目录解析
+    query = select(LeaveRequest).where(LeaveRequest.user_id == user_id)
+    
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query = query.where(or_(
+            LeaveRequest.created_at < cursor_created_at,
+            and_(LeaveRequest.created_at == cursor_created_at, LeaveRequest.id < cursor_id)
+        ))
+    
+    # 多取一条，用来判断是否还有下一页
+    query = query.order_by(LeaveRequest.created_at.desc(), LeaveRequest.id.desc()).limit(limit + 1)
+    rows = (await db.execute(query)).scalars().all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
     
     return [
         {
             "id": req.id,
             "user_id": req.user_id,
-            "leave_type": db.query(LeaveType).get(req.leave_type_id).name,
+            "leave_type": leave_type_catalog.name_of(req.leave_type_id),
             "start_date": req.start_date.strftime("%Y-%m-%d"),
             "end_date": req.end_date.strftime("%Y-%m-%d"),
             "days": req.days,
@@ -155,9 +343,71 @@ async def get_leave_requests(user_id: int, db: Session = Depends(get_db)):
             "status": req.status,
             "created_at": req.created_at.strftime("%Y-%m-%d %H:%M:%S")
         }
-        for req in requests
+        for req in rows
     ]
 
+# 部门请假查询路由
+@router.get("/departments/{department}/absences")
+async def get_department_absences(
+    department: str,
+    start_date: date = Query(...),
+    end_date: date = Query(...),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """查询部门在 [start_date, end_date] 内待审批和已批准的请假
+
+    由进程内的请假区间索引回答，不扫描 leave_requests 表，只按结果中的员工查一次姓名。
+    """
+    if end_date < start_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="结束日期不能早于开始日期"
+        )
+    # 索引过期时会同步重新加载，放到线程池中执行
+    absences = await run_in_threadpool(
+        leave_interval_index.department_absences, department, start_date, end_date
+    )
+    user_ids = {item["user_id"] for item in absences}
+    names = {}
+    if user_ids:
+        names = dict((await db.execute(
+            select(User.id, User.full_name).where(User.id.in_(user_ids))
+        )).all())
+    
+    return [{**item, "full_name": names.get(item["user_id"])} for item in absences]
+
+# 部门人员覆盖热力图路由
+@router.get("/departments/coverage")
+async def get_department_coverage(
+    start_date: date = Query(...),
+    end_date: date = Query(...),
+    department: Optional[List[str]] = Query(None),
+):
+    """各部门在 [start_date, end_date] 内每天的请假人数和在岗率（热力图数据）
+
+    department 可重复传入多个，不传时返回全部部门。
+    直接切片内存中的 日期 × 部门 缺勤矩阵，不访问数据库。
+    """
+    days = (end_date - start_date).days + 1
+    if days <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="结束日期不能早于开始日期"
+        )
+    if days > settings.LEAVE_COVERAGE_MAX_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单次最多查询 {settings.LEAVE_COVERAGE_MAX_DAYS} 天"
+        )
+    # 矩阵随区间索引加载，索引过期时会同步重新加载，放到线程池中执行
+    await run_in_threadpool(leave_interval_index.ensure_fresh)
+    return absence_matrix.heatmap(start_date.toordinal(), end_date.toordinal(), department)
+
+def save_upload_file(file: UploadFile, file_path: str):
+    """把上传文件写入磁盘（阻塞 IO，在线程池中执行）"""
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
 # 政策文件上传路由
 @router.post("/policies/upload")
 async def upload_policy_file(
@@ -165,11 +415,12 @@ async def upload_policy_file(
     description: str = Form(...),
     category: str = Form(...),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    claims: Dict[str, Any] = Depends(get_admin_claims)
 ):
-    """上传政策文件"""
+    """上传政策文件（仅管理员）"""
     # 检查文件类型
-    allowed_extensions = [".txt", ".pdf", ".docx", ".csv", ".json"]
+    allowed_extensions = SUPPORTED_EXTENSIONS
     file_ext = os.path.splitext(file.filename)[1].lower()
     
     if file_ext not in allowed_extensions:
@@ -183,8 +434,7 @@ async def upload_policy_file(
     os.makedirs(settings.POLICY_DIR, exist_ok=True)
     
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        await run_in_threadpool(save_upload_file, file, file_path)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -203,23 +453,10 @@ async def upload_policy_file(
         )
         
         db.add(policy)
-        db.commit()
-        db.refresh(policy)
-        
-        return {
-            "status": "success",
-            "message": "政策文件上传成功",
-            "policy": {
-                "id": policy.id,
-                "title": policy.title,
-                "description": policy.description,
-                "file_path": policy.file_path,
-                "file_type": policy.file_type,
-                "category": policy.category
-            }
-        }
+        await db.commit()
+        await db.refresh(policy)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         # 删除已上传的文件
         if os.path.exists(file_path):
             os.remove(file_path)
@@ -228,12 +465,109 @@ async def upload_policy_file(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"政策添加失败: {str(e)}"
         )
+    
+    # 增量更新知识库，只处理这一个文件
+    try:
+        await run_in_threadpool(index_policy, policy)
+    except Exception as e:
+        print(f"政策索引失败: {policy.id}, 错误: {str(e)}")
+    
+    return {
+        "status": "success",
+        "message": "政策文件上传成功",
+        "policy": {
+            "id": policy.id,
+            "title": policy.title,
+            "description": policy.description,
+            "file_path": policy.file_path,
+            "file_type": policy.file_type,
+            "category": policy.category
+        }
+    }
+
+# 更新政策
+@router.put("/policies/{policy_id}")
+async def update_policy(
+    policy_id: int,
+    title: Optional[str] = Body(None),
+    description: Optional[str] = Body(None),
+    category: Optional[str] = Body(None),
+    is_active: Optional[bool] = Body(None),
+    db: AsyncSession = Depends(get_async_db),
+    claims: Dict[str, Any] = Depends(get_admin_claims)
+):
+    """更新政策信息，停用的政策会从知识库移除（仅管理员）"""
+    policy = await db.get(Policy, policy_id)
+    if not policy:
+        raise HTTPException(status_code=404, detail="政策不存在")
+    
+    metadata_changed = False
+    for field, value in (("title", title), ("description", description), ("category", category)):
+        if value is not None and getattr(policy, field) != value:
+            setattr(policy, field, value)
+            metadata_changed = True
+    if is_active is not None:
+        policy.is_active = is_active
+    
+    try:
+        await db.commit()
+        await db.refresh(policy)
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"政策更新失败: {str(e)}"
+        )
+    
+    # 元数据写在每个块上，变更后需要强制重建该政策的块
+    try:
+        await run_in_threadpool(index_policy, policy, metadata_changed)
+    except Exception as e:
+        print(f"政策索引失败: {policy.id}, 错误: {str(e)}")
+    
+    return {
+        "status": "success",
+        "message": "政策更新成功",
+        "policy": {
+            "id": policy.id,
+            "title": policy.title,
+            "description": policy.description,
+            "file_type": policy.file_type,
+            "category": policy.category,
+            "is_active": policy.is_active
+        }
+    }
+
+# 删除（停用）政策
+@router.delete("/policies/{policy_id}")
+async def delete_policy(
+    policy_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    claims: Dict[str, Any] = Depends(get_admin_claims)
+):
+    """停用政策并从知识库移除（仅管理员）"""
+    policy = await db.get(Policy, policy_id)
+    if not policy:
+        raise HTTPException(status_code=404, detail="政策不存在")
+    
+    try:
+        policy.is_active = False
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"政策删除失败: {str(e)}"
+        )
+    
+    await run_in_threadpool(remove_policy_from_index, policy_id)
+    return {"status": "success", "message": "政策已停用"}
 
 # 获取政策列表
 @router.get("/policies")
-async def get_policies(db: Session = Depends(get_db)):
+async def get_policies(db: AsyncSession = Depends(get_async_db)):
     """获取所有政策"""
-    policies = db.query(Policy).filter(Policy.is_active == True).all()
+    policies = (await db.execute(select(Policy).where(Policy.is_active == True))).scalars().all()
     
     return [
         {
@@ -247,37 +581,147 @@ async def get_policies(db: Session = Depends(get_db)):
         for policy in policies
     ]
 
+# 知识库统计
+@router.get("/knowledge-base/stats")
+async def knowledge_base_stats():
+    """获取知识库版本、块数和查询缓存命中情况"""
+    return get_cache_stats()
+
 # 简单的聊天接口
 @router.post("/chat")
 async def chat(
     user_id: int = Body(...),
     message: str = Body(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    claims: Dict[str, Any] = Depends(get_current_claims)
 ):
-    """简单的聊天功能"""
-    # 检查用户是否存在
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+    """聊天功能：基于知识库回答请假相关问题"""
+    ensure_user_access(claims, user_id)
+    # 检查用户是否存在（读员工资料缓存）
+    if not await get_user_profile(db, user_id):
         raise HTTPException(status_code=404, detail="用户不存在")
     
-    # 简单的回复
-    response = "您好！我是请假助手。请问有什么可以帮您的吗？"
-    
-    # 记录聊天历史
+    history = await conversation_context.get(db, user_id)
     try:
-        from app.database import ChatHistory
-        chat_history = ChatHistory(
-            user_id=user_id,
-            message=message,
-            response=response
+        qa = await aget_qa_response(message, history)
+    except LLMGatewayError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"AI服务暂时不可用: {str(e)}"
         )
-        db.add(chat_history)
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        print(f"记录聊天历史失败: {str(e)}")
+    response = qa["result"]
+    
+    # 记录聊天历史：放入写入队列，由后台任务批量写库
+    await chat_history_writer.submit(user_id, message, response)
+    conversation_context.append(user_id, message, response)
     
     return {
         "response": response,
+        "sources": [serialize_source(doc) for doc in qa["source_documents"]],
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    } 
\ No newline at end of file
+    }
+
+def format_sse(event: str, data: Any) -> str:
+    """格式化一条 Server-Sent Events 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# 流式聊天接口
+@router.post("/chat/stream")
+async def chat_stream(
+    user_id: int = Body(...),
+    message: str = Body(...),
+    db: AsyncSession = Depends(get_async_db),
+    claims: Dict[str, Any] = Depends(get_current_claims)
+):
+    """流式聊天：先推送检索到的来源文档，再逐段推送回答"""
+    ensure_user_access(claims, user_id)
+    if not await get_user_profile(db, user_id):
+        raise HTTPException(status_code=404, detail="用户不存在")
+    history = await conversation_context.get(db, user_id)
+    
+    async def event_stream():
+        result = None
+        try:
+            async for event, data in stream_qa_response(message, history):
+                if event == "done":
+                    result = data["result"]
+                    data = {**data, "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+                yield format_sse(event, data)
+        except LLMGatewayError as e:
+            yield format_sse("error", {"detail": f"AI服务暂时不可用: {str(e)}"})
+        
+        # 回答完整生成后只写一次聊天记录
+        if result is not None:
+            await chat_history_writer.submit(user_id, message, result)
+            conversation_context.append(user_id, message, result)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# 聊天记录路由
+@router.get("/chat/history/{user_id}")
+async def get_chat_history(
+    user_id: int,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    claims: Dict[str, Any] = Depends(get_current_claims)
+):
+    """获取用户的聊天记录
+
+    与请假记录相同，按 (created_at, id) 倒序做游标分页，下一页的游标放在响应头 X-Next-Cursor 中。
+    """
+    ensure_user_access(claims, user_id)
+    # 由 ix_chat_histories_user_created 索引支撑
+    query = select(ChatHistory).where(ChatHistory.user_id == user_id)
+    
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query = query.where(or_(
+            ChatHistory.created_at < cursor_created_at,
+            and_(ChatHistory.created_at == cursor_created_at, ChatHistory.id < cursor_id)
+        ))
+    
+    query = query.order_by(ChatHistory.created_at.desc(), ChatHistory.id.desc()).limit(limit + 1)
+    rows = (await db.execute(query)).scalars().all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
+    
+    return [
+        {
+            "id": record.id,
+            "user_id": record.user_id,
+            "message": record.message,
+            "response": record.response,
+            "created_at": record.created_at.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        for record in rows
+    ]
+
+@router.post("/chat/history/{user_id}/clear")
+async def clear_chat_history(
+    user_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    claims: Dict[str, Any] = Depends(get_current_claims)
+):
+    """清空用户的聊天记录（一条批量 DELETE），同时清空对话上下文和尚未写库的记录"""
+    ensure_user_access(claims, user_id)
+    chat_history_writer.discard(user_id)
+    try:
+        result = await db.execute(delete(ChatHistory).where(ChatHistory.user_id == user_id))
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"清空聊天记录失败: {str(e)}"
+        )
+    conversation_context.clear(user_id)
+    
+    return {"status": "success", "message": "聊天记录已清空", "deleted": result.rowcount}
@@ -15,27 +15,99 @@ class Settings(BaseSettings):
     DB_PASSWORD: str = os.getenv("DB_PASSWORD", "npg_CFPsuoeQvR67")
     DB_NAME: str = os.getenv("DB_NAME", "neondb")
     
+    # 数据库连接池配置（SQLite 不使用连接池参数）
+    DB_POOL_SIZE: int = 10  # 常驻连接数
+    DB_MAX_OVERFLOW: int = 20  # 常驻连接用完后最多额外创建的连接数
+    DB_POOL_TIMEOUT: float = 30.0  # 等待空闲连接的超时时间（秒）
+    DB_POOL_RECYCLE: int = 1800  # 连接使用超过该秒数后重建，避免被服务端或代理断开，-1 表示不回收
+    DB_POOL_PRE_PING: bool = True  # 取出连接前先检测是否可用
+    DB_ECHO: bool = False  # 打印每条 SQL，与 DEBUG 分开，避免默认开启同步日志
+    
     # 兼容旧配置
     DB_TYPE: Optional[str] = None
-    VECTOR_DB_PATH: Optional[str] = None
+    VECTOR_DB_PATH: Optional[str] = os.getenv("VECTOR_DB_PATH", "./data/vector_db")  # 知识库分块缓存和快照目录，置空则禁用
     OPENAI_API_KEY: Optional[str] = None
     OPENAI_API_BASE: Optional[str] = None
     OPENAI_API_MODEL: Optional[str] = None
     VECTOR_DB_TYPE: Optional[str] = None
     EMBEDDING_MODEL: Optional[str] = None
+    EMBEDDING_DIM: int = 512  # 本地哈希嵌入的向量维度
+    INGEST_WORKERS: Optional[int] = None  # 批量导入政策时的解析进程数，默认为 CPU 核数
+    QA_CACHE_SIZE: int = 1024  # 检索/问答缓存的最大条目数
+    QA_CACHE_TTL: int = 300  # 检索/问答缓存的有效期（秒）
+    
+    # 大模型网关配置
+    LLM_MAX_CONCURRENCY: int = 8  # 每个进程同时发往大模型的请求数
+    LLM_MAX_CONNECTIONS: int = 20  # 连接池大小
+    LLM_MAX_RETRIES: int = 3
+    LLM_TIMEOUT: float = 30.0
+    
+    # 聊天记录批量写入配置
+    CHAT_HISTORY_BATCH_SIZE: int = 100  # 攒够多少条写一次
+    CHAT_HISTORY_FLUSH_MS: int = 200  # 最多等待多少毫秒写一次
+    CHAT_HISTORY_QUEUE_SIZE: int = 10000  # 待写入队列上限，满了之后请求等待
+    CHAT_CONTEXT_TURNS: int = 5  # 多轮问答带上的最近对话轮数，0 表示不带
+    CHAT_CONTEXT_MAX_USERS: int = 10000  # 内存中保留对话上下文的用户数上限
     UPLOAD_DIR: Optional[str] = None
     
+    # 完整的数据库连接URL，设置后忽略 DB_HOST 等分项配置，如 sqlite:///./data/dev.db
+    DB_URL: Optional[str] = os.getenv("DB_URL")
+    
     # 数据库连接URL
     @property
     def DATABASE_URL(self) -> str:
         """生成数据库连接URL"""
+        if self.DB_URL:
+            return self.DB_URL
         return f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
     
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        """异步驱动的数据库连接URL（PostgreSQL 用 asyncpg，SQLite 用 aiosqlite）"""
+        url = self.DATABASE_URL
+        scheme, sep, rest = url.partition("://")
+        driver = scheme.split("+", 1)[0]
+        if driver in ("postgresql", "postgres"):
+            return f"postgresql+asyncpg{sep}{rest}"
+        if driver == "sqlite":
+            return f"sqlite+aiosqlite{sep}{rest}"
+        return url
+    
     # JWT认证配置
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     
+    # 密码哈希：bcrypt work factor、专用线程池大小、排队上限（超出时登录返回 503）
+    PASSWORD_HASH_ROUNDS: int = int(os.getenv("PASSWORD_HASH_ROUNDS", "12"))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    
+    # 员工资料缓存（鉴权、推荐、聊天按 user_id 读取资料时使用）
+    USER_PROFILE_CACHE_SIZE: int = 10000
+    USER_PROFILE_CACHE_TTL: int = 60
+    
+    # 请假类型目录在进程内的刷新周期（秒），本进程的修改会立即生效
+    LEAVE_TYPE_CATALOG_TTL: int = 300
+    
+    # 批量请假推荐单次请求的最大条目数
+    LEAVE_RECOMMEND_BATCH_MAX: int = 5000
+    
+    # 批量审批单次请求的最大申请数
+    LEAVE_BULK_ACTION_MAX: int = 1000
+    
+    # 请假区间索引：加载结束日期在最近多少天内的请假，以及全量重新加载的周期（秒）
+    LEAVE_INTERVAL_LOOKBACK_DAYS: int = 365
+    LEAVE_INTERVAL_TTL: int = 300
+    
+    # 部门缺勤矩阵：预先覆盖到今天之后多少天、覆盖率接口单次查询的最大天数、错峰方案前后平移的最大周数
+    LEAVE_COVERAGE_HORIZON_DAYS: int = 365
+    LEAVE_COVERAGE_MAX_DAYS: int = 366
+    LEAVE_OFF_PEAK_SHIFT_WEEKS: int = 2
+    
+    # 节假日表（JSON：holidays 放假日期，workdays 调休上班日期），默认使用内置的中国节假日表
+    HOLIDAY_CALENDAR_PATH: Optional[str] = os.getenv("HOLIDAY_CALENDAR_PATH")
+    
     # 文件上传配置
     POLICY_DIR: str = os.getenv("POLICY_DIR", "./policies")
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
@@ -1,23 +1,141 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, Session
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from datetime import datetime
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Optional
 import os
+import threading
+import time
 
 from app.config import settings
 
 # 打印数据库连接信息
 print(f"数据库URL: {settings.DATABASE_URL}")
 
+# 当前是否处于连接池取连接的计时中；asyncio 下多个协程共用一个线程，需按上下文而不是按线程区分
+_checkout_timing: ContextVar[bool] = ContextVar("checkout_timing", default=False)
+
+class InstrumentedQueuePool(QueuePool):
+    """带统计的连接池
+
+    记录取连接的次数、等待时间、超时次数和溢出连接的创建次数，
+    用于根据实际负载调整 DB_POOL_SIZE / DB_MAX_OVERFLOW 和 worker 数。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.overflow_events = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _do_get(self):
+        # QueuePool._do_get 在竞争时会递归调用自身，只在最外层计时
+        if _checkout_timing.get():
+            return super()._do_get()
+        token = _checkout_timing.set(True)
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            _checkout_timing.reset(token)
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def _inc_overflow(self) -> bool:
+        # _overflow 从 -pool_size 开始计数，大于 0 说明创建的是超出常驻数量的连接
+        created = super()._inc_overflow()
+        if created and self._overflow > 0:
+            with self._stats_lock:
+                self.overflow_events += 1
+        return created
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池当前状态和累计统计"""
+        return {
+            "size": self.size(),
+            "max_overflow": self._max_overflow,
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "overflow_events": self.overflow_events,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_avg": round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+            "wait_seconds_max": round(self.wait_seconds_max, 6)
+        }
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """异步引擎使用的带统计连接池"""
+
+
+def engine_options(url: str, is_async: bool = False) -> Dict[str, Any]:
+    """create_engine 的参数，SQLite 使用默认连接池，不设置池大小"""
+    options: Dict[str, Any] = {"echo": settings.DB_ECHO}
+    if url.startswith("sqlite"):
+        return options
+    options.update(
+        poolclass=InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING
+    )
+    return options
+
 # 创建数据库引擎
-engine = create_engine(
-    settings.DATABASE_URL,
-    echo=settings.DEBUG
-)
+engine = create_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL))
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 异步引擎和会话工厂，首次使用时创建（驱动只在用到时才需要安装）
+async_engine: Optional[AsyncEngine] = None
+AsyncSessionLocal: Optional[async_sessionmaker] = None
+
+def get_async_sessionmaker() -> async_sessionmaker:
+    """返回异步会话工厂，必要时创建异步引擎"""
+    global async_engine, AsyncSessionLocal
+    if AsyncSessionLocal is None:
+        url = settings.ASYNC_DATABASE_URL
+        async_engine = create_async_engine(url, **engine_options(url, is_async=True))
+        # 提交后不过期对象，提交之后仍可直接读取属性而不触发隐式 IO
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    return AsyncSessionLocal
+
+async def close_async_engine() -> None:
+    """关闭异步引擎的连接池"""
+    if async_engine is not None:
+        await async_engine.dispose()
+
+def _pool_stats(pool) -> Dict[str, Any]:
+    if isinstance(pool, InstrumentedQueuePool):
+        return pool.stats()
+    return {"pool": type(pool).__name__, "status": pool.status()}
+
+def get_pool_stats() -> Dict[str, Any]:
+    """数据库连接池统计（同步引擎和异步引擎）"""
+    return {
+        "sync": _pool_stats(engine.pool),
+        "async": _pool_stats(async_engine.pool) if async_engine is not None else None
+    }
+
 # 创建基类
 Base = declarative_base()
 
@@ -70,6 +188,13 @@ class LeaveRequest(Base):
     # user = relationship("User", foreign_keys=[user_id], back_populates="leave_requests")
     leave_type = relationship("LeaveType", back_populates="leave_requests")
     approver = relationship("User", foreign_keys=[approver_id])
+    
+    # 按用户分页查询请假记录：WHERE user_id = ? ORDER BY created_at DESC, id DESC
+    __table_args__ = (
+        Index("ix_leave_requests_user_created", user_id, created_at.desc(), id.desc()),
+        # 提交请假时查库确认时间不重叠：WHERE user_id = ? AND status IN (...) AND start_date <= ? AND end_date >= ?
+        Index("ix_leave_requests_user_status_start", user_id, status, start_date),
+    )
 
 class AnnualLeave(Base):
     """年假记录模型"""
@@ -86,6 +211,35 @@ class AnnualLeave(Base):
     
     # 关系
     user = relationship("User", back_populates="annual_leaves")
+    
+    # 登录、推荐按员工查当年年假：WHERE user_id = ? AND year = ?
+    __table_args__ = (
+        Index("ix_annual_leaves_user_year", user_id, year),
+    )
+
+class LeaveBalance(Base):
+    """请假额度台账模型
+
+    每个员工、每种请假类型、每年一行，随请假申请的提交、审批、取消在同一事务中增量更新，
+    查询可用额度只需按唯一索引读一行，不必再汇总全部请假记录。
+    total_days 为空表示该类型不限额度。
+    """
+    __tablename__ = "leave_balances"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    leave_type_id = Column(Integer, ForeignKey("leave_types.id"), nullable=False)
+    year = Column(Integer, nullable=False)
+    total_days = Column(Float)
+    used_days = Column(Float, nullable=False, default=0)
+    pending_days = Column(Float, nullable=False, default=0)
+    remaining_days = Column(Float)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("user_id", "leave_type_id", "year", name="uq_leave_balances_user_type_year"),
+    )
 
 class LeaveType(Base):
     """请假类型模型"""
@@ -131,6 +285,11 @@ class ChatHistory(Base):
     
     # 关系
     user = relationship("User")
+    
+    # 按用户分页查询聊天记录、读取最近几轮对话：WHERE user_id = ? ORDER BY created_at DESC, id DESC
+    __table_args__ = (
+        Index("ix_chat_histories_user_created", user_id, created_at.desc(), id.desc()),
+    )
 
 # 数据库初始化函数
 def init_db():
@@ -142,6 +301,11 @@ def init_db():
     # 创建所有表
     Base.metadata.create_all(bind=engine)
     
+    # create_all 不会给已存在的表补建索引，这里逐个检查补建
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    
     # 添加初始数据
     db = SessionLocal()
     try:
@@ -163,6 +327,32 @@ def init_db():
     except Exception as e:
         db.rollback()
         print(f"添加初始数据失败: {e}")
+    
+    # 加载请假类型目录，之后按 id/名称解析请假类型不再查库
+    try:
+        from app.services.leave_catalog import leave_type_catalog
+        leave_type_catalog.load(db)
+        print(f"已加载请假类型目录，共 {len(leave_type_catalog.all())} 种")
+    except Exception as e:
+        print(f"加载请假类型目录失败: {e}")
+    
+    # 加载请假区间索引，用于冲突检测和部门请假查询
+    try:
+        from app.services.leave_intervals import leave_interval_index
+        leave_interval_index.load(db)
+        print(f"已加载请假区间索引，共 {leave_interval_index.stats()['intervals']} 条")
+    except Exception as e:
+        print(f"加载请假区间索引失败: {e}")
+    
+    # 已有请假记录但额度台账为空（刚升级到台账版本）时，从历史记录重建一次
+    try:
+        if db.query(LeaveBalance.id).first() is None and db.query(LeaveRequest.id).first() is not None:
+            from app.services.leave_balance import rebuild_balances
+            result = rebuild_balances(db)
+            print(f"已从请假记录重建额度台账，共 {result['rows']} 行")
+    except Exception as e:
+        db.rollback()
+        print(f"重建额度台账失败: {e}")
     finally:
         db.close()
 
@@ -173,4 +363,10 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+# 获取异步数据库会话
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """获取异步数据库会话，查询期间不阻塞事件循环"""
+    async with get_async_sessionmaker()() as db:
+        yield db 
\ No newline at end of file
@@ -0,0 +1,183 @@
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，一般也只跑单个 worker，发布快照时不加锁
+    fcntl = None
+
+# 缓存格式版本，分块参数或文件格式变化时递增
+CACHE_FORMAT_VERSION = 1
+
+# 这些元数据由政策记录决定，不写入按内容寻址的缓存
+POLICY_METADATA_KEYS = ("title", "description", "category", "policy_id")
+
+
+def write_chunks(directory: str, prefix: str, documents: List[Document], vectors: np.ndarray) -> None:
+    """把文档块和向量写成可内存映射的二进制文件
+
+    - {prefix}.vectors.npy  float32 向量矩阵
+    - {prefix}.text.bin     所有块文本拼接后的 UTF-8 字节
+    - {prefix}.offsets.npy  每个块在 text.bin 中的起止偏移
+    - {prefix}.meta.json    每个块的元数据
+    """
+    os.makedirs(directory, exist_ok=True)
+    encoded = [doc.page_content.encode("utf-8") for doc in documents]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+
+    # 先写临时文件再原子替换，读者不会看到写了一半的缓存
+    tmp = f".{prefix}.{uuid.uuid4().hex}"
+    targets = {
+        "vectors.npy": lambda f: np.save(f, np.ascontiguousarray(vectors, dtype=np.float32)),
+        "offsets.npy": lambda f: np.save(f, offsets),
+        "text.bin": lambda f: f.write(b"".join(encoded)),
+        "meta.json": lambda f: f.write(json.dumps(
+            [doc.metadata for doc in documents], ensure_ascii=False, default=str
+        ).encode("utf-8")),
+    }
+    for suffix, writer in targets.items():
+        tmp_path = os.path.join(directory, f"{tmp}.{suffix}")
+        with open(tmp_path, "wb") as f:
+            writer(f)
+    # meta.json 最后替换，作为整组文件写入完成的标志
+    for suffix in ("vectors.npy", "offsets.npy", "text.bin", "meta.json"):
+        os.replace(os.path.join(directory, f"{tmp}.{suffix}"), os.path.join(directory, f"{prefix}.{suffix}"))
+
+
+def read_chunks(directory: str, prefix: str, mmap: bool = True) -> Optional[Tuple[List[Document], np.ndarray]]:
+    """读取 write_chunks 写出的文件，不存在时返回 None
+
+    向量以只读内存映射方式打开，不会整体读入内存。
+    """
+    meta_path = os.path.join(directory, f"{prefix}.meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    mmap_mode = "r" if mmap else None
+    vectors = np.load(os.path.join(directory, f"{prefix}.vectors.npy"), mmap_mode=mmap_mode)
+    offsets = np.load(os.path.join(directory, f"{prefix}.offsets.npy"))
+    with open(os.path.join(directory, f"{prefix}.text.bin"), "rb") as f:
+        text = f.read()
+    with open(meta_path, "r", encoding="utf-8") as f:
+        metadatas = json.load(f)
+
+    documents = [
+        Document(page_content=text[offsets[i]:offsets[i + 1]].decode("utf-8"), metadata=metadata)
+        for i, metadata in enumerate(metadatas)
+    ]
+    return documents, vectors
+
+
+class ChunkCache:
+    """按文件内容哈希寻址的分块缓存
+
+    同一份文件（无论属于哪个政策、放在哪个路径）只解析和嵌入一次。
+    缓存目录按格式版本和向量维度分区，参数变化后自动使用新分区。
+    """
+
+    def __init__(self, root: str, dim: int):
+        self.root = os.path.join(root, f"v{CACHE_FORMAT_VERSION}", f"d{dim}")
+        self.chunk_dir = os.path.join(self.root, "chunks")
+        os.makedirs(self.chunk_dir, exist_ok=True)
+
+    def get(self, content_hash: str, policy_metadata: Dict[str, Any]) -> Optional[Tuple[List[Document], np.ndarray]]:
+        """读取缓存的块，并附加当前政策的元数据"""
+        cached = read_chunks(self.chunk_dir, content_hash, mmap=False)
+        if cached is None:
+            return None
+        documents, vectors = cached
+        for doc in documents:
+            doc.metadata.update(policy_metadata)
+        return documents, vectors
+
+    def put(self, content_hash: str, documents: List[Document], vectors: np.ndarray) -> None:
+        """写入缓存，去掉政策相关的元数据"""
+        stripped = [
+            Document(
+                page_content=doc.page_content,
+                metadata={k: v for k, v in doc.metadata.items() if k not in POLICY_METADATA_KEYS}
+            )
+            for doc in documents
+        ]
+        write_chunks(self.chunk_dir, content_hash, stripped, vectors)
+
+    def snapshot_dir(self) -> Optional[str]:
+        """返回当前索引快照所在目录，没有快照时返回 None"""
+        pointer = os.path.join(self.root, "CURRENT")
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        path = os.path.join(self.root, name)
+        return path if os.path.isdir(path) else None
+
+    def new_snapshot_dir(self) -> str:
+        """创建一个写入中的快照目录，写完后交给 publish_snapshot 发布
+
+        目录名以 . 开头，清理旧快照时不会被其他 worker 删除。
+        """
+        path = os.path.join(self.root, f".building-{time.time_ns():020d}-{uuid.uuid4().hex}")
+        os.makedirs(path)
+        return path
+
+    @contextmanager
+    def _publish_lock(self):
+        """多个 worker 同时保存快照（如一起退出）时，串行执行发布和清理"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.root, ".publish.lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def publish_snapshot(self, path: str) -> str:
+        """把写好的快照目录设为当前快照，清理比被替换的快照更旧的快照，返回发布后的目录
+
+        发布后的目录名 index-{创建时间}-{随机串} 可按创建时间排序。
+        被替换的快照本身保留（其他进程可能刚读到 CURRENT 正在打开它），
+        写入中的 .building-* 和比它新的快照（其他 worker 刚发布的）都不会删除。
+        """
+        name = os.path.basename(path)
+        if name.startswith(".building-"):
+            name = "index-" + name[len(".building-"):]
+        published = os.path.join(self.root, name)
+        pointer = os.path.join(self.root, "CURRENT")
+
+        with self._publish_lock():
+            if published != path:
+                os.replace(path, published)
+            replaced = self.snapshot_dir()
+            tmp_pointer = f"{pointer}.{uuid.uuid4().hex}"
+            with open(tmp_pointer, "w", encoding="utf-8") as f:
+                f.write(name)
+            os.replace(tmp_pointer, pointer)
+
+            if replaced is None:
+                return published
+            # 已映射的旧文件在 POSIX 上删除后仍可读，直到映射释放
+            cutoff = _snapshot_created(os.path.basename(replaced))
+            for old in os.listdir(self.root):
+                if (old.startswith("index-") and old not in (name, os.path.basename(replaced))
+                        and _snapshot_created(old) < cutoff):
+                    shutil.rmtree(os.path.join(self.root, old), ignore_errors=True)
+        return published
+
+
+def _snapshot_created(name: str) -> int:
+    """快照目录名中的创建时间（纳秒），旧格式 index-{随机串} 视为 0"""
+    parts = name.split("-")
+    if len(parts) == 3 and parts[1].isdigit():
+        return int(parts[1])
+    return 0
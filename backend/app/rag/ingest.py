@@ -0,0 +1,151 @@
+import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import (
+    TextLoader,
+    PyPDFLoader,
+    Docx2txtLoader,
+    CSVLoader,
+    JSONLoader
+)
+
+from app.rag.vector_store import HashingEmbeddings
+
+# 支持导入的政策文件扩展名
+SUPPORTED_EXTENSIONS = [".txt", ".pdf", ".docx", ".csv", ".json"]
+
+# 文本分割器
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=1000,
+    chunk_overlap=200,
+    separators=["\n\n", "\n", "。", "，", ".", ",", " ", ""]
+)
+
+def create_loader(file_path: str):
+    """根据文件类型选择加载器，不支持的类型返回 None"""
+    if file_path.endswith('.txt'):
+        return TextLoader(file_path, encoding='utf-8')
+    elif file_path.endswith('.pdf'):
+        return PyPDFLoader(file_path)
+    elif file_path.endswith('.docx'):
+        return Docx2txtLoader(file_path)
+    elif file_path.endswith('.csv'):
+        return CSVLoader(file_path)
+    elif file_path.endswith('.json'):
+        return JSONLoader(
+            file_path=file_path,
+            jq_schema='.[]',
+            text_content=False
+        )
+    return None
+
+def file_content_hash(file_path: str) -> str:
+    """计算文件内容的 SHA-256 哈希"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_file_documents(file_path: str, metadata: Dict[str, Any]) -> List[Document]:
+    """加载单个文件并附加元数据"""
+    loader = create_loader(file_path)
+    if loader is None:
+        raise ValueError(f"不支持的文件类型: {file_path}")
+
+    docs = loader.load()
+    for doc in docs:
+        doc.metadata.update(metadata)
+    return docs
+
+def parse_file(task: Dict[str, Any]) -> Dict[str, Any]:
+    """解析、分块并嵌入单个文件
+
+    在子进程中执行，所有异常都被捕获并放进结果里，
+    单个文件失败不会影响同一批次的其他文件。
+
+    Args:
+        task: {"key", "file_path", "metadata", "dim"}
+
+    Returns:
+        {"key", "file_path", "documents", "vectors", "error"}
+    """
+    try:
+        docs = load_file_documents(task["file_path"], task.get("metadata", {}))
+        chunks = text_splitter.split_documents(docs)
+        vectors = HashingEmbeddings(task["dim"]).embed_matrix([chunk.page_content for chunk in chunks])
+    except Exception as e:
+        return _failed(task, e)
+    return {"key": task["key"], "file_path": task["file_path"], "documents": chunks, "vectors": vectors, "error": None}
+
+def run_pipeline(
+    tasks: Iterable[Dict[str, Any]],
+    max_workers: Optional[int] = None,
+    max_pending: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """并行解析一批文件，按完成顺序逐个产出结果
+
+    使用进程池绕开 GIL；同时在途的任务数不超过 max_pending，
+    避免几千个文件的结果同时堆在内存里。
+    max_workers <= 1 时在当前进程内顺序执行。
+
+    Args:
+        tasks: parse_file 的任务字典
+        max_workers: 进程数，默认为 CPU 核数
+        max_pending: 最大在途任务数，默认为进程数的 2 倍
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers <= 1:
+        for task in tasks:
+            yield parse_file(task)
+        return
+
+    max_pending = max_pending or max_workers * 2
+    task_iter = iter(tasks)
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    pending = {}
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                task = next(task_iter, None)
+                if task is None:
+                    exhausted = True
+                    break
+                pending[executor.submit(parse_file, task)] = task
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                task = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # 子进程异常退出（如内存不足）等 parse_file 自身捕获不到的错误
+                    broken = broken or isinstance(e, BrokenProcessPool)
+                    result = _failed(task, e)
+                yield result
+            if broken:
+                # 进程池已损坏：在途任务全部记为失败，换一个新进程池继续处理剩余文件
+                for task in pending.values():
+                    yield _failed(task, BrokenProcessPool("进程池异常终止"))
+                pending = {}
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = ProcessPoolExecutor(max_workers=max_workers)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def _failed(task: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+    """构造失败结果"""
+    return {
+        "key": task["key"], "file_path": task["file_path"],
+        "documents": None, "vectors": None,
+        "error": f"{type(error).__name__}: {error}"
+    }
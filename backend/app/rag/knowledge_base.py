@@ -1,200 +1,284 @@
 import os
+import asyncio
 import glob
-from typing import List, Dict, Any, Optional
+import unicodedata
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 import json
 
 from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import (
-    TextLoader, 
-    PyPDFLoader, 
-    Docx2txtLoader, 
-    CSVLoader,
-    JSONLoader
-)
-from langchain_community.vectorstores import Chroma
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
 
+from app.cache import TTLCache
 from app.config import settings
 from app.database import SessionLocal, Policy
+from app.rag.chunk_cache import ChunkCache
+from app.rag.ingest import file_content_hash, run_pipeline
+from app.rag.llm_gateway import get_llm_gateway, is_llm_configured
+from app.rag.vector_store import HashingEmbeddings, LocalVectorStore
 
 # 全局变量，存储向量数据库实例
 vector_store = None
+# 全局变量，按内容哈希寻址的分块缓存（未配置 VECTOR_DB_PATH 时为 None）
+chunk_cache = None
+# 最近一次快照对应的索引版本，用于跳过无变化的保存
+snapshot_version = None
 
-def init_knowledge_base():
-    """初始化知识库
+# 检索结果和问答结果缓存，键中带知识库版本，重新索引后自动失效
+retrieval_cache = TTLCache(maxsize=settings.QA_CACHE_SIZE, ttl=settings.QA_CACHE_TTL)
+answer_cache = TTLCache(maxsize=settings.QA_CACHE_SIZE, ttl=settings.QA_CACHE_TTL)
+
+def policy_metadata(policy: Policy) -> Dict[str, Any]:
+    """政策记录附加到每个块上的元数据"""
+    return {
+        "title": policy.title,
+        "description": policy.description,
+        "category": policy.category,
+        "policy_id": policy.id
+    }
+
+def get_chunk_cache() -> Optional[ChunkCache]:
+    """返回分块缓存，未配置 VECTOR_DB_PATH 时返回 None"""
+    global chunk_cache
+    if chunk_cache is None and settings.VECTOR_DB_PATH:
+        chunk_cache = ChunkCache(settings.VECTOR_DB_PATH, settings.EMBEDDING_DIM)
+    return chunk_cache
+
+def get_vector_store() -> LocalVectorStore:
+    """返回全局向量索引
+
+    未初始化时优先从磁盘快照内存映射加载，没有快照则创建空索引。
+    """
+    global vector_store, snapshot_version
+    if vector_store is None:
+        embeddings = HashingEmbeddings(settings.EMBEDDING_DIM)
+        cache = get_chunk_cache()
+        snapshot = cache.snapshot_dir() if cache else None
+        if snapshot:
+            try:
+                vector_store = LocalVectorStore.load(snapshot, embeddings)
+                if vector_store is not None:
+                    snapshot_version = vector_store.version
+                    print(f"已从快照加载知识库: {snapshot}, 块数: {len(vector_store)}")
+            except Exception as e:
+                print(f"加载知识库快照失败: {snapshot}, 错误: {e}")
+                vector_store = None
+        if vector_store is None:
+            vector_store = LocalVectorStore(embeddings)
+    return vector_store
+
+def save_knowledge_base() -> Optional[str]:
+    """把当前知识库保存为磁盘快照，返回快照目录"""
+    global snapshot_version
+    cache = get_chunk_cache()
+    if cache is None or vector_store is None:
+        return None
+    if snapshot_version == vector_store.version and cache.snapshot_dir():
+        return cache.snapshot_dir()
+    version = vector_store.version
+    path = cache.new_snapshot_dir()
+    vector_store.save(path)
+    path = cache.publish_snapshot(path)
+    snapshot_version = version
+    print(f"知识库快照已保存: {path}, 块数: {len(vector_store)}")
+    return path
+
+def index_policies(
+    policies: List[Policy],
+    force: bool = False,
+    max_workers: Optional[int] = None,
+    max_pending: Optional[int] = None
+) -> Dict[str, int]:
+    """增量索引一批政策
+
+    只有新政策或文件内容哈希发生变化时才重新处理：命中分块缓存的直接写入，
+    其余文件交给并行流水线解析、分块和嵌入；已停用或文件缺失的政策会从索引中移除。
     
-    加载所有政策文件，创建向量数据库
+    Args:
+        policies: 政策记录
+        force: 为 True 时忽略哈希比较，强制重建（如标题等元数据变更）
+        max_workers: 解析进程数，默认取 INGEST_WORKERS 配置
+        max_pending: 最大在途文件数，默认为进程数的 2 倍
+        
+    Returns:
+        统计信息 {"indexed", "removed", "unchanged", "failed", "chunks"}
     """
-    global vector_store
+    store = get_vector_store()
+    cache = get_chunk_cache()
+    stats = {"indexed": 0, "removed": 0, "unchanged": 0, "failed": 0, "chunks": 0}
+    tasks = []
+    hashes = {}
     
-    print("开始初始化知识库...")
+    for policy in policies:
+        if not policy.is_active or not policy.file_path or not os.path.exists(policy.file_path):
+            removed = store.remove_policy(policy.id)
+            if removed:
+                stats["removed"] += 1
+                print(f"已从知识库移除政策 {policy.id}, 块数: {removed}")
+            else:
+                stats["unchanged"] += 1
+            continue
+        
+        try:
+            content_hash = file_content_hash(policy.file_path)
+        except OSError as e:
+            stats["failed"] += 1
+            print(f"读取政策文件失败: {policy.file_path}, 错误: {e}")
+            continue
+        if not force and store.policy_hash(policy.id) == content_hash:
+            stats["unchanged"] += 1
+            continue
+        
+        # 相同内容的文件只解析和嵌入一次
+        metadata = policy_metadata(policy)
+        cached = cache.get(content_hash, metadata) if cache else None
+        if cached is not None:
+            chunks, vectors = cached
+            store.add_documents(chunks, vectors, policy_id=policy.id, content_hash=content_hash)
+            stats["indexed"] += 1
+            stats["chunks"] += len(chunks)
+            continue
+        
+        hashes[policy.id] = content_hash
+        tasks.append({"key": policy.id, "file_path": policy.file_path, "metadata": metadata, "dim": store.dim})
     
-    # 确保向量数据库目录存在
-    os.makedirs(settings.VECTOR_DB_PATH, exist_ok=True)
-    print(f"向量数据库目录已确认: {settings.VECTOR_DB_PATH}")
+    # 单个文件不值得启动进程池
+    if len(tasks) <= 1:
+        max_workers = 1
+    elif max_workers is None:
+        max_workers = settings.INGEST_WORKERS
     
-    # 检查是否设置了API密钥
-    if not settings.DEEPSEEK_API_KEY:
-        print("警告: 未设置有效的 DEEPSEEK_API_KEY，将使用假数据初始化知识库")
-        # 创建一个假的向量存储，用于开发测试
-        vector_store = MockVectorStore()
-        return
+    for result in run_pipeline(tasks, max_workers=max_workers, max_pending=max_pending):
+        if result["error"]:
+            stats["failed"] += 1
+            print(f"加载文档失败: {result['file_path']}, 错误: {result['error']}")
+            continue
+        
+        policy_id = result["key"]
+        chunks, vectors = result["documents"], result["vectors"]
+        if cache:
+            cache.put(hashes[policy_id], chunks, vectors)
+        store.add_documents(chunks, vectors, policy_id=policy_id, content_hash=hashes[policy_id])
+        stats["indexed"] += 1
+        stats["chunks"] += len(chunks)
+        print(f"已索引政策 {policy_id}: {result['file_path']}, 块数: {len(chunks)}")
     
+    return stats
+
+def index_policy(policy: Policy, force: bool = False) -> int:
+    """增量索引单个政策，返回本次写入索引的块数"""
+    stats = index_policies([policy], force=force)
+    if stats["failed"]:
+        raise RuntimeError(f"政策索引失败: {policy.file_path}")
+    return stats["chunks"]
+
+def remove_policy_from_index(policy_id: int) -> int:
+    """从知识库移除政策的所有块"""
+    return get_vector_store().remove_policy(policy_id)
+
+def sync_knowledge_base(db, max_workers: Optional[int] = None) -> Dict[str, int]:
+    """把知识库与 policies 表同步
+
+    逐个政策比较内容哈希，只处理新增、变更和停用的政策。
+    """
+    store = get_vector_store()
+    policies = db.query(Policy).all()
+    stats = index_policies(policies, max_workers=max_workers)
+    
+    # 数据库中已删除的政策
+    known_ids = {policy.id for policy in policies}
+    for policy_id in store.policy_ids():
+        if policy_id not in known_ids:
+            store.remove_policy(policy_id)
+            stats["removed"] += 1
+    
+    return stats
+
+def init_knowledge_base():
+    """初始化知识库
+    
+    加载所有政策文件，分块后写入本地向量索引
+    """
+    print("开始初始化知识库...")
+    store = get_vector_store()
+    
+    db = SessionLocal()
     try:
-        # 获取所有政策文件
-        db = SessionLocal()
+        # 首先检查policies表是否存在
         try:
-            # 首先检查policies表是否存在
-            try:
-                print("检查policies表是否存在...")
-                db.execute("SELECT 1 FROM policies LIMIT 1")
-                print("policies表存在，继续初始化知识库")
-            except Exception as e:
-                print(f"policies表不存在或无法访问: {e}")
-                print("将使用假数据初始化知识库")
-                vector_store = MockVectorStore()
-                return
-                
-            print("开始查询政策数据...")
-            policies = db.query(Policy).filter(Policy.is_active == True).all()
-            print(f"查询到 {len(policies)} 条政策数据")
-            
-            # 如果没有政策文件，加载示例政策
-            if len(policies) == 0:
-                print("没有找到政策文件，加载示例政策")
-                load_example_policies()
-                policies = db.query(Policy).filter(Policy.is_active == True).all()
-                print(f"加载示例政策后，共有 {len(policies)} 条政策数据")
-            
-            # 加载所有文档
-            documents = []
-            for policy in policies:
-                try:
-                    file_path = policy.file_path
-                    if not os.path.exists(file_path):
-                        print(f"文件不存在: {file_path}")
-                        continue
-                    
-                    # 根据文件类型选择加载器
-                    if file_path.endswith('.txt'):
-                        loader = TextLoader(file_path, encoding='utf-8')
-                    elif file_path.endswith('.pdf'):
-                        loader = PyPDFLoader(file_path)
-                    elif file_path.endswith('.docx'):
-                        loader = Docx2txtLoader(file_path)
-                    elif file_path.endswith('.csv'):
-                        loader = CSVLoader(file_path)
-                    elif file_path.endswith('.json'):
-                        loader = JSONLoader(
-                            file_path=file_path,
-                            jq_schema='.[]',
-                            text_content=False
-                        )
-                    else:
-                        print(f"不支持的文件类型: {file_path}")
-                        continue
-                    
-                    # 加载文档
-                    docs = loader.load()
-                    
-                    # 添加元数据
-                    for doc in docs:
-                        doc.metadata["title"] = policy.title
-                        doc.metadata["description"] = policy.description
-                        doc.metadata["category"] = policy.category
-                        doc.metadata["policy_id"] = policy.id
-                    
-                    documents.extend(docs)
-                    print(f"已加载文档: {file_path}, 文档数: {len(docs)}")
-                except Exception as e:
-                    print(f"加载文档失败: {file_path}, 错误: {e}")
-            
-            # 如果没有成功加载任何文档，使用假数据
-            if not documents:
-                print("未能加载任何文档，将使用假数据初始化知识库")
-                vector_store = MockVectorStore()
-                return
-                
-            print(f"共加载 {len(documents)} 个文档，开始文本分割...")
-            
-            # 文本分割
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                separators=["\n\n", "\n", "。", "，", ".", ",", " ", ""]
-            )
-            
-            chunks = text_splitter.split_documents(documents)
-            print(f"文档分块完成，共 {len(chunks)} 个块")
-            
-            # 创建向量数据库 (使用假的嵌入)
-            print("创建向量数据库...")
-            vector_store = MockVectorStore()
-            print("向量数据库创建完成")
-            
+            print("检查policies表是否存在...")
+            db.execute(text("SELECT 1 FROM policies LIMIT 1"))
+            print("policies表存在，继续初始化知识库")
         except Exception as e:
-            print(f"初始化知识库失败: {e}")
-            import traceback
-            traceback.print_exc()
-            # 使用假数据初始化知识库
-            print("将使用假数据初始化知识库")
-            vector_store = MockVectorStore()
-        finally:
-            db.close()
-            print("数据库连接已关闭")
+            print(f"policies表不存在或无法访问: {e}")
+            print("知识库将保持为空")
+            return
+        
+        # 如果没有政策文件，加载示例政策
+        if db.query(Policy).filter(Policy.is_active == True).count() == 0:
+            print("没有找到政策文件，加载示例政策")
+            load_example_policies()
+        
+        stats = sync_knowledge_base(db)
+        print(f"知识库同步完成: {stats}, 共 {len(store)} 个块")
+        
+        # 有变化时写入新快照，下次启动直接内存映射加载
+        save_knowledge_base()
     except Exception as e:
         print(f"初始化知识库失败: {e}")
         import traceback
         traceback.print_exc()
-        # 创建一个假的向量存储，用于开发测试
-        print("将使用假数据初始化知识库")
-        vector_store = MockVectorStore()
+    finally:
+        db.close()
+        print("数据库连接已关闭")
+
+def normalize_query(query: str) -> str:
+    """规范化查询文本，作为缓存键
+
+    全角转半角、统一小写、合并空白并去掉句末标点，
+    "年假有几天？" 和 "年假有几天" 命中同一条缓存。
+    """
+    query = unicodedata.normalize("NFKC", query).lower()
+    query = " ".join(query.split())
+    return query.rstrip("?？!！。.~～ ")
+
+def knowledge_base_version() -> int:
+    """当前知识库版本，任何增量索引都会使其递增"""
+    return vector_store.version if vector_store is not None else -1
 
 def query_knowledge_base(query: str, top_k: int = 5) -> List[Document]:
     """查询知识库
     
-    根据查询文本返回相关文档
+    根据查询文本返回相关文档。结果按 (规范化查询, top_k, 知识库版本) 缓存，
+    知识库重新索引后版本变化，旧结果不会再被命中。
     
     Args:
         query: 查询文本
         top_k: 返回的文档数量
         
     Returns:
-        相关文档列表
+        相关文档列表，按融合后的相关度降序
     """
-    # 使用模拟数据代替向量检索
     print(f"查询知识库: {query}")
     
-    # 返回模拟文档
-    mock_docs = [
-        Document(
-            page_content="公司请假制度规定：年假每年最多15天，病假需要医院证明，事假不带薪。",
-            metadata={"title": "请假政策", "source": "mock"}
-        ),
-        Document(
-            page_content="加班调休规定：加班1天可调休1天，需在3个月内使用完毕。",
-            metadata={"title": "加班调休", "source": "mock"}
-        ),
-        Document(
-            page_content="婚假规定：员工结婚可享受3天带薪婚假，需提供结婚证明。",
-            metadata={"title": "婚假政策", "source": "mock"}
-        ),
-        Document(
-            page_content="产假规定：女员工生育可享受98天产假，难产可增加15天。",
-            metadata={"title": "产假政策", "source": "mock"}
-        ),
-        Document(
-            page_content="丧假规定：直系亲属去世可享受3天带薪丧假。",
-            metadata={"title": "丧假政策", "source": "mock"}
-        )
-    ]
+    if vector_store is None or len(vector_store) == 0:
+        print("知识库为空")
+        return []
+    
+    key = (normalize_query(query), top_k, knowledge_base_version())
+    cached = retrieval_cache.get(key)
+    if cached is not None:
+        return list(cached)
     
-    return mock_docs[:min(top_k, len(mock_docs))]
+    # 向量检索与 BM25 关键词检索融合，"调休"、"婚假" 等术语能精确命中
+    docs = [doc for doc, _ in vector_store.hybrid_search(query, top_k)]
+    retrieval_cache.set(key, docs)
+    return list(docs)
 
 def get_qa_response(query: str) -> Dict:
     """获取问答响应
     
-    使用DeepSeek API回答问题
+    使用DeepSeek API回答问题，相同问题在缓存有效期内直接返回上次的回答
     
     Args:
         query: 问题文本
@@ -202,14 +286,128 @@ def get_qa_response(query: str) -> Dict:
     Returns:
         回答结果
     """
-    # 使用模拟数据代替API调用
     print(f"问答查询: {query}")
     
-    # 返回模拟回答
-    return {
+    key = (normalize_query(query), knowledge_base_version())
+    cached = answer_cache.get(key)
+    if cached is not None:
+        return dict(cached)
+    
+    # 使用模拟数据代替API调用
+    response = {
         "result": "这是一个模拟的回答，实际开发中应该调用DeepSeek API。",
         "source_documents": query_knowledge_base(query)
     }
+    answer_cache.set(key, response)
+    return dict(response)
+
+def build_qa_messages(
+    query: str,
+    docs: List[Document],
+    history: Optional[List[Tuple[str, str]]] = None
+) -> List[Dict[str, str]]:
+    """根据检索到的政策片段和最近几轮对话构造大模型对话消息"""
+    context = "\n\n".join(
+        f"【{doc.metadata.get('title', '政策')}】\n{doc.page_content}" for doc in docs
+    )
+    messages = [
+        {
+            "role": "system",
+            "content": "你是公司的请假助手。请只根据提供的公司政策片段回答员工的问题，"
+                       "政策中没有的内容请如实说明，回答简洁明了。"
+        }
+    ]
+    for message, response in history or []:
+        messages.append({"role": "user", "content": message})
+        messages.append({"role": "assistant", "content": response})
+    messages.append({"role": "user", "content": f"公司政策片段：\n{context}\n\n问题：{query}"})
+    return messages
+
+async def aget_qa_response(query: str, history: Optional[List[Tuple[str, str]]] = None) -> Dict:
+    """获取问答响应（异步）
+    
+    配置了大模型接口时通过共享网关调用，否则退回模拟回答
+    
+    Args:
+        query: 问题文本
+        history: 最近几轮对话 [(问题, 回答), ...]，按时间正序
+        
+    Returns:
+        回答结果
+    """
+    if not is_llm_configured():
+        return await run_in_threadpool(get_qa_response, query)
+    
+    print(f"问答查询: {query}")
+    # 带对话上下文的回答依赖上下文，只缓存没有上下文的回答
+    key = (normalize_query(query), knowledge_base_version())
+    if not history:
+        cached = answer_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+    
+    docs = await run_in_threadpool(query_knowledge_base, query)
+    result = await get_llm_gateway().chat(build_qa_messages(query, docs, history))
+    response = {"result": result, "source_documents": docs}
+    if not history:
+        answer_cache.set(key, response)
+    return dict(response)
+
+def serialize_source(doc: Document) -> Dict[str, Any]:
+    """把来源文档转换为可 JSON 序列化的字典"""
+    return {
+        "title": doc.metadata.get("title"),
+        "category": doc.metadata.get("category"),
+        "policy_id": doc.metadata.get("policy_id"),
+        "content": doc.page_content
+    }
+
+async def fake_token_stream(text: str, chunk_size: int = 2, delay: float = 0.0) -> AsyncIterator[str]:
+    """把完整回答切成小片段逐个产出，模拟大模型的流式输出"""
+    for i in range(0, len(text), chunk_size):
+        if delay:
+            await asyncio.sleep(delay)
+        yield text[i:i + chunk_size]
+
+async def stream_qa_response(
+    query: str,
+    history: Optional[List[Tuple[str, str]]] = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """流式问答
+
+    依次产出 (事件名, 数据)：
+    - ("sources", [...])  检索到的来源文档，检索完成后立即发送
+    - ("token", "...")    回答片段
+    - ("done", {...})     完整回答
+    """
+    print(f"流式问答查询: {query}")
+    
+    # 检索是 CPU 密集的矩阵运算，放到线程池里避免阻塞事件循环
+    docs = await run_in_threadpool(query_knowledge_base, query)
+    yield "sources", [serialize_source(doc) for doc in docs]
+    
+    if is_llm_configured():
+        tokens = get_llm_gateway().stream_chat(build_qa_messages(query, docs, history))
+    else:
+        # 使用模拟数据代替API调用
+        tokens = fake_token_stream("这是一个模拟的回答，实际开发中应该调用DeepSeek API。")
+    
+    parts = []
+    async for token in tokens:
+        parts.append(token)
+        yield "token", token
+    
+    yield "done", {"result": "".join(parts)}
+
+def get_cache_stats() -> Dict[str, Any]:
+    """知识库和查询缓存的统计信息"""
+    return {
+        "version": knowledge_base_version(),
+        "chunks": len(vector_store) if vector_store is not None else 0,
+        "retrieval_cache": retrieval_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "llm_gateway": get_llm_gateway().stats if is_llm_configured() else None
+    }
 
 def load_example_policies():
     """加载示例政策文件
@@ -377,21 +575,3 @@ def load_example_policies():
         print(f"创建示例政策失败: {e}")
     finally:
         db.close()
-
-class MockVectorStore:
-    """模拟向量存储类，用于开发测试"""
-    
-    def as_retriever(self, **kwargs):
-        """返回一个模拟检索器"""
-        return MockRetriever()
-    
-    def similarity_search(self, query, k=4):
-        """模拟相似度搜索"""
-        return query_knowledge_base(query, k)
-
-class MockRetriever:
-    """模拟检索器类，用于开发测试"""
-    
-    def get_relevant_documents(self, query):
-        """模拟获取相关文档"""
-        return query_knowledge_base(query) 
\ No newline at end of file
@@ -1,45 +1,76 @@
 import json
-from typing import Dict, Optional
-from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+from sqlalchemy import and_, update
 from sqlalchemy.orm import Session
 
-from app.database import User, AnnualLeave, LeaveRequest, LeaveType
+from app.config import settings
+from app.database import User, AnnualLeave, LeaveRequest
+from app.services.leave_catalog import leave_type_catalog
+from app.services.leave_balance import (
+    ANNUAL_LEAVE_TYPE, apply_status_change, apply_status_changes, load_available_days
+)
+from app.services.leave_intervals import ACTIVE_STATUSES, leave_interval_index, record_change
+from app.services.auth import serialize_profile
+from app.services.team_coverage import department_coverage, find_off_peak_window
+from app.services.workday_calendar import get_workday_calendar
 
 class LeaveRecommender:
     """请假推荐服务"""
     
+    # 批量查询时每条 IN 语句最多包含的用户数
+    BATCH_QUERY_SIZE = 500
+    
+    # 允许的请假状态变更：待审批可批准、驳回或取消，已批准只能取消
+    STATUS_TRANSITIONS = {
+        "pending": {"approved", "rejected", "cancelled"},
+        "approved": {"cancelled"}
+    }
+    
     def __init__(self):
         """初始化请假推荐服务"""
         print("初始化请假推荐服务")
     # -> Dict 是 Python 3 的类型注解（Type Hint）语法 表示这个函数的返回值类型是 Dict（字典） 为了让代码更易读,不会影响代码运行
-    def get_employee_info(self, db: Session, user_id: int) -> Dict:
-        """获取员工信息"""
-        # 查询用户信息
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            return {"error": "用户不存在"}
-        
-        # 查询年假信息
+    def get_employee_info(self, db: Session, user_id: int, profile: Optional[Dict] = None) -> Dict:
+        """获取员工信息，传入缓存的员工资料时不再查询 User"""
         current_year = datetime.now().year
-        annual_leave = db.query(AnnualLeave).filter(
-            AnnualLeave.user_id == user_id,
-            AnnualLeave.year == current_year
-        ).first()
+        if profile is not None:
+            annual_leave = db.query(AnnualLeave).filter(
+                AnnualLeave.user_id == user_id, AnnualLeave.year == current_year
+            ).first()
+        else:
+            # 查询用户信息和当年年假（一次左连接查询）
+            row = db.query(User, AnnualLeave).outerjoin(
+                AnnualLeave,
+                and_(AnnualLeave.user_id == User.id, AnnualLeave.year == current_year)
+            ).filter(User.id == user_id).first()
+            if not row:
+                return {"error": "用户不存在"}
+            user, annual_leave = row
+            profile = serialize_profile(user)
         
-        # 查询请假记录
+        # 查询请假记录，请假类型名称从进程内目录解析，避免每条记录再查一次 LeaveType
         leave_requests = db.query(LeaveRequest).filter(
             LeaveRequest.user_id == user_id,
             LeaveRequest.status.in_(["pending", "approved"])
         ).all()
         
-        # 构建员工信息
+        return self._build_employee_info(profile, annual_leave, leave_requests)
+    
+    def _build_employee_info(
+        self,
+        profile: Dict,
+        annual_leave: Optional[AnnualLeave],
+        leave_requests: List[LeaveRequest]
+    ) -> Dict:
+        """由员工资料和已查询出的年假、请假记录构建员工信息"""
         employee_info = {
-            "id": user.id,
-            "name": user.full_name,
-            "department": user.department,
-            "position": user.position,
-            "hire_date": user.hire_date.strftime("%Y-%m-%d") if user.hire_date else None,
-            "employee_id": user.employee_id,
+            "id": profile["id"],
+            "name": profile["full_name"],
+            "department": profile["department"],
+            "position": profile["position"],
+            "hire_date": profile["hire_date"],
+            "employee_id": profile["employee_id"],
             "annual_leave": {
                 "total_days": annual_leave.total_days if annual_leave else 0,  #py的三元表达式
                 "used_days": annual_leave.used_days if annual_leave else 0,
@@ -50,13 +81,13 @@ class LeaveRecommender:
             # for req in leave_requests:
             #     leave_history.append({
             #         "id": req.id,
-            #         "leave_type": db.query(LeaveType).get(req.leave_type_id).name,
+            #         "leave_type": leave_type_catalog.name_of(req.leave_type_id),
             #         "start_date": req.start_date.strftime("%Y-%m-%d"),
             #         "end_date": req.end_date.strftime("%Y-%m-%d"),
             "leave_history": [
                 {
                     "id": req.id,
-                    "leave_type": db.query(LeaveType).get(req.leave_type_id).name,
+                    "leave_type": leave_type_catalog.name_of(req.leave_type_id),
                     "start_date": req.start_date.strftime("%Y-%m-%d"),
                     "end_date": req.end_date.strftime("%Y-%m-%d"),
                     "days": req.days,
@@ -69,24 +100,31 @@ class LeaveRecommender:
         return employee_info
     
     def calculate_leave_days(self, start_date: str, end_date: str) -> float:
-        """计算请假天数"""
+        """计算请假天数（工作日数，扣除法定节假日并计入调休上班日）"""
         # 解析日期
         start = datetime.strptime(start_date, "%Y-%m-%d")
         end = datetime.strptime(end_date, "%Y-%m-%d")
         
-        # 计算天数差
-        delta = end - start
-        days = delta.days + 1  # 包含首尾两天
-        
-        # 计算工作日
-        work_days = 0
-        for i in range(days):
-            day = start + timedelta(days=i)
-            # 如果不是周末（5是周六，6是周日）
-            if day.weekday() < 5:
-                work_days += 1
-        
-        return work_days
+        return get_workday_calendar().count(start, end)
+    
+    def check_date_range(self, start_date: str, end_date: str) -> Optional[str]:
+        """校验请假日期区间，返回错误信息，合法时返回 None"""
+        try:
+            start = datetime.strptime(start_date, "%Y-%m-%d")
+            end = datetime.strptime(end_date, "%Y-%m-%d")
+        except (TypeError, ValueError):
+            return "日期格式应为 YYYY-MM-DD"
+        if end < start:
+            return "结束日期不能早于开始日期"
+        if (end - start).days + 1 > settings.LEAVE_COVERAGE_MAX_DAYS:
+            return f"单次请假最多 {settings.LEAVE_COVERAGE_MAX_DAYS} 天"
+        return None
+    
+    def calculate_leave_days_batch(self, ranges: List[Tuple[str, str]]) -> List[int]:
+        """批量计算请假天数，ranges 为 (开始日期, 结束日期) 列表"""
+        starts = [datetime.strptime(start, "%Y-%m-%d") for start, _ in ranges]
+        ends = [datetime.strptime(end, "%Y-%m-%d") for _, end in ranges]
+        return get_workday_calendar().count_batch(starts, ends).tolist()
     
     def generate_leave_recommendations(
         self, 
@@ -94,30 +132,54 @@ class LeaveRecommender:
         user_id: int, 
         start_date: str,
         end_date: str,
-        reason: str
+        reason: str,
+        profile: Optional[Dict] = None
     ) -> Dict:
-        """生成请假推荐方案"""
+        """生成请假推荐方案，profile 为缓存的员工资料（可选）"""
         # 获取员工信息
-        employee_info = self.get_employee_info(db, user_id)
+        employee_info = self.get_employee_info(db, user_id, profile)
         if "error" in employee_info:
             return {"error": employee_info["error"]}
         
         # 计算请假天数
         days = self.calculate_leave_days(start_date, end_date)
         
-        # 获取所有请假类型
-        leave_types = db.query(LeaveType).all()
+        # 年假可用额度：按台账唯一索引读一行
+        key = self._annual_balance_key(user_id, start_date)
+        annual_available = load_available_days(db, [key])[key] if key else None
         
+        return self._build_recommendations(employee_info, start_date, end_date, days, reason, annual_available)
+    
+    def _annual_balance_key(self, user_id: int, start_date: str) -> Optional[Tuple[int, int, int]]:
+        """年假台账键，请假计入开始日期所在年份"""
+        annual_type = leave_type_catalog.get_by_name(ANNUAL_LEAVE_TYPE)
+        if annual_type is None:
+            return None
+        return user_id, annual_type["id"], int(start_date[:4])
+    
+    def _build_recommendations(
+        self,
+        employee_info: Dict,
+        start_date: str,
+        end_date: str,
+        days: float,
+        reason: str,
+        annual_available: Optional[float]
+    ) -> Dict:
+        """根据员工信息、请假天数和年假可用额度生成推荐方案
+
+        部门人员覆盖情况来自内存中的部门缺勤矩阵，不访问数据库。
+        """
         # 生成简单的推荐方案
         recommendations = []
         
-        # 年假推荐
-        annual_leave = employee_info.get("annual_leave")
-        if annual_leave and annual_leave.get("remaining_days", 0) >= days:
+        # 年假推荐：可用额度已扣除已批准和待审批的年假
+        if annual_available is not None and annual_available >= days:
             recommendations.append({
                 "plan_name": "年假方案",
                 "leave_type": "年假",
                 "days": days,
+                "available_days": annual_available,
                 "is_compliant": True,
                 "impact": "带薪休假，不影响绩效",
                 "pros": ["带薪休假", "不影响绩效评估"],
@@ -149,8 +211,44 @@ class LeaveRecommender:
             "recommendation_level": "中"
         })
         
+        # 部门人员覆盖：按原定日期的方案都相同
+        department = employee_info.get("department")
+        coverage = department_coverage(department, start_date, end_date)
+        for plan in recommendations:
+            plan["start_date"] = start_date
+            plan["end_date"] = end_date
+            plan["coverage"] = coverage
+        
+        # 前后几周内有部门请假人数更少的同长度区间时，追加错峰方案（沿用首选方案的请假类型）
+        off_peak = find_off_peak_window(department, start_date, end_date, settings.LEAVE_OFF_PEAK_SHIFT_WEEKS)
+        if off_peak:
+            shifted_start, shifted_end, shifted_coverage = off_peak
+            shifted_days = get_workday_calendar().count(shifted_start, shifted_end)
+            base = recommendations[0]
+            if base["leave_type"] == ANNUAL_LEAVE_TYPE and shifted_days > annual_available:
+                base = recommendations[1]
+            recommendations.append({
+                **base,
+                "plan_name": f"错峰{base['plan_name']}",
+                "start_date": shifted_start.strftime("%Y-%m-%d"),
+                "end_date": shifted_end.strftime("%Y-%m-%d"),
+                "days": shifted_days,
+                "coverage": shifted_coverage,
+                "pros": base["pros"] + [f"部门同期请假人数更少（最多 {shifted_coverage['peak_absent']} 人）"],
+                "cons": base["cons"] + ["需要调整请假日期"]
+            })
+        
+        # 按对部门人员覆盖的影响排序，影响相同时保持原有顺序
+        recommendations.sort(key=lambda plan: plan["coverage"]["peak_absent"])
+        
+        # 补充请假类型 id，前端可直接用于提交申请
+        for plan in recommendations:
+            leave_type = leave_type_catalog.get_by_name(plan["leave_type"])
+            plan["leave_type_id"] = leave_type["id"] if leave_type else None
+        
         return {
             "recommendations": recommendations,
+            "team_coverage": coverage,
             "employee_info": employee_info,
             "leave_request": {
                 "start_date": start_date,
@@ -160,6 +258,82 @@ class LeaveRecommender:
             }
         }
 
+    def generate_batch_recommendations(self, db: Session, items: List[Dict]) -> List[Dict]:
+        """批量生成请假推荐方案
+
+        items 为 [{"user_id", "start_date", "end_date", "reason"}, ...]。
+        无论条目多少，用户+年假一次左连接查询、请假记录一次 IN 查询，
+        工作日数一次向量化计算，返回与 items 一一对应的结果；
+        单个条目出错（用户不存在、参数错误、生成推荐失败）只影响该条目。
+        """
+        results: List[Optional[Dict]] = [None] * len(items)
+        
+        # 先校验参数，格式错误的条目不参与后续计算
+        ranges = []
+        valid = []
+        for i, item in enumerate(items):
+            try:
+                int(item["user_id"])
+                error = self.check_date_range(item["start_date"], item["end_date"])
+            except (KeyError, TypeError, ValueError) as e:
+                error = str(e)
+            if error:
+                results[i] = {"error": f"参数错误: {error}"}
+                continue
+            ranges.append((item["start_date"], item["end_date"]))
+            valid.append(i)
+        days_list = self.calculate_leave_days_batch(ranges) if ranges else []
+        
+        # 预加载所有涉及的用户、当年年假和请假记录
+        user_ids = sorted({int(items[i]["user_id"]) for i in valid})
+        users: Dict[int, Tuple[User, Optional[AnnualLeave]]] = {}
+        histories: Dict[int, List[LeaveRequest]] = {}
+        current_year = datetime.now().year
+        # 分段执行 IN 查询，避免超出数据库的参数个数上限
+        for offset in range(0, len(user_ids), self.BATCH_QUERY_SIZE):
+            chunk = user_ids[offset:offset + self.BATCH_QUERY_SIZE]
+            rows = db.query(User, AnnualLeave).outerjoin(
+                AnnualLeave,
+                and_(AnnualLeave.user_id == User.id, AnnualLeave.year == current_year)
+            ).filter(User.id.in_(chunk)).all()
+            for user, annual_leave in rows:
+                users[user.id] = (user, annual_leave)
+            leave_requests = db.query(LeaveRequest).filter(
+                LeaveRequest.user_id.in_(chunk),
+                LeaveRequest.status.in_(["pending", "approved"])
+            ).all()
+            for req in leave_requests:
+                histories.setdefault(req.user_id, []).append(req)
+        
+        # 年假可用额度：一次 IN 查询读台账
+        annual_keys = {
+            i: self._annual_balance_key(int(items[i]["user_id"]), items[i]["start_date"]) for i in valid
+        }
+        annual_available = load_available_days(db, [key for key in annual_keys.values() if key])
+        
+        # 同一员工出现在多个条目里时只构建一次员工信息
+        employee_infos: Dict[int, Dict] = {}
+        for i, days in zip(valid, days_list):
+            item = items[i]
+            user_id = int(item["user_id"])
+            if user_id not in users:
+                results[i] = {"error": "用户不存在"}
+                continue
+            if user_id not in employee_infos:
+                user, annual_leave = users[user_id]
+                employee_infos[user_id] = self._build_employee_info(
+                    serialize_profile(user), annual_leave, histories.get(user_id, [])
+                )
+            try:
+                results[i] = self._build_recommendations(
+                    employee_infos[user_id], item["start_date"], item["end_date"], days, item.get("reason", ""),
+                    annual_available.get(annual_keys[i])
+                )
+            except Exception as e:
+                results[i] = {"error": f"生成推荐失败: {str(e)}"}
+        
+        return results
+    
     def submit_leave_request(
         self,
         db: Session,
@@ -171,10 +345,37 @@ class LeaveRecommender:
         ai_recommendation: Optional[str] = None
     ) -> Dict:
         """提交请假申请"""
+        # 结束早于开始的区间在重叠检查中相当于空区间，必须在检查之前拒绝
+        error = self.check_date_range(start_date, end_date)
+        if error:
+            return {"status": "error", "code": "invalid", "message": error}
         try:
             # 计算请假天数
             days = self.calculate_leave_days(start_date, end_date)
             
+            # 与本人待审批或已批准的请假时间重叠时拒绝：先查进程内索引，多数冲突在这里直接返回
+            conflicts = leave_interval_index.user_conflicts(user_id, start_date, end_date)
+            if conflicts:
+                return self._conflict_result(conflicts)
+            
+            # 索引可能还没看到其他进程刚提交的请假，也不包含 lookback 之前的请假：
+            # 锁住员工行，使同一员工的并发提交串行执行，再在同一事务中查库确认没有重叠
+            db.query(User.id).filter(User.id == user_id).with_for_update().first()
+            overlapping = self._overlapping_requests(db, user_id, start_date, end_date)
+            if db.query(overlapping.exists()).scalar():
+                conflicts = [
+                    {
+                        "id": req.id,
+                        "user_id": user_id,
+                        "start_date": req.start_date.strftime("%Y-%m-%d"),
+                        "end_date": req.end_date.strftime("%Y-%m-%d"),
+                        "status": req.status
+                    }
+                    for req in overlapping.all()
+                ]
+                db.rollback()
+                return self._conflict_result(conflicts)
+            
             # 创建请假申请
             # 你可以在 LeaveRequest 类的定义里看到类似 __tablename__ = "leave_requests"，这就指定了表名。
             # 只要是 LeaveRequest 创建的对象，db.add() 后 db.commit()，就会写入 leave_requests 表。
@@ -190,6 +391,9 @@ class LeaveRecommender:
             )
             
             db.add(leave_request)
+            db.flush()
+            # 在同一事务中把天数计入额度台账的待审批部分
+            apply_status_change(db, leave_request, None, leave_request.status)
             db.commit()
             db.refresh(leave_request)
             
@@ -211,4 +415,157 @@ class LeaveRecommender:
         # 异常处理，用于捕获和处理在数据库操作过程中可能发生的错误
         except Exception as e:
             db.rollback()
-            return {"status": "error", "message": f"请假申请提交失败: {str(e)}"} 
\ No newline at end of file
+            return {"status": "error", "message": f"请假申请提交失败: {str(e)}"} 
+    
+    def _overlapping_requests(self, db: Session, user_id: int, start_date: str, end_date: str):
+        """员工与 [start_date, end_date] 重叠的待审批/已批准请假（走 user_id + status + start_date 索引）"""
+        start = datetime.strptime(start_date, "%Y-%m-%d")
+        end = datetime.strptime(end_date, "%Y-%m-%d")
+        return db.query(
+            LeaveRequest.id, LeaveRequest.start_date, LeaveRequest.end_date, LeaveRequest.status
+        ).filter(
+            LeaveRequest.user_id == user_id,
+            LeaveRequest.status.in_(ACTIVE_STATUSES),
+            LeaveRequest.start_date <= end,
+            LeaveRequest.end_date >= start
+        )
+    
+    def _conflict_result(self, conflicts: List[Dict]) -> Dict:
+        periods = "、".join(f"{c['start_date']} 至 {c['end_date']}" for c in conflicts)
+        return {
+            "status": "error",
+            "code": "conflict",
+            "message": f"请假时间与已有的请假重叠: {periods}",
+            "conflicts": conflicts
+        }
+    
+    def change_leave_status(
+        self,
+        db: Session,
+        leave_request_id: int,
+        new_status: str,
+        approver_id: Optional[int] = None,
+        owner_id: Optional[int] = None
+    ) -> Dict:
+        """修改请假申请状态（审批、驳回、取消），额度台账在同一事务中更新
+
+        指定 owner_id 时只能修改该员工本人的申请。
+        """
+        try:
+            leave_request = db.query(LeaveRequest).filter(
+                LeaveRequest.id == leave_request_id
+            ).with_for_update().first()
+            if leave_request is None:
+                return {"status": "error", "code": "not_found", "message": "请假申请不存在"}
+            if owner_id is not None and leave_request.user_id != owner_id:
+                return {"status": "error", "code": "forbidden", "message": "无权修改其他员工的请假申请"}
+            
+            old_status = leave_request.status
+            if new_status not in self.STATUS_TRANSITIONS.get(old_status, set()):
+                return {"status": "error", "code": "conflict", "message": f"不能从 {old_status} 变更为 {new_status}"}
+            
+            leave_request.status = new_status
+            if new_status in ("approved", "rejected"):
+                leave_request.approver_id = approver_id
+                leave_request.approved_at = datetime.utcnow()
+            apply_status_change(db, leave_request, old_status, new_status)
+            db.commit()
+            
+            return {
+                "status": "success",
+                "message": "请假申请状态已更新",
+                "leave_request": {
+                    "id": leave_request.id,
+                    "user_id": leave_request.user_id,
+                    "leave_type_id": leave_request.leave_type_id,
+                    "days": leave_request.days,
+                    "old_status": old_status,
+                    "status": leave_request.status
+                }
+            }
+        except Exception as e:
+            db.rollback()
+            return {"status": "error", "message": f"请假申请状态更新失败: {str(e)}"}
+    
+    def change_leave_status_bulk(
+        self,
+        db: Session,
+        leave_request_ids: List[int],
+        new_status: str,
+        approver_id: Optional[int] = None,
+        owner_id: Optional[int] = None
+    ) -> Dict:
+        """批量修改请假申请状态，在一个事务中完成
+
+        SELECT ... FOR UPDATE SKIP LOCKED 锁定可以处理的申请，正被其他事务处理的申请直接跳过；
+        允许变更的申请用一条 UPDATE ... WHERE id IN (...) 修改，额度台账按汇总结果更新，最后只提交一次。
+        不存在、被锁定、状态不允许变更或不属于 owner_id（指定时）的申请放在 skipped 中返回，不影响其他申请。
+        """
+        ids = sorted(set(leave_request_ids))
+        try:
+            rows = []
+            for offset in range(0, len(ids), self.BATCH_QUERY_SIZE):
+                chunk = ids[offset:offset + self.BATCH_QUERY_SIZE]
+                rows.extend(db.query(
+                    LeaveRequest.id, LeaveRequest.user_id, LeaveRequest.leave_type_id,
+                    LeaveRequest.start_date, LeaveRequest.end_date, LeaveRequest.days, LeaveRequest.status
+                ).filter(LeaveRequest.id.in_(chunk)).order_by(LeaveRequest.id).with_for_update(skip_locked=True).all())
+            
+            # 没有锁到的申请再查一次是否存在，区分"不存在"和"正在被处理"
+            skipped = []
+            found = {row.id for row in rows}
+            missing = [i for i in ids if i not in found]
+            existing = set()
+            for offset in range(0, len(missing), self.BATCH_QUERY_SIZE):
+                chunk = missing[offset:offset + self.BATCH_QUERY_SIZE]
+                existing.update(i for (i,) in db.query(LeaveRequest.id).filter(LeaveRequest.id.in_(chunk)))
+            for i in missing:
+                skipped.append({"id": i, "message": "请假申请正在被处理" if i in existing else "请假申请不存在"})
+            
+            eligible = []
+            for row in rows:
+                if owner_id is not None and row.user_id != owner_id:
+                    skipped.append({"id": row.id, "message": "无权修改其他员工的请假申请"})
+                elif new_status in self.STATUS_TRANSITIONS.get(row.status, set()):
+                    eligible.append(row)
+                else:
+                    skipped.append({"id": row.id, "message": f"不能从 {row.status} 变更为 {new_status}"})
+            
+            if eligible:
+                now = datetime.utcnow()
+                values = {"status": new_status, "updated_at": now}
+                if new_status in ("approved", "rejected"):
+                    values.update(approver_id=approver_id, approved_at=now)
+                eligible_ids = [row.id for row in eligible]
+                for offset in range(0, len(eligible_ids), self.BATCH_QUERY_SIZE):
+                    db.execute(
+                        update(LeaveRequest)
+                        .where(LeaveRequest.id.in_(eligible_ids[offset:offset + self.BATCH_QUERY_SIZE]))
+                        .values(**values)
+                        .execution_options(synchronize_session=False)
+                    )
+                apply_status_changes(db, [(row, row.status, new_status) for row in eligible])
+                # 批量 UPDATE 不经过 ORM 对象，显式登记到区间索引，提交后生效
+                for row in eligible:
+                    record_change(db, row.id, row.user_id, row.start_date, row.end_date, new_status)
+            db.commit()
+            
+            return {
+                "status": "success",
+                "message": f"已更新 {len(eligible)} 条请假申请",
+                "updated": [
+                    {
+                        "id": row.id,
+                        "user_id": row.user_id,
+                        "leave_type_id": row.leave_type_id,
+                        "days": row.days,
+                        "old_status": row.status,
+                        "status": new_status
+                    }
+                    for row in eligible
+                ],
+                "skipped": sorted(skipped, key=lambda item: item["id"])
+            }
+        except Exception as e:
+            db.rollback()
+            return {"status": "error", "message": f"请假申请状态批量更新失败: {str(e)}"}
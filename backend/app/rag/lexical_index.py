@@ -0,0 +1,191 @@
+import json
+import os
+import re
+from collections import Counter
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+# 中文字符（基本区 + 扩展A区）连续片段，或英文/数字词
+_TOKEN_PATTERN = re.compile(r"[㐀-䶿一-鿿]+|[a-zA-Z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """中文按单字和相邻二元组切分，英文/数字按词切分
+
+    中文没有空格分词，字符 n-gram 不依赖词典，
+    "调休"、"婚假" 这类两字术语会完整地成为一个二元组。
+    """
+    tokens = []
+    for segment in _TOKEN_PATTERN.findall(text.lower()):
+        if segment.isascii():
+            tokens.append(segment)
+            continue
+        tokens.extend(segment)
+        tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+    return tokens
+
+
+class BM25Index:
+    """基于倒排表的 BM25 索引
+
+    行号与向量索引的行号一一对应。每个词的倒排表是两个 numpy 数组
+    （行号、词频），新增的行先记在待合并列表里，查询到该词时才合并，
+    所以写入是 O(块长度)，单词查询只触及该词的倒排表。
+    失效行由调用方通过 alive 掩码在查询时过滤。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._rows: Dict[str, np.ndarray] = {}
+        self._tfs: Dict[str, np.ndarray] = {}
+        self._pending: Dict[str, List[Tuple[int, int]]] = {}
+        self._doc_lengths = np.zeros(0, dtype=np.float32)
+        self._doc_count = 0
+        self._total_length = 0.0
+
+    def _ensure_length(self, size: int) -> None:
+        """确保文档长度数组至少有 size 行"""
+        if size <= len(self._doc_lengths):
+            return
+        capacity = max(len(self._doc_lengths), 1024)
+        while capacity < size:
+            capacity *= 2
+        lengths = np.zeros(capacity, dtype=np.float32)
+        lengths[:len(self._doc_lengths)] = self._doc_lengths
+        self._doc_lengths = lengths
+
+    def add(self, start_row: int, texts: List[str]) -> None:
+        """添加从 start_row 开始的连续若干行"""
+        self._ensure_length(start_row + len(texts))
+        for offset, text in enumerate(texts):
+            row = start_row + offset
+            counts = Counter(tokenize(text))
+            length = sum(counts.values())
+            self._doc_lengths[row] = length
+            self._doc_count += 1
+            self._total_length += length
+            for term, tf in counts.items():
+                self._pending.setdefault(term, []).append((row, tf))
+
+    def remove(self, rows: List[int]) -> None:
+        """把行从统计中扣除（倒排表中的条目由 alive 掩码过滤）"""
+        if not rows:
+            return
+        self._doc_count -= len(rows)
+        self._total_length -= float(self._doc_lengths[rows].sum())
+        self._doc_lengths[rows] = 0
+
+    def _postings(self, term: str) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """返回词的倒排表，必要时先合并待写入条目"""
+        pending = self._pending.pop(term, None)
+        if pending:
+            rows = np.fromiter((row for row, _ in pending), dtype=np.int64, count=len(pending))
+            tfs = np.fromiter((tf for _, tf in pending), dtype=np.float32, count=len(pending))
+            if term in self._rows:
+                rows = np.concatenate([self._rows[term], rows])
+                tfs = np.concatenate([self._tfs[term], tfs])
+            self._rows[term] = rows
+            self._tfs[term] = tfs
+        return self._rows.get(term), self._tfs.get(term)
+
+    def search(self, query: str, k: int, alive: np.ndarray) -> List[Tuple[int, float]]:
+        """BM25 检索，返回 (行号, 分数) 列表，按分数降序"""
+        if self._doc_count <= 0 or k <= 0:
+            return []
+        avg_length = self._total_length / self._doc_count if self._doc_count else 1.0
+        all_rows = []
+        all_scores = []
+        for term in set(tokenize(query)):
+            rows, tfs = self._postings(term)
+            if rows is None:
+                continue
+            live = alive[rows]
+            rows, tfs = rows[live], tfs[live]
+            if len(rows) == 0:
+                continue
+            df = len(rows)
+            idf = np.log(1.0 + (self._doc_count - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self._doc_lengths[rows] / avg_length)
+            all_rows.append(rows)
+            all_scores.append(idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+        if not all_rows:
+            return []
+
+        rows = np.concatenate(all_rows)
+        scores = np.concatenate(all_scores)
+        unique_rows, inverse = np.unique(rows, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores)
+        k = min(k, len(unique_rows))
+        top = np.argpartition(-totals, k - 1)[:k] if k < len(unique_rows) else np.arange(len(unique_rows))
+        top = top[np.argsort(-totals[top])]
+        return [(int(unique_rows[i]), float(totals[i])) for i in top]
+
+    def remap(self, mapping: np.ndarray, size: int) -> None:
+        """按 mapping（旧行号 -> 新行号，-1 表示丢弃）重排行号"""
+        for term in list(self._pending.keys()):
+            self._postings(term)
+        for term in list(self._rows.keys()):
+            new_rows = mapping[self._rows[term]]
+            keep = new_rows >= 0
+            if not keep.any():
+                del self._rows[term]
+                del self._tfs[term]
+                continue
+            self._rows[term] = new_rows[keep]
+            self._tfs[term] = self._tfs[term][keep]
+        lengths = np.zeros(max(size, 1), dtype=np.float32)
+        old_rows = np.flatnonzero(mapping >= 0)
+        lengths[mapping[old_rows]] = self._doc_lengths[old_rows]
+        self._doc_lengths = lengths
+
+    def save(self, directory: str, mapping: np.ndarray, size: int) -> None:
+        """保存为可内存映射的文件，行号按 mapping 重排"""
+        for term in list(self._pending.keys()):
+            self._postings(term)
+        terms = []
+        row_parts = []
+        tf_parts = []
+        offsets = [0]
+        for term, rows in self._rows.items():
+            new_rows = mapping[rows]
+            keep = new_rows >= 0
+            if not keep.any():
+                continue
+            terms.append(term)
+            row_parts.append(new_rows[keep])
+            tf_parts.append(self._tfs[term][keep])
+            offsets.append(offsets[-1] + int(keep.sum()))
+        lengths = np.zeros(size, dtype=np.float32)
+        old_rows = np.flatnonzero(mapping >= 0)
+        lengths[mapping[old_rows]] = self._doc_lengths[old_rows]
+
+        empty_rows = np.zeros(0, dtype=np.int64)
+        empty_tfs = np.zeros(0, dtype=np.float32)
+        np.save(os.path.join(directory, "lexical.rows.npy"), np.concatenate(row_parts) if row_parts else empty_rows)
+        np.save(os.path.join(directory, "lexical.tfs.npy"), np.concatenate(tf_parts) if tf_parts else empty_tfs)
+        np.save(os.path.join(directory, "lexical.offsets.npy"), np.asarray(offsets, dtype=np.int64))
+        np.save(os.path.join(directory, "lexical.lengths.npy"), lengths)
+        with open(os.path.join(directory, "lexical.terms.json"), "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "doc_count": self._doc_count, "terms": terms}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["BM25Index"]:
+        """从 save 写出的文件加载，倒排表是内存映射数组上的切片"""
+        terms_path = os.path.join(directory, "lexical.terms.json")
+        if not os.path.exists(terms_path):
+            return None
+        with open(terms_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(k1=meta["k1"], b=meta["b"])
+        rows = np.load(os.path.join(directory, "lexical.rows.npy"), mmap_mode="r")
+        tfs = np.load(os.path.join(directory, "lexical.tfs.npy"), mmap_mode="r")
+        offsets = np.load(os.path.join(directory, "lexical.offsets.npy"))
+        for i, term in enumerate(meta["terms"]):
+            index._rows[term] = rows[offsets[i]:offsets[i + 1]]
+            index._tfs[term] = tfs[offsets[i]:offsets[i + 1]]
+        index._doc_lengths = np.array(np.load(os.path.join(directory, "lexical.lengths.npy")))
+        index._doc_count = meta["doc_count"]
+        index._total_length = float(index._doc_lengths.sum())
+        return index
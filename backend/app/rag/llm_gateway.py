@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import json
+import random
+from typing import List, Dict, Any, Optional, AsyncIterator
+
+import httpx
+
+from app.config import settings
+
+# 需要重试的 HTTP 状态码：限流和服务端临时错误
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMGatewayError(Exception):
+    """大模型调用失败"""
+
+
+class LLMGateway:
+    """异步大模型网关（OpenAI 兼容接口）
+
+    - 进程内共享一个带连接池的 httpx.AsyncClient，复用 keep-alive 连接
+    - 信号量限制同时发出的请求数
+    - 网络错误、限流和 5xx 按指数退避 + 随机抖动重试
+    - 相同请求体的并发调用合并为一次上游请求
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str] = None,
+        model: str = "deepseek-chat",
+        max_concurrency: int = 8,
+        max_connections: int = 20,
+        max_retries: int = 3,
+        timeout: float = 30.0,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_connections = max_connections
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {"requests": 0, "coalesced": 0, "retries": 0, "failures": 0}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """懒加载共享的 HTTP 客户端"""
+        if self._client is None or self._client.is_closed:
+            headers = {"Content-Type": "application/json"}
+            if self.api_key:
+                headers["Authorization"] = f"Bearer {self.api_key}"
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _payload(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        payload = {"model": self.model, "messages": messages}
+        payload.update(kwargs)
+        return payload
+
+    def _backoff(self, attempt: int) -> float:
+        """第 attempt 次重试前的等待时间（full jitter）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _post(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """发送请求，失败时按退避策略重试"""
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt - 1))
+            try:
+                async with self._semaphore:
+                    self.stats["requests"] += 1
+                    response = await self.client.post("/chat/completions", json=payload)
+                if response.status_code in RETRYABLE_STATUS:
+                    last_error = LLMGatewayError(f"上游返回 {response.status_code}: {response.text[:200]}")
+                    continue
+                response.raise_for_status()
+                return response.json()
+            except httpx.TransportError as e:
+                last_error = e
+            except httpx.HTTPStatusError as e:
+                # 4xx（除限流外）重试也不会成功
+                self.stats["failures"] += 1
+                raise LLMGatewayError(f"上游返回 {e.response.status_code}: {e.response.text[:200]}") from e
+        self.stats["failures"] += 1
+        raise LLMGatewayError(f"大模型调用失败，已重试 {self.max_retries} 次: {last_error}")
+
+    async def complete(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        """调用 chat/completions，返回原始响应
+
+        请求体完全相同的并发调用共享同一个上游请求。
+        """
+        payload = self._payload(messages, **kwargs)
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._post(payload))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield：某个调用方被取消时不影响共享同一请求的其他调用方
+        return await asyncio.shield(task)
+
+    async def chat(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        """调用 chat/completions，返回回答文本"""
+        data = await self.complete(messages, **kwargs)
+        try:
+            return data["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as e:
+            raise LLMGatewayError(f"无法解析大模型响应: {data}") from e
+
+    def _parse_stream_chunk(self, data: str) -> Optional[str]:
+        """解析一条流式响应数据，返回回答片段；格式错误或上游在流中返回错误时抛出 LLMGatewayError"""
+        try:
+            chunk = json.loads(data)
+            if "error" in chunk:
+                raise LLMGatewayError(f"上游返回错误: {chunk['error']}")
+            return chunk["choices"][0].get("delta", {}).get("content")
+        except LLMGatewayError:
+            self.stats["failures"] += 1
+            raise
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+            self.stats["failures"] += 1
+            raise LLMGatewayError(f"无法解析大模型流式响应: {data[:200]}") from e
+
+    async def stream_chat(self, messages: List[Dict[str, str]], **kwargs) -> AsyncIterator[str]:
+        """流式调用 chat/completions，逐个产出回答片段
+
+        流式请求无法合并，输出第一个片段之后也不再重试。
+        """
+        payload = self._payload(messages, stream=True, **kwargs)
+        yielded = False
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt - 1))
+            try:
+                async with self._semaphore:
+                    self.stats["requests"] += 1
+                    async with self.client.stream("POST", "/chat/completions", json=payload) as response:
+                        if response.status_code in RETRYABLE_STATUS and attempt < self.max_retries:
+                            continue
+                        if response.status_code >= 400:
+                            body = (await response.aread()).decode("utf-8", "replace")
+                            self.stats["failures"] += 1
+                            raise LLMGatewayError(f"上游返回 {response.status_code}: {body[:200]}")
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[5:].strip()
+                            if data == "[DONE]":
+                                return
+                            delta = self._parse_stream_chunk(data)
+                            if delta:
+                                yielded = True
+                                yield delta
+                        return
+            except httpx.TransportError as e:
+                # 已经输出过片段时不能重试，否则回答会重复
+                if yielded or attempt >= self.max_retries:
+                    self.stats["failures"] += 1
+                    raise LLMGatewayError(f"大模型调用失败: {e}") from e
+        self.stats["failures"] += 1
+        raise LLMGatewayError(f"大模型调用失败，已重试 {self.max_retries} 次")
+
+
+# 全局变量，进程内共享的网关实例
+gateway: Optional[LLMGateway] = None
+
+def is_llm_configured() -> bool:
+    """是否配置了大模型接口"""
+    return bool(settings.OPENAI_API_BASE and settings.OPENAI_API_KEY)
+
+def get_llm_gateway() -> LLMGateway:
+    """返回进程内共享的网关实例"""
+    global gateway
+    if gateway is None:
+        gateway = LLMGateway(
+            base_url=settings.OPENAI_API_BASE or "",
+            api_key=settings.OPENAI_API_KEY,
+            model=settings.OPENAI_API_MODEL or "deepseek-chat",
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_retries=settings.LLM_MAX_RETRIES,
+            timeout=settings.LLM_TIMEOUT
+        )
+    return gateway
+
+def get_gateway_stats() -> Optional[Dict[str, int]]:
+    """网关调用统计，尚未创建网关时返回 None"""
+    return dict(gateway.stats) if gateway is not None else None
+
+async def close_llm_gateway() -> None:
+    """关闭网关的连接池"""
+    if gateway is not None:
+        await gateway.aclose()
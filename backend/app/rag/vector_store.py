@@ -0,0 +1,314 @@
+import json
+import os
+import threading
+import zlib
+from collections import Counter
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+
+from app.rag.chunk_cache import read_chunks, write_chunks
+from app.rag.lexical_index import BM25Index, tokenize
+
+
+class HashingEmbeddings(Embeddings):
+    """本地哈希嵌入
+
+    不依赖任何外部服务：用与 BM25 索引相同的切分（中文单字、二元组和英文/数字词），
+    经带符号的特征哈希映射到固定维度，再做 L2 归一化。
+    归一化后向量的点积即为余弦相似度。
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _embed_into(self, text: str, row: np.ndarray) -> None:
+        """把一段文本的嵌入写入给定的行向量"""
+        for feature, count in Counter(tokenize(text)).items():
+            h = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if h & 0x80000000 else -1.0
+            # 次线性词频，避免高频字主导向量
+            row[h % self.dim] += sign * (1.0 + np.log(count))
+        norm = np.linalg.norm(row)
+        if norm > 0:
+            row /= norm
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_matrix(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_matrix([text])[0].tolist()
+
+    def embed_matrix(self, texts: List[str]) -> np.ndarray:
+        """批量嵌入，直接返回 float32 矩阵（行数 = 文本数）"""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            self._embed_into(text, matrix[i])
+        return matrix
+
+
+class LocalVectorStore:
+    """本地向量索引
+
+    所有块向量保存在一个连续的 float32 矩阵中，容量按倍数增长，
+    检索时只做一次矩阵-向量点积和一次 argpartition。
+    块按政策 id 分组登记，删除政策时只把对应行标记为失效，
+    失效行超过一半时再整体压缩。
+    同一行号上还维护一份 BM25 倒排索引，用于精确术语匹配和混合检索。
+    """
+
+    def __init__(self, embeddings: Optional[HashingEmbeddings] = None, initial_capacity: int = 1024):
+        self.embeddings = embeddings or HashingEmbeddings()
+        self.dim = self.embeddings.dim
+        self._vectors = np.zeros((initial_capacity, self.dim), dtype=np.float32)
+        self._alive = np.zeros(initial_capacity, dtype=bool)
+        self._size = 0
+        self._dead = 0
+        self._documents: List[Optional[Document]] = []
+        self._policy_rows: Dict[int, List[int]] = {}
+        self._policy_hashes: Dict[int, str] = {}
+        self._lexical = BM25Index()
+        self._lock = threading.RLock()
+        # 每次内容变化都会递增，供上层缓存判断是否失效
+        self.version = 0
+
+    def __len__(self) -> int:
+        return self._size - self._dead
+
+    def policy_hash(self, policy_id: int) -> Optional[str]:
+        """返回已索引政策的文件内容哈希，未索引时返回 None"""
+        return self._policy_hashes.get(policy_id)
+
+    def policy_ids(self) -> List[int]:
+        """返回已索引的政策 id"""
+        return list(self._policy_rows.keys())
+
+    def _reserve(self, extra: int) -> None:
+        """确保矩阵还能容纳 extra 行"""
+        needed = self._size + extra
+        capacity = self._vectors.shape[0]
+        # 从快照加载的矩阵是只读内存映射，首次写入时复制到内存
+        if needed <= capacity and self._vectors.flags.writeable:
+            return
+        capacity = max(capacity, 1)
+        while capacity < needed:
+            capacity *= 2
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._vectors = vectors
+        self._alive = alive
+
+    def add_documents(
+        self,
+        documents: List[Document],
+        vectors: Optional[np.ndarray] = None,
+        policy_id: Optional[int] = None,
+        content_hash: Optional[str] = None
+    ) -> List[int]:
+        """添加文档块，返回分配的行号
+
+        指定 policy_id 时会先移除该政策已有的块，再登记新块和内容哈希。
+        """
+        if vectors is None and documents:
+            vectors = self.embeddings.embed_matrix([doc.page_content for doc in documents])
+        with self._lock:
+            if policy_id is not None and self._remove_rows(policy_id):
+                # 重新索引同一政策也会留下失效行，与删除政策一样按比例压缩
+                self._maybe_compact()
+            self._reserve(len(documents))
+            start = self._size
+            end = start + len(documents)
+            if documents:
+                self._vectors[start:end] = vectors
+                self._alive[start:end] = True
+                self._documents.extend(documents)
+                self._lexical.add(start, [doc.page_content for doc in documents])
+                self._size = end
+            rows = list(range(start, end))
+            if policy_id is not None:
+                self._policy_rows[policy_id] = rows
+                if content_hash is not None:
+                    self._policy_hashes[policy_id] = content_hash
+            self.version += 1
+            return rows
+
+    def _remove_rows(self, policy_id: int) -> int:
+        """把政策对应的行标记为失效（调用方需持有锁）"""
+        rows = self._policy_rows.pop(policy_id, [])
+        self._policy_hashes.pop(policy_id, None)
+        for row in rows:
+            self._documents[row] = None
+        if rows:
+            self._alive[rows] = False
+            self._dead += len(rows)
+            self._lexical.remove(rows)
+        return len(rows)
+
+    def remove_policy(self, policy_id: int) -> int:
+        """移除政策的所有块，返回移除的块数"""
+        with self._lock:
+            removed = self._remove_rows(policy_id)
+            if removed:
+                self.version += 1
+                self._maybe_compact()
+            return removed
+
+    def _maybe_compact(self) -> None:
+        """失效行超过一半时压缩（调用方需持有锁）"""
+        if self._dead * 2 > self._size:
+            self._compact()
+
+    def _compact(self) -> None:
+        """丢弃失效行，重排行号（调用方需持有锁）"""
+        keep = np.flatnonzero(self._alive[:self._size])
+        remap = {int(old): new for new, old in enumerate(keep)}
+        self._lexical.remap(self._row_mapping(keep), len(keep))
+        capacity = max(self._vectors.shape[0] // 2, len(keep), 1)
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:len(keep)] = self._vectors[keep]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(keep)] = True
+        self._vectors = vectors
+        self._alive = alive
+        self._documents = [self._documents[i] for i in keep]
+        self._policy_rows = {
+            policy_id: [remap[row] for row in rows]
+            for policy_id, rows in self._policy_rows.items()
+        }
+        self._size = len(keep)
+        self._dead = 0
+
+    def _row_mapping(self, keep: np.ndarray) -> np.ndarray:
+        """旧行号 -> 压缩后行号的映射数组，丢弃的行为 -1"""
+        mapping = np.full(self._size, -1, dtype=np.int64)
+        mapping[keep] = np.arange(len(keep))
+        return mapping
+
+    def save(self, directory: str) -> None:
+        """把当前索引（只含有效行）保存为快照"""
+        with self._lock:
+            keep = np.flatnonzero(self._alive[:self._size])
+            remap = {int(old): new for new, old in enumerate(keep)}
+            documents = [self._documents[i] for i in keep]
+            vectors = self._vectors[keep]
+            manifest = {
+                "dim": self.dim,
+                "policies": {
+                    str(policy_id): {
+                        "hash": self._policy_hashes.get(policy_id),
+                        "rows": [remap[row] for row in rows]
+                    }
+                    for policy_id, rows in self._policy_rows.items()
+                }
+            }
+            write_chunks(directory, "index", documents, vectors)
+            self._lexical.save(directory, self._row_mapping(keep), len(keep))
+        with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+    @classmethod
+    def load(cls, directory: str, embeddings: Optional[HashingEmbeddings] = None) -> Optional["LocalVectorStore"]:
+        """从快照加载索引，向量矩阵以只读内存映射方式打开
+
+        快照不存在或维度不匹配时返回 None。
+        """
+        store = cls(embeddings, initial_capacity=1)
+        manifest_path = os.path.join(directory, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("dim") != store.dim:
+            return None
+        chunks = read_chunks(directory, "index", mmap=True)
+        if chunks is None:
+            return None
+
+        documents, vectors = chunks
+        store._vectors = vectors
+        store._alive = np.ones(len(documents), dtype=bool)
+        store._size = len(documents)
+        store._documents = list(documents)
+        lexical = BM25Index.load(directory)
+        if lexical is None:
+            lexical = BM25Index()
+            lexical.add(0, [doc.page_content for doc in documents])
+        store._lexical = lexical
+        for policy_id, entry in manifest["policies"].items():
+            store._policy_rows[int(policy_id)] = entry["rows"]
+            if entry.get("hash"):
+                store._policy_hashes[int(policy_id)] = entry["hash"]
+        return store
+
+    def search_by_vector(self, query_vector: np.ndarray, k: int = 4) -> List[Tuple[int, float]]:
+        """按向量检索，返回 (行号, 相似度) 列表，按相似度降序"""
+        with self._lock:
+            vectors = self._vectors[:self._size]
+            alive = self._alive[:self._size]
+            dead = self._dead
+        live = len(vectors) - dead
+        if live <= 0 or k <= 0:
+            return []
+        scores = vectors @ query_vector
+        if dead:
+            scores[~alive] = -np.inf
+        k = min(k, live)
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def keyword_search(self, query: str, k: int = 4) -> List[Tuple[int, float]]:
+        """BM25 关键词检索，返回 (行号, 分数) 列表"""
+        with self._lock:
+            return self._lexical.search(query, k, self._alive[:self._size])
+
+    def hybrid_search(self, query: str, k: int = 4, candidates: Optional[int] = None, rrf_k: int = 60) -> List[Tuple[Document, float]]:
+        """向量检索与 BM25 检索的倒数排名融合（RRF）
+
+        两路各取 candidates 个候选，按 sum(1 / (rrf_k + 名次)) 合并排序。
+        只被一路命中的块也会参与排序，精确术语命中的块不会被向量分数淹没。
+        """
+        candidates = candidates or max(k * 4, 20)
+        query_vector = self.embeddings.embed_matrix([query])[0]
+        with self._lock:
+            fused: Dict[int, float] = {}
+            for hits in (self.search_by_vector(query_vector, candidates), self.keyword_search(query, candidates)):
+                for rank, (row, _) in enumerate(hits):
+                    fused[row] = fused.get(row, 0.0) + 1.0 / (rrf_k + rank + 1)
+            top = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(self._documents[row], score) for row, score in top]
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        """相似度搜索，同时返回分数"""
+        query_vector = self.embeddings.embed_matrix([query])[0]
+        with self._lock:
+            hits = self.search_by_vector(query_vector, k)
+            return [(self._documents[i], score) for i, score in hits]
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        """相似度搜索"""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def as_retriever(self, **kwargs):
+        """返回检索器"""
+        search_kwargs = kwargs.get("search_kwargs", {})
+        return LocalRetriever(self, k=search_kwargs.get("k", 4))
+
+
+class LocalRetriever:
+    """本地向量索引的检索器"""
+
+    def __init__(self, store: LocalVectorStore, k: int = 4):
+        self.store = store
+        self.k = k
+
+    def get_relevant_documents(self, query: str) -> List[Document]:
+        """获取相关文档"""
+        return self.store.similarity_search(query, self.k)
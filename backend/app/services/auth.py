@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError, jwt
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.cache import TTLCache
+from app.config import settings
+from app.database import User
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+# 员工资料缓存：user_id -> 资料字典，本进程的修改提交后立即失效，其他进程的修改最迟 ttl 秒后生效
+user_profile_cache = TTLCache(maxsize=settings.USER_PROFILE_CACHE_SIZE, ttl=settings.USER_PROFILE_CACHE_TTL)
+
+
+def serialize_profile(user: User) -> Dict[str, Any]:
+    """员工资料（/users/{id} 的响应，也是推荐服务用到的员工信息）"""
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "full_name": user.full_name,
+        "department": user.department,
+        "position": user.position,
+        "employee_id": user.employee_id,
+        "hire_date": user.hire_date.strftime("%Y-%m-%d") if user.hire_date else None,
+        "is_active": user.is_active,
+        "is_admin": user.is_admin
+    }
+
+
+async def get_user_profile(db: AsyncSession, user_id: int) -> Optional[Dict[str, Any]]:
+    """读取员工资料，缓存未命中时按主键查一次，用户不存在返回 None（不缓存）"""
+    profile = user_profile_cache.get(user_id)
+    if profile is None:
+        user = await db.get(User, user_id)
+        if user is None:
+            return None
+        profile = serialize_profile(user)
+        user_profile_cache.set(user_id, profile)
+    return profile
+
+
+def create_access_token(user: User) -> str:
+    """签发访问令牌，claims 中带上部门、职位和管理员标记，接口鉴权时不用再查库"""
+    now = datetime.utcnow()
+    claims = {
+        "sub": str(user.id),
+        "username": user.username,
+        "department": user.department,
+        "position": user.position,
+        "is_admin": bool(user.is_admin),
+        "iat": now,
+        "exp": now + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    }
+    return jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+
+def decode_access_token(token: str) -> Dict[str, Any]:
+    """校验签名和过期时间，返回 claims（user_id 为整数）"""
+    try:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        claims["user_id"] = int(claims["sub"])
+    except (JWTError, KeyError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="登录已失效，请重新登录",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return claims
+
+
+async def get_current_claims(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)
+) -> Dict[str, Any]:
+    """必须鉴权：从 Authorization: Bearer 令牌解出 claims，不访问数据库"""
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="请先登录",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return decode_access_token(credentials.credentials)
+
+
+async def get_admin_claims(claims: Dict[str, Any] = Depends(get_current_claims)) -> Dict[str, Any]:
+    """必须以管理员身份登录（维护政策文件等全局数据）"""
+    if not claims.get("is_admin"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="只有管理员可以执行此操作")
+    return claims
+
+
+def ensure_user_access(claims: Optional[Dict[str, Any]], user_id: int) -> None:
+    """只能操作本人的数据（管理员除外），未登录时拒绝"""
+    if claims is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="请先登录",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    if claims["user_id"] != user_id and not claims.get("is_admin"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="无权访问其他用户的数据")
+
+
+@event.listens_for(Session, "after_flush")
+def _track_user_changes(session, flush_context):
+    """记录本事务修改或删除的用户"""
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            session.info.setdefault("user_profile_changes", set()).add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    for user_id in session.info.pop("user_profile_changes", ()):
+        user_profile_cache.delete(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop("user_profile_changes", None)
@@ -0,0 +1,206 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import ChatHistory, get_async_sessionmaker
+
+
+class ChatHistoryWriter:
+    """聊天记录的异步批量写入器（write-behind）
+
+    请求只把记录放进有界队列就返回，后台任务攒够 batch_size 条或等满
+    flush_interval 秒后用一条多行 INSERT 写入并提交一次。
+    队列满时 submit 会等待，内存占用不超过 max_queue 条；关闭时写完队列里的剩余记录。
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 100,
+        flush_interval: float = 0.2,
+        max_queue: int = 10000,
+        max_retries: int = 3
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._discard_before: Dict[int, datetime] = {}
+        self.stats = {"submitted": 0, "written": 0, "batches": 0, "retries": 0, "dropped": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """启动后台写入任务（需在事件循环中调用）"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止接收新记录，写完队列中剩余的记录后退出"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, user_id: int, message: str, response: Optional[str]) -> None:
+        """提交一条聊天记录，写入器未运行时直接写库"""
+        record = {
+            "user_id": user_id,
+            "message": message,
+            "response": response,
+            "created_at": datetime.utcnow()
+        }
+        self.stats["submitted"] += 1
+        if not self.running:
+            await self._write([record])
+            return
+        await self._queue.put(record)
+
+    def discard(self, user_id: int) -> None:
+        """丢弃该用户此刻之前提交、仍在队列中的记录（清空聊天记录时调用）"""
+        if self.running:
+            self._discard_before[user_id] = datetime.utcnow()
+
+    async def _run(self) -> None:
+        closing = False
+        while not closing:
+            record = await self._queue.get()
+            if record is None:
+                break
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    record = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if record is None:
+                    closing = True
+                    break
+                batch.append(record)
+            await self._write(batch)
+
+        # 收到停止信号后，把信号之后仍在排队的记录也写完
+        remaining = []
+        while not self._queue.empty():
+            record = self._queue.get_nowait()
+            if record is not None:
+                remaining.append(record)
+        for offset in range(0, len(remaining), self.batch_size):
+            await self._write(remaining[offset:offset + self.batch_size])
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> None:
+        """多行 INSERT 写入一批记录，失败时重试，最终失败的批次丢弃并计数"""
+        if self._discard_before:
+            batch = [
+                record for record in batch
+                if record["created_at"] > self._discard_before.get(record["user_id"], datetime.min)
+            ]
+            if self._queue is None or self._queue.empty():
+                self._discard_before.clear()
+            if not batch:
+                return
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(min(2.0, 0.1 * (2 ** attempt)))
+            try:
+                async with get_async_sessionmaker()() as db:
+                    await db.execute(insert(ChatHistory), batch)
+                    await db.commit()
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+                return
+            except Exception as e:
+                print(f"记录聊天历史失败（第 {attempt + 1} 次）: {str(e)}")
+        self.stats["dropped"] += len(batch)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "queued": self._queue.qsize() if self.running else 0,
+            "running": self.running
+        }
+
+
+# 全局聊天记录写入器
+chat_history_writer = ChatHistoryWriter(
+    batch_size=settings.CHAT_HISTORY_BATCH_SIZE,
+    flush_interval=settings.CHAT_HISTORY_FLUSH_MS / 1000,
+    max_queue=settings.CHAT_HISTORY_QUEUE_SIZE
+)
+
+
+class ConversationContext:
+    """每个用户最近几轮对话的内存环形缓冲
+
+    多轮问答每次都要带上最近 max_turns 轮对话，缓冲命中时不查库；
+    用户第一次提问（或被淘汰后再次提问）时按 (user_id, created_at) 索引读一次数据库。
+    最多保留 max_users 个用户，超出时淘汰最久未提问的用户。
+    """
+
+    def __init__(self, max_turns: int = 5, max_users: int = 10000):
+        self.max_turns = max_turns
+        self.max_users = max_users
+        self._buffers: "OrderedDict[int, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, db: AsyncSession, user_id: int) -> List[Tuple[str, str]]:
+        """最近的对话，按时间正序返回 [(问题, 回答), ...]"""
+        if self.max_turns <= 0:
+            return []
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is not None:
+                self._buffers.move_to_end(user_id)
+                return list(buffer)
+
+        rows = (await db.execute(
+            select(ChatHistory.message, ChatHistory.response)
+            .where(ChatHistory.user_id == user_id)
+            .order_by(ChatHistory.created_at.desc(), ChatHistory.id.desc())
+            .limit(self.max_turns)
+        )).all()
+        turns = [(message, response or "") for message, response in reversed(rows)]
+        with self._lock:
+            self._buffers[user_id] = deque(turns, maxlen=self.max_turns)
+            self._buffers.move_to_end(user_id)
+            while len(self._buffers) > self.max_users:
+                self._buffers.popitem(last=False)
+        return turns
+
+    def append(self, user_id: int, message: str, response: str) -> None:
+        """记录一轮新对话；不在缓冲中的用户下次提问时会从数据库加载，这里不用处理"""
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is not None:
+                buffer.append((message, response))
+
+    def clear(self, user_id: int) -> None:
+        """清空该用户的上下文"""
+        with self._lock:
+            if user_id in self._buffers:
+                self._buffers[user_id] = deque(maxlen=self.max_turns)
+
+
+# 全局对话上下文
+conversation_context = ConversationContext(
+    max_turns=settings.CHAT_CONTEXT_TURNS,
+    max_users=settings.CHAT_CONTEXT_MAX_USERS
+)
@@ -0,0 +1,296 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import extract, func, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database import AnnualLeave, LeaveBalance, LeaveRequest
+from app.services.leave_catalog import leave_type_catalog
+
+# 占用额度的请假状态及其计入的台账字段，其他状态（rejected、cancelled）不占额度
+STATUS_FIELDS = {"pending": "pending_days", "approved": "used_days"}
+
+# 额度来自 AnnualLeave 表的请假类型
+ANNUAL_LEAVE_TYPE = "年假"
+
+# 批量查询时每条 IN 语句最多包含的键数
+QUERY_CHUNK_SIZE = 500
+
+BalanceKey = Tuple[int, int, int]
+
+
+def balance_key(leave_request: LeaveRequest) -> BalanceKey:
+    """请假记录对应的台账键 (user_id, leave_type_id, year)，跨年的请假计入开始日期所在年份"""
+    return leave_request.user_id, leave_request.leave_type_id, leave_request.start_date.year
+
+
+def is_annual_leave(leave_type_id: int) -> bool:
+    return leave_type_catalog.name_of(leave_type_id) == ANNUAL_LEAVE_TYPE
+
+
+def _entitlement(leave_type_id: int, annual_total: Optional[float]) -> Optional[float]:
+    """某类型的年度额度：年假取 AnnualLeave.total_days（没有记录为 0），其他取 max_days，为空表示不限"""
+    if is_annual_leave(leave_type_id):
+        return annual_total or 0.0
+    leave_type = leave_type_catalog.get(leave_type_id)
+    return leave_type["max_days"] if leave_type else None
+
+
+def _annual_totals(db: Session, pairs: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], AnnualLeave]:
+    """批量读取 (user_id, year) 对应的年假记录"""
+    pairs = sorted(set(pairs))
+    annual_leaves = {}
+    for offset in range(0, len(pairs), QUERY_CHUNK_SIZE):
+        chunk = pairs[offset:offset + QUERY_CHUNK_SIZE]
+        rows = db.query(AnnualLeave).filter(
+            tuple_(AnnualLeave.user_id, AnnualLeave.year).in_(chunk)
+        ).all()
+        for annual_leave in rows:
+            annual_leaves[(annual_leave.user_id, annual_leave.year)] = annual_leave
+    return annual_leaves
+
+
+def _refresh_remaining(balance: LeaveBalance) -> None:
+    if balance.total_days is None:
+        balance.remaining_days = None
+    else:
+        balance.remaining_days = balance.total_days - balance.used_days - balance.pending_days
+
+
+def _sync_annual_leave(balance: LeaveBalance, annual_leave: Optional[AnnualLeave]) -> None:
+    """年假台账变化时同步 AnnualLeave 的已用和剩余天数（只扣除已批准的部分）"""
+    if annual_leave is None:
+        return
+    annual_leave.used_days = balance.used_days
+    annual_leave.remaining_days = annual_leave.total_days - balance.used_days
+
+
+def get_balance(
+    db: Session,
+    user_id: int,
+    leave_type_id: int,
+    year: int,
+    for_update: bool = False
+) -> Optional[LeaveBalance]:
+    """按唯一索引读取一行台账，for_update 时加行锁"""
+    query = db.query(LeaveBalance).filter(
+        LeaveBalance.user_id == user_id,
+        LeaveBalance.leave_type_id == leave_type_id,
+        LeaveBalance.year == year
+    )
+    if for_update:
+        query = query.with_for_update()
+    return query.first()
+
+
+def _get_or_create(db: Session, user_id: int, leave_type_id: int, year: int) -> LeaveBalance:
+    """读取并锁定一行台账，不存在时按额度创建"""
+    balance = get_balance(db, user_id, leave_type_id, year, for_update=True)
+    if balance is not None:
+        return balance
+
+    annual_leave = None
+    if is_annual_leave(leave_type_id):
+        annual_leave = _annual_totals(db, [(user_id, year)]).get((user_id, year))
+    balance = LeaveBalance(
+        user_id=user_id,
+        leave_type_id=leave_type_id,
+        year=year,
+        total_days=_entitlement(leave_type_id, annual_leave.total_days if annual_leave else None),
+        used_days=0.0,
+        pending_days=0.0
+    )
+    _refresh_remaining(balance)
+    try:
+        # 用保存点插入，并发请求抢先插入同一行时回退到读取已有行
+        with db.begin_nested():
+            db.add(balance)
+    except IntegrityError:
+        balance = get_balance(db, user_id, leave_type_id, year, for_update=True)
+    return balance
+
+
+def apply_status_change(
+    db: Session,
+    leave_request: LeaveRequest,
+    old_status: Optional[str],
+    new_status: Optional[str]
+) -> Optional[LeaveBalance]:
+    """请假记录状态变化时增量更新台账（不提交事务）
+
+    新提交的申请 old_status 为 None。调用方在同一事务中修改请假记录并提交，
+    台账与请假记录要么一起生效，要么一起回滚。
+    """
+    old_field = STATUS_FIELDS.get(old_status)
+    new_field = STATUS_FIELDS.get(new_status)
+    if old_field == new_field:
+        return None
+
+    user_id, leave_type_id, year = balance_key(leave_request)
+    balance = _get_or_create(db, user_id, leave_type_id, year)
+    days = leave_request.days or 0.0
+    if old_field:
+        setattr(balance, old_field, getattr(balance, old_field) - days)
+    if new_field:
+        setattr(balance, new_field, getattr(balance, new_field) + days)
+    _refresh_remaining(balance)
+
+    if is_annual_leave(leave_type_id):
+        _sync_annual_leave(balance, _annual_totals(db, [(user_id, year)]).get((user_id, year)))
+    return balance
+
+
+def apply_status_changes(
+    db: Session,
+    changes: Iterable[Tuple[LeaveRequest, Optional[str], Optional[str]]]
+) -> None:
+    """批量审批时更新台账（不提交事务），changes 为 [(请假记录, 原状态, 新状态), ...]
+
+    先按台账键汇总天数变化，再按键排序用 IN 查询一次锁定所有涉及的台账行，
+    每行只改写一次；年假的 AnnualLeave 同样一次查询后同步。
+    """
+    deltas: Dict[BalanceKey, Dict[str, float]] = {}
+    for leave_request, old_status, new_status in changes:
+        old_field = STATUS_FIELDS.get(old_status)
+        new_field = STATUS_FIELDS.get(new_status)
+        if old_field == new_field:
+            continue
+        delta = deltas.setdefault(balance_key(leave_request), {"used_days": 0.0, "pending_days": 0.0})
+        days = leave_request.days or 0.0
+        if old_field:
+            delta[old_field] -= days
+        if new_field:
+            delta[new_field] += days
+    if not deltas:
+        return
+
+    keys = sorted(deltas)
+    balances: Dict[BalanceKey, LeaveBalance] = {}
+    for offset in range(0, len(keys), QUERY_CHUNK_SIZE):
+        chunk = keys[offset:offset + QUERY_CHUNK_SIZE]
+        rows = db.query(LeaveBalance).filter(
+            tuple_(LeaveBalance.user_id, LeaveBalance.leave_type_id, LeaveBalance.year).in_(chunk)
+        ).order_by(LeaveBalance.id).with_for_update().all()
+        for balance in rows:
+            balances[(balance.user_id, balance.leave_type_id, balance.year)] = balance
+    annual_leaves = _annual_totals(
+        db, [(user_id, year) for user_id, leave_type_id, year in keys if is_annual_leave(leave_type_id)]
+    )
+
+    for key in keys:
+        user_id, leave_type_id, year = key
+        # 台账行在提交申请时已创建，这里缺失只可能是历史数据，逐行补建
+        balance = balances.get(key) or _get_or_create(db, user_id, leave_type_id, year)
+        for field, change in deltas[key].items():
+            setattr(balance, field, getattr(balance, field) + change)
+        _refresh_remaining(balance)
+        if is_annual_leave(leave_type_id):
+            _sync_annual_leave(balance, annual_leaves.get((user_id, year)))
+
+
+def load_available_days(db: Session, keys: Iterable[BalanceKey]) -> Dict[BalanceKey, Optional[float]]:
+    """批量查询可用额度，返回 {(user_id, leave_type_id, year): 剩余天数}，None 表示不限
+
+    台账里有记录的直接读 remaining_days；没有记录说明当年还没有占用，
+    可用额度等于年度额度。无论多少个键，最多两次 IN 查询。
+    """
+    keys = sorted(set(keys))
+    available: Dict[BalanceKey, Optional[float]] = {}
+    for offset in range(0, len(keys), QUERY_CHUNK_SIZE):
+        chunk = keys[offset:offset + QUERY_CHUNK_SIZE]
+        rows = db.query(LeaveBalance).filter(
+            tuple_(LeaveBalance.user_id, LeaveBalance.leave_type_id, LeaveBalance.year).in_(chunk)
+        ).all()
+        for balance in rows:
+            available[(balance.user_id, balance.leave_type_id, balance.year)] = balance.remaining_days
+
+    missing = [key for key in keys if key not in available]
+    annual_leaves = _annual_totals(
+        db, [(user_id, year) for user_id, leave_type_id, year in missing if is_annual_leave(leave_type_id)]
+    )
+    for user_id, leave_type_id, year in missing:
+        annual_leave = annual_leaves.get((user_id, year))
+        available[(user_id, leave_type_id, year)] = _entitlement(
+            leave_type_id, annual_leave.total_days if annual_leave else None
+        )
+    return available
+
+
+def serialize_balance(balance: LeaveBalance) -> Dict:
+    return {
+        "user_id": balance.user_id,
+        "leave_type_id": balance.leave_type_id,
+        "leave_type": leave_type_catalog.name_of(balance.leave_type_id),
+        "year": balance.year,
+        "total_days": balance.total_days,
+        "used_days": balance.used_days,
+        "pending_days": balance.pending_days,
+        "remaining_days": balance.remaining_days
+    }
+
+
+def rebuild_balances(db: Session, user_ids: Optional[List[int]] = None, year: Optional[int] = None) -> Dict[str, int]:
+    """从请假记录重建台账（对账），并同步 AnnualLeave，提交事务
+
+    一次分组汇总查询得到每个 (员工, 类型, 年份) 的已批准和待审批天数，
+    与现有台账逐行比对，不一致的行改写为汇总值，历史记录里已没有占用的行清零。
+
+    Returns:
+        {"rows": 台账行数, "corrected": 被修正的行数}
+    """
+    year_column = extract("year", LeaveRequest.start_date)
+    query = db.query(
+        LeaveRequest.user_id,
+        LeaveRequest.leave_type_id,
+        year_column,
+        LeaveRequest.status,
+        func.sum(LeaveRequest.days)
+    ).filter(LeaveRequest.status.in_(list(STATUS_FIELDS)))
+    balance_query = db.query(LeaveBalance)
+    if user_ids is not None:
+        query = query.filter(LeaveRequest.user_id.in_(user_ids))
+        balance_query = balance_query.filter(LeaveBalance.user_id.in_(user_ids))
+    if year is not None:
+        query = query.filter(year_column == year)
+        balance_query = balance_query.filter(LeaveBalance.year == year)
+
+    totals: Dict[BalanceKey, Dict[str, float]] = {}
+    for user_id, leave_type_id, row_year, status, days in query.group_by(
+        LeaveRequest.user_id, LeaveRequest.leave_type_id, year_column, LeaveRequest.status
+    ):
+        key = (user_id, leave_type_id, int(row_year))
+        totals.setdefault(key, {"used_days": 0.0, "pending_days": 0.0})[STATUS_FIELDS[status]] += float(days or 0)
+
+    existing = {
+        (balance.user_id, balance.leave_type_id, balance.year): balance
+        for balance in balance_query.with_for_update().all()
+    }
+    keys = set(totals) | set(existing)
+    annual_leaves = _annual_totals(
+        db, [(user_id, row_year) for user_id, leave_type_id, row_year in keys if is_annual_leave(leave_type_id)]
+    )
+
+    corrected = 0
+    for key in keys:
+        user_id, leave_type_id, row_year = key
+        annual_leave = annual_leaves.get((user_id, row_year))
+        expected = totals.get(key, {"used_days": 0.0, "pending_days": 0.0})
+        total_days = _entitlement(leave_type_id, annual_leave.total_days if annual_leave else None)
+
+        balance = existing.get(key)
+        if balance is None:
+            balance = LeaveBalance(user_id=user_id, leave_type_id=leave_type_id, year=row_year)
+            db.add(balance)
+        if (balance.total_days, balance.used_days, balance.pending_days) != (
+            total_days, expected["used_days"], expected["pending_days"]
+        ):
+            corrected += 1
+        balance.total_days = total_days
+        balance.used_days = expected["used_days"]
+        balance.pending_days = expected["pending_days"]
+        _refresh_remaining(balance)
+        if is_annual_leave(leave_type_id):
+            _sync_annual_leave(balance, annual_leave)
+
+    db.commit()
+    return {"rows": len(keys), "corrected": corrected}
@@ -0,0 +1,141 @@
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal, LeaveType
+
+
+class LeaveTypeCatalog:
+    """进程内的请假类型目录
+
+    请假类型几乎不变，启动时加载一次，之后按 id 或名称直接从内存解析。
+    通过 ORM 写入钩子在 LeaveType 变更提交后标记失效，其他进程的修改最迟在 ttl 秒后生效。
+    与请假区间索引相同，失效或过期后在后台线程中重新加载，期间继续返回旧数据，
+    调用方（包括事件循环线程）不会同步查询数据库；只有从未加载过时才同步加载一次。
+    """
+
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self.version = 0
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        self._by_name: Dict[str, Dict[str, Any]] = {}
+        self._loaded_at: Optional[float] = None
+        self._stale = False
+        self._invalidations = 0  # 失效次数，加载期间再次失效时加载完成后仍保持失效
+        self._reloading = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def load(self, db: Session) -> None:
+        """从数据库加载所有请假类型"""
+        with self._load_lock:
+            self._load(db)
+
+    def _load(self, db: Session) -> None:
+        invalidations = self._invalidations
+        leave_types = [
+            {
+                "id": lt.id,
+                "name": lt.name,
+                "description": lt.description,
+                "max_days": lt.max_days,
+                "need_approval": lt.need_approval,
+                "is_paid": lt.is_paid
+            }
+            for lt in db.query(LeaveType).order_by(LeaveType.id).all()
+        ]
+        with self._lock:
+            self._by_id = {lt["id"]: lt for lt in leave_types}
+            self._by_name = {lt["name"]: lt for lt in leave_types}
+            self._loaded_at = time.monotonic()
+            self._stale = self._invalidations != invalidations
+            self.version += 1
+
+    def invalidate(self) -> None:
+        """标记目录失效，下次访问时在后台重新加载"""
+        with self._lock:
+            self._stale = True
+            self._invalidations += 1
+
+    def _ensure_fresh(self) -> None:
+        loaded_at = self._loaded_at
+        if loaded_at is None:
+            with self._load_lock:
+                if self._loaded_at is None:
+                    self._reload_locked()
+            return
+        if not self._stale and time.monotonic() - loaded_at < self.ttl:
+            return
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._background_reload, name="leave-type-reload", daemon=True).start()
+
+    def _reload_locked(self) -> None:
+        """重新加载（调用方持有 _load_lock）"""
+        db = SessionLocal()
+        try:
+            self._load(db)
+        finally:
+            db.close()
+
+    def _background_reload(self) -> None:
+        try:
+            with self._load_lock:
+                self._reload_locked()
+        except Exception as e:
+            # 加载失败时继续使用旧数据，下次访问再重试
+            print(f"重新加载请假类型目录失败: {e}")
+        finally:
+            with self._lock:
+                self._reloading = False
+
+    def all(self) -> List[Dict[str, Any]]:
+        """所有请假类型，按 id 排序"""
+        self._ensure_fresh()
+        return list(self._by_id.values())
+
+    def get(self, leave_type_id: int) -> Optional[Dict[str, Any]]:
+        """按 id 查找请假类型"""
+        self._ensure_fresh()
+        return self._by_id.get(leave_type_id)
+
+    def get_by_name(self, name: str) -> Optional[Dict[str, Any]]:
+        """按名称查找请假类型"""
+        self._ensure_fresh()
+        return self._by_name.get(name)
+
+    def name_of(self, leave_type_id: int) -> Optional[str]:
+        """返回请假类型名称，不存在时返回 None"""
+        leave_type = self.get(leave_type_id)
+        return leave_type["name"] if leave_type else None
+
+
+# 全局请假类型目录
+leave_type_catalog = LeaveTypeCatalog(ttl=settings.LEAVE_TYPE_CATALOG_TTL)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_leave_type_changes(session, flush_context):
+    """记录本事务是否写过 LeaveType"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, LeaveType):
+            session.info["leave_types_changed"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    """写过 LeaveType 的事务提交后使目录失效"""
+    if session.info.pop("leave_types_changed", False):
+        leave_type_catalog.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop("leave_types_changed", None)
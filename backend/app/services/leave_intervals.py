@@ -0,0 +1,393 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple, Union
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal, LeaveRequest, User
+
+# 占用时间段的请假状态
+ACTIVE_STATUSES = ("pending", "approved")
+
+DateLike = Union[date, datetime, str]
+
+
+def to_ordinal(value: DateLike) -> int:
+    """日期转换为日序号（date.toordinal），区间运算只比较整数"""
+    if isinstance(value, str):
+        value = datetime.strptime(value, "%Y-%m-%d")
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.toordinal()
+
+
+class IntervalGroup:
+    """一组闭区间 [start, end]（日序号）的区间索引
+
+    区间按 (start, id) 排序保存，同时记录组内最长区间的长度 max_length。
+    与 [a, b] 重叠的区间必然满足 a - max_length <= start <= b，
+    两次二分定位候选范围后只需检查这一小段的 end，查询为 O(log n + 候选数)。
+    """
+
+    __slots__ = ("_keys", "_ends", "_max_length")
+
+    def __init__(self):
+        self._keys: List[Tuple[int, int]] = []
+        self._ends: Dict[int, int] = {}
+        self._max_length = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, request_id: int, start: int, end: int) -> None:
+        insort(self._keys, (start, request_id))
+        self._ends[request_id] = end
+        self._max_length = max(self._max_length, end - start)
+
+    def extend(self, entries: List[Tuple[int, int, int]]) -> None:
+        """批量加入 (id, start, end)，只排序一次"""
+        for request_id, start, end in entries:
+            self._keys.append((start, request_id))
+            self._ends[request_id] = end
+            self._max_length = max(self._max_length, end - start)
+        self._keys.sort()
+
+    def remove(self, request_id: int, start: int) -> None:
+        # max_length 不回退，只会让候选范围偏大，不影响正确性
+        i = bisect_left(self._keys, (start, request_id))
+        if i < len(self._keys) and self._keys[i] == (start, request_id):
+            del self._keys[i]
+        self._ends.pop(request_id, None)
+
+    def overlapping(self, start: int, end: int) -> List[int]:
+        """与 [start, end] 重叠的区间 id"""
+        lo = bisect_left(self._keys, (start - self._max_length, -1))
+        hi = bisect_right(self._keys, (end, float("inf")))
+        return [request_id for _, request_id in self._keys[lo:hi] if self._ends[request_id] >= start]
+
+
+class LeaveIntervalIndex:
+    """进程内的请假区间索引
+
+    按员工和按部门各维护一组区间，用于：
+    - 提交请假时检查与本人待审批/已批准的请假是否重叠
+    - 查询某部门在某个时间段内有谁请假，不扫描 leave_requests 表
+
+    启动时加载结束日期在 lookback_days 天内及之后的请假，通过 ORM 写入钩子在事务提交后增量更新；
+    其他进程的修改最迟在 ttl 秒后随全量重新加载生效。重新加载在后台线程中进行，期间查询继续使用旧数据，
+    加载期间提交的变更在切换前重放到新数据上；钩子和查询都不会在调用方线程上另开数据库会话。
+    基于同一份数据的派生结构（如部门缺勤矩阵）通过 add_observer 注册，随索引一起加载和更新。
+    """
+
+    def __init__(self, ttl: float = 300.0, lookback_days: int = 365):
+        self.ttl = ttl
+        self.lookback_days = lookback_days
+        self._entries: Dict[int, Tuple[int, Optional[str], int, int, str]] = {}
+        self._by_user: Dict[int, IntervalGroup] = {}
+        self._by_department: Dict[Optional[str], IntervalGroup] = {}
+        self._departments: Dict[int, Optional[str]] = {}
+        self._since: Optional[int] = None
+        self._loaded_at: Optional[float] = None
+        self._observers: List = []
+        self._stale = False
+        self._reloading = False
+        self._replay: Optional[List[Tuple]] = None  # 加载期间提交的变更，加载完成后重放
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+
+    def add_observer(self, observer) -> None:
+        """注册派生结构，需实现 reset/add/remove/change_headcount"""
+        with self._lock:
+            self._observers.append(observer)
+            if self._loaded_at is not None:
+                observer.reset(self._entries, self._departments, self._since)
+
+    def load(self, db: Session) -> None:
+        """从数据库加载所有占用时间段的请假"""
+        with self._load_lock:
+            self._load_with_replay(db)
+
+    def _load_with_replay(self, db: Session) -> None:
+        """加载并重放加载期间提交的变更（调用方持有 _load_lock）"""
+        with self._lock:
+            self._replay = []
+        try:
+            self._load(db)
+        finally:
+            with self._lock:
+                self._replay = None
+
+    def _load(self, db: Session) -> None:
+        since_day = date.today() - timedelta(days=self.lookback_days)
+        since = datetime.combine(since_day, datetime.min.time())
+        departments = dict(db.query(User.id, User.department).all())
+        rows = db.query(
+            LeaveRequest.id, LeaveRequest.user_id, LeaveRequest.start_date, LeaveRequest.end_date, LeaveRequest.status
+        ).filter(
+            LeaveRequest.status.in_(ACTIVE_STATUSES),
+            LeaveRequest.end_date >= since
+        ).all()
+
+        entries = {}
+        by_user: Dict[int, List[Tuple[int, int, int]]] = {}
+        by_department: Dict[Optional[str], List[Tuple[int, int, int]]] = {}
+        for request_id, user_id, start_date, end_date, status in rows:
+            start, end = to_ordinal(start_date), to_ordinal(end_date)
+            department = departments.get(user_id)
+            entries[request_id] = (user_id, department, start, end, status)
+            by_user.setdefault(user_id, []).append((request_id, start, end))
+            by_department.setdefault(department, []).append((request_id, start, end))
+
+        user_groups = {}
+        for user_id, items in by_user.items():
+            user_groups[user_id] = IntervalGroup()
+            user_groups[user_id].extend(items)
+        department_groups = {}
+        for department, items in by_department.items():
+            department_groups[department] = IntervalGroup()
+            department_groups[department].extend(items)
+
+        with self._lock:
+            self._entries = entries
+            self._by_user = user_groups
+            self._by_department = department_groups
+            self._departments = departments
+            self._since = since_day.toordinal()
+            self._loaded_at = time.monotonic()
+            self._stale = False
+            for observer in self._observers:
+                observer.reset(entries, departments, self._since)
+            # 查询快照之后提交的变更可能不在新数据中；重放是幂等的，快照已包含的变更重放后结果不变
+            replay, self._replay = self._replay, None
+            for method, args in replay:
+                method(*args)
+
+    def invalidate(self) -> None:
+        """标记索引失效，下次访问时在后台重新加载"""
+        with self._lock:
+            self._stale = True
+
+    def ensure_fresh(self) -> None:
+        """首次访问时同步加载；超过 ttl 或已失效时启动后台重新加载，本次仍使用当前数据"""
+        loaded_at = self._loaded_at
+        if loaded_at is None:
+            # 加载期间一直持有 _load_lock，并发的首次访问等待同一次加载完成，不会各自全量加载
+            with self._load_lock:
+                if self._loaded_at is None:
+                    db = SessionLocal()
+                    try:
+                        self._load_with_replay(db)
+                    finally:
+                        db.close()
+            return
+        if not self._stale and time.monotonic() - loaded_at < self.ttl:
+            return
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._background_reload, name="leave-interval-reload", daemon=True).start()
+
+    def _reload(self) -> None:
+        db = SessionLocal()
+        try:
+            self.load(db)
+        finally:
+            db.close()
+
+    def _background_reload(self) -> None:
+        try:
+            self._reload()
+        except Exception as e:
+            # 加载失败时继续使用旧数据，下次访问再重试
+            print(f"重新加载请假区间索引失败: {e}")
+        finally:
+            with self._lock:
+                self._reloading = False
+
+    def known_department(self, user_id: int) -> Tuple[bool, Optional[str]]:
+        """索引中记录的员工部门，返回 (是否已知, 部门)"""
+        with self._lock:
+            if user_id in self._departments:
+                return True, self._departments[user_id]
+            return False, None
+
+    def _department_of(self, user_id: int, department: Optional[str]) -> Optional[str]:
+        """员工所在部门；索引中还没有该员工时使用登记变更时查到的部门"""
+        if user_id not in self._departments:
+            self._departments[user_id] = department
+            for observer in self._observers:
+                observer.change_headcount(department, 1)
+        return self._departments[user_id]
+
+    def _remove(self, request_id: int) -> None:
+        entry = self._entries.pop(request_id, None)
+        if entry is None:
+            return
+        user_id, department, start, end, status = entry
+        self._by_user[user_id].remove(request_id, start)
+        self._by_department[department].remove(request_id, start)
+        for observer in self._observers:
+            observer.remove(department, start, end, status)
+
+    def _add(self, request_id: int, user_id: int, department: Optional[str], start: int, end: int, status: str) -> None:
+        department = self._department_of(user_id, department)
+        self._entries[request_id] = (user_id, department, start, end, status)
+        self._by_user.setdefault(user_id, IntervalGroup()).add(request_id, start, end)
+        self._by_department.setdefault(department, IntervalGroup()).add(request_id, start, end)
+        for observer in self._observers:
+            observer.add(department, start, end, status)
+
+    def apply(
+        self,
+        request_id: int,
+        user_id: int,
+        department: Optional[str],
+        start_date: DateLike,
+        end_date: DateLike,
+        status: Optional[str]
+    ) -> None:
+        """请假记录新增、修改或删除（status 为 None）后更新索引，department 为登记变更时员工所在部门"""
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((self.apply, (request_id, user_id, department, start_date, end_date, status)))
+            if self._loaded_at is None:
+                return  # 尚未加载，首次访问时整体加载
+            self._remove(request_id)
+            if status in ACTIVE_STATUSES:
+                self._add(request_id, user_id, department, to_ordinal(start_date), to_ordinal(end_date), status)
+
+    def set_department(self, user_id: int, department: Optional[str]) -> None:
+        """员工调动部门后，把其请假移到新部门"""
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((self.set_department, (user_id, department)))
+            if self._loaded_at is None:
+                self._departments[user_id] = department
+                return
+            if user_id not in self._departments:
+                self._departments[user_id] = department
+                for observer in self._observers:
+                    observer.change_headcount(department, 1)
+                return
+            previous = self._departments[user_id]
+            if previous == department:
+                return
+            for observer in self._observers:
+                observer.change_headcount(previous, -1)
+                observer.change_headcount(department, 1)
+            group = self._by_user.get(user_id)
+            request_ids = [request_id for _, request_id in group._keys] if group else []
+            entries = [(request_id, self._entries[request_id]) for request_id in request_ids]
+            for request_id, _ in entries:
+                self._remove(request_id)
+            self._departments[user_id] = department
+            for request_id, (_, _, start, end, status) in entries:
+                self._add(request_id, user_id, department, start, end, status)
+
+    def user_conflicts(self, user_id: int, start_date: DateLike, end_date: DateLike) -> List[Dict]:
+        """与该员工待审批/已批准的请假重叠的记录"""
+        self.ensure_fresh()
+        with self._lock:
+            group = self._by_user.get(user_id)
+            if group is None:
+                return []
+            request_ids = group.overlapping(to_ordinal(start_date), to_ordinal(end_date))
+            return [self._serialize(request_id) for request_id in request_ids]
+
+    def department_absences(self, department: str, start_date: DateLike, end_date: DateLike) -> List[Dict]:
+        """某部门在 [start_date, end_date] 内请假的记录，按开始日期排序"""
+        self.ensure_fresh()
+        with self._lock:
+            group = self._by_department.get(department)
+            if group is None:
+                return []
+            request_ids = group.overlapping(to_ordinal(start_date), to_ordinal(end_date))
+            return [self._serialize(request_id) for request_id in request_ids]
+
+    def _serialize(self, request_id: int) -> Dict:
+        user_id, department, start, end, status = self._entries[request_id]
+        return {
+            "id": request_id,
+            "user_id": user_id,
+            "department": department,
+            "start_date": date.fromordinal(start).strftime("%Y-%m-%d"),
+            "end_date": date.fromordinal(end).strftime("%Y-%m-%d"),
+            "status": status
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "intervals": len(self._entries),
+            "users": len(self._by_user),
+            "departments": len(self._by_department)
+        }
+
+
+# 全局请假区间索引
+leave_interval_index = LeaveIntervalIndex(
+    ttl=settings.LEAVE_INTERVAL_TTL,
+    lookback_days=settings.LEAVE_INTERVAL_LOOKBACK_DAYS
+)
+
+
+def record_change(
+    session: Session,
+    request_id: int,
+    user_id: int,
+    start_date: DateLike,
+    end_date: DateLike,
+    status: Optional[str]
+) -> None:
+    """登记一条不经过 ORM 对象的请假修改（如批量 UPDATE），事务提交后更新索引"""
+    department = _department_for(session, user_id)
+    session.info.setdefault("leave_interval_changes", {})[request_id] = (user_id, department, start_date, end_date, status)
+
+
+def _department_for(session: Session, user_id: int) -> Optional[str]:
+    """员工所在部门：优先取本事务的修改和索引中的记录，都没有时在本事务的连接上查询
+
+    在写入时查询，查询跟随调用方的会话（AsyncSession 下不阻塞事件循环），提交钩子里不再访问数据库。
+    """
+    departments = session.info.get("department_changes", {})
+    if user_id in departments:
+        return departments[user_id]
+    known, department = leave_interval_index.known_department(user_id)
+    if known:
+        return department
+    return session.connection().execute(select(User.department).where(User.id == user_id)).scalar()
+
+
+@event.listens_for(Session, "after_flush")
+def _track_leave_request_changes(session, flush_context):
+    """记录本事务写过的请假记录和员工部门"""
+    departments = session.info.setdefault("department_changes", {})
+    changed = list(session.new) + list(session.dirty)
+    for obj in changed:
+        if isinstance(obj, User):
+            departments[obj.id] = obj.department
+    for obj in changed:
+        if isinstance(obj, LeaveRequest):
+            record_change(session, obj.id, obj.user_id, obj.start_date, obj.end_date, obj.status)
+    for obj in session.deleted:
+        if isinstance(obj, LeaveRequest):
+            record_change(session, obj.id, obj.user_id, obj.start_date, obj.end_date, None)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session):
+    """事务提交后把变更应用到区间索引"""
+    for user_id, department in session.info.pop("department_changes", {}).items():
+        leave_interval_index.set_department(user_id, department)
+    for request_id, change in session.info.pop("leave_interval_changes", {}).items():
+        leave_interval_index.apply(request_id, *change)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop("leave_interval_changes", None)
+    session.info.pop("department_changes", None)
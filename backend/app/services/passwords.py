@@ -0,0 +1,134 @@
+import asyncio
+import hmac
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from passlib.context import CryptContext
+
+from app.config import settings
+
+
+class PasswordHasherBusy(Exception):
+    """哈希线程池排队已满"""
+
+
+class PasswordHasher:
+    """密码哈希与校验
+
+    bcrypt 按设计是 CPU 密集的（work factor 12 单次约 250ms），在 async 路由里直接调用会阻塞事件循环。
+    所有哈希和校验都提交到专用的有界线程池（bcrypt 计算时释放 GIL，可以多核并行），
+    排队的任务超过 max_pending 时直接拒绝，登录高峰不会拖慢其他接口。
+
+    库里仍是明文的旧密码校验通过后返回新的哈希值，由调用方写回数据库完成升级；
+    work factor 调整后，旧哈希同样会在下次登录时按新的 work factor 重新计算。
+    """
+
+    def __init__(self, rounds: int = 12, workers: int = 4, max_pending: int = 64):
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._dummy_hash: Optional[str] = None
+        self.stats = {
+            "hashed": 0, "verified": 0, "failed": 0, "upgraded": 0, "rejected": 0,
+            "hash_seconds": 0.0, "wait_seconds": 0.0
+        }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    def is_hashed(self, stored: str) -> bool:
+        """是否为可识别的哈希值（否则视为旧的明文密码）"""
+        return self.context.identify(stored) is not None
+
+    def hash_sync(self, password: str) -> str:
+        return self.context.hash(password)
+
+    def _get_dummy_hash(self) -> str:
+        """用于没有密码的账号的固定哈希，首次使用时计算"""
+        if self._dummy_hash is None:
+            self._dummy_hash = self.context.hash("dummy-password-for-timing")
+        return self._dummy_hash
+
+    def verify_sync(self, password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """校验密码，返回 (是否正确, 需要写回的新哈希值)"""
+        if not stored:
+            # 同样做一次完整的哈希校验，耗时与正常账号一致，不能据此判断账号是否设置了密码
+            self.context.verify(password, self._get_dummy_hash())
+            return False, None
+        if not self.is_hashed(stored):
+            if hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8")):
+                return True, self.context.hash(password)
+            return False, None
+        try:
+            return self.context.verify_and_update(password, stored)
+        except ValueError:
+            # 可识别但已损坏的哈希值（如被截断），按校验失败处理
+            return False, None
+
+    async def _submit(self, func, *args) -> Any:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.stats["rejected"] += 1
+                raise PasswordHasherBusy("登录请求过多，请稍后重试")
+            self._pending += 1
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self.stats["wait_seconds"] += started - submitted
+                    self.stats["hash_seconds"] += time.perf_counter() - started
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), timed)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._submit(self.hash_sync, password)
+        self.stats["hashed"] += 1
+        return hashed
+
+    async def verify(self, password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """在哈希线程池中校验密码，返回 (是否正确, 需要写回的新哈希值)"""
+        ok, new_hash = await self._submit(self.verify_sync, password, stored)
+        self.stats["verified" if ok else "failed"] += 1
+        if new_hash:
+            self.stats["upgraded"] += 1
+        return ok, new_hash
+
+    def get_stats(self) -> Dict[str, Any]:
+        completed = self.stats["hashed"] + self.stats["verified"] + self.stats["failed"]
+        return {
+            **self.stats,
+            "hash_seconds": round(self.stats["hash_seconds"], 3),
+            "wait_seconds": round(self.stats["wait_seconds"], 3),
+            "avg_hash_ms": round(self.stats["hash_seconds"] * 1000 / completed, 2) if completed else 0.0,
+            "pending": self._pending,
+            "workers": self.workers,
+            "rounds": self.context.to_dict().get("bcrypt__rounds")
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# 全局密码哈希服务
+password_hasher = PasswordHasher(
+    rounds=settings.PASSWORD_HASH_ROUNDS,
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING
+)
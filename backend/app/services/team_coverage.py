@@ -0,0 +1,250 @@
+import threading
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.services.leave_intervals import leave_interval_index, to_ordinal, DateLike
+from app.services.workday_calendar import get_workday_calendar
+
+
+def _check_range(start: int, end: int) -> None:
+    """日期区间（日序号）的结束不能早于开始"""
+    if end < start:
+        raise ValueError("结束日期不能早于开始日期")
+
+
+class AbsenceMatrix:
+    """按 日期 × 部门 统计请假人数的矩阵
+
+    两个 int32 矩阵分别记录每天每个部门已批准和待审批的请假人数，行是日期，列是部门。
+    行只覆盖区间索引的加载起点到今天之后 horizon_days 天，超出部分的请假日期不计入（查询时计为 0），
+    结束日期异常久远的请假不会让矩阵无限增长。
+    全量构建时用差分数组一次累加得到；之后每条请假的新增、审批、取消只更新对应列的一段切片。
+    任意日期范围的热力图、部门在岗人数都是矩阵切片，不访问数据库。
+
+    作为 LeaveIntervalIndex 的观察者注册，与区间索引使用同一份数据、同时加载和更新。
+    """
+
+    def __init__(self, horizon_days: int = 365):
+        self.horizon_days = horizon_days
+        self._origin = date.today().toordinal()  # 第 0 行对应的日序号
+        self._last = self._origin + horizon_days  # 矩阵最多覆盖到的日序号，每次重建时更新
+        self._approved = np.zeros((0, 0), dtype=np.int32)
+        self._pending = np.zeros((0, 0), dtype=np.int32)
+        self._headcount = np.zeros(0, dtype=np.int32)
+        self._columns: Dict[Optional[str], int] = {}
+        self._lock = threading.Lock()
+
+    # ---- 观察者接口，由区间索引在持有其锁时调用 ----
+
+    def reset(self, entries: Dict[int, Tuple], departments: Dict[int, Optional[str]], since: int) -> None:
+        """由区间索引的全部请假重建矩阵"""
+        columns: Dict[Optional[str], int] = {}
+        for department in departments.values():
+            columns.setdefault(department, len(columns))
+        for _, department, _, _, _ in entries.values():
+            columns.setdefault(department, len(columns))
+
+        headcount = np.zeros(len(columns), dtype=np.int32)
+        if departments:
+            np.add.at(headcount, [columns[d] for d in departments.values()], 1)
+
+        last = date.today().toordinal() + self.horizon_days
+        if entries:
+            values = list(entries.values())
+            starts = np.fromiter((v[2] for v in values), dtype=np.int64, count=len(values))
+            ends = np.fromiter((v[3] for v in values), dtype=np.int64, count=len(values))
+            cols = np.fromiter((columns[v[1]] for v in values), dtype=np.int64, count=len(values))
+            approved = np.fromiter((v[4] == "approved" for v in values), dtype=bool, count=len(values))
+            # 截到矩阵范围内，完全落在范围外的请假不计入
+            starts, ends = np.maximum(starts, since), np.minimum(ends, last)
+            inside = starts <= ends
+            starts, ends, cols, approved = starts[inside], ends[inside], cols[inside], approved[inside]
+        rows = last - since + 1
+
+        matrices = []
+        for mask in ((approved, ~approved) if entries else (None, None)):
+            diff = np.zeros((rows + 1, len(columns)), dtype=np.int32)
+            if mask is not None and mask.any():
+                np.add.at(diff, (starts[mask] - since, cols[mask]), 1)
+                np.add.at(diff, (ends[mask] - since + 1, cols[mask]), -1)
+            matrices.append(np.cumsum(diff[:-1], axis=0, dtype=np.int32))
+
+        with self._lock:
+            self._origin = since
+            self._last = last
+            self._approved, self._pending = matrices
+            self._headcount = headcount
+            self._columns = columns
+
+    def add(self, department: Optional[str], start: int, end: int, status: str) -> None:
+        self._update(department, start, end, status, 1)
+
+    def remove(self, department: Optional[str], start: int, end: int, status: str) -> None:
+        self._update(department, start, end, status, -1)
+
+    def change_headcount(self, department: Optional[str], delta: int) -> None:
+        with self._lock:
+            # _column 可能给新部门追加一列并替换 _headcount，需先取列号再索引
+            column = self._column(department)
+            self._headcount[column] += delta
+
+    def _column(self, department: Optional[str]) -> int:
+        """部门对应的列，新部门追加一列（调用方持有锁）"""
+        column = self._columns.get(department)
+        if column is None:
+            column = self._columns[department] = len(self._columns)
+            self._approved = np.pad(self._approved, ((0, 0), (0, 1)))
+            self._pending = np.pad(self._pending, ((0, 0), (0, 1)))
+            self._headcount = np.pad(self._headcount, (0, 1))
+        return column
+
+    def _ensure_rows(self, end: int) -> None:
+        """日期超出当前矩阵范围时向后扩展行，end 已截断到 _last（调用方持有锁）"""
+        after = max(0, end - (self._origin + len(self._approved) - 1))
+        if after:
+            self._approved = np.pad(self._approved, ((0, after), (0, 0)))
+            self._pending = np.pad(self._pending, ((0, after), (0, 0)))
+
+    def _update(self, department: Optional[str], start: int, end: int, status: str, delta: int) -> None:
+        with self._lock:
+            # 与 reset 相同的截断：下界为第 0 行，上界为 _last，两者只在重建时变化，add 和 remove 的截断结果一致
+            start, end = max(start, self._origin), min(end, self._last)
+            if start > end:
+                return
+            column = self._column(department)
+            self._ensure_rows(end)
+            matrix = self._approved if status == "approved" else self._pending
+            matrix[start - self._origin:end - self._origin + 1, column] += delta
+
+    # ---- 查询 ----
+
+    def _window(self, start: int, end: int, columns: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """[start, end] 内指定列的 (已批准, 待审批) 人数，矩阵范围外的日期计为 0（调用方持有锁）"""
+        shape = (end - start + 1, len(columns))
+        approved = np.zeros(shape, dtype=np.int32)
+        pending = np.zeros(shape, dtype=np.int32)
+        lo = max(start, self._origin)
+        hi = min(end, self._origin + len(self._approved) - 1)
+        if lo <= hi:
+            rows = slice(lo - self._origin, hi - self._origin + 1)
+            approved[lo - start:hi - start + 1] = self._approved[rows][:, columns]
+            pending[lo - start:hi - start + 1] = self._pending[rows][:, columns]
+        return approved, pending
+
+    def absent_counts(self, department: Optional[str], start: int, end: int) -> Tuple[np.ndarray, int]:
+        """部门在 [start, end] 内每天的请假人数（已批准 + 待审批）和部门人数"""
+        _check_range(start, end)
+        with self._lock:
+            column = self._columns.get(department)
+            if column is None:
+                return np.zeros(end - start + 1, dtype=np.int32), 0
+            approved, pending = self._window(start, end, [column])
+            return (approved + pending)[:, 0], int(self._headcount[column])
+
+    def heatmap(self, start: int, end: int, departments: Optional[List[str]] = None) -> Dict:
+        """[start, end] 内各部门每天的请假人数和在岗率"""
+        _check_range(start, end)
+        with self._lock:
+            names = departments if departments else sorted(
+                (d for d in self._columns if d is not None), key=lambda d: self._columns[d]
+            )
+            known = [d for d in names if d in self._columns]
+            unknown = [d for d in names if d not in self._columns]
+            columns = [self._columns[d] for d in known]
+            approved, pending = self._window(start, end, columns)
+            headcount = self._headcount[columns] if columns else np.zeros(0, dtype=np.int32)
+
+        absent = approved + pending
+        with np.errstate(divide="ignore", invalid="ignore"):
+            coverage = np.where(headcount > 0, 1 - absent / np.maximum(headcount, 1), 1.0)
+        dates = [date.fromordinal(d) for d in range(start, end + 1)]
+        workdays = get_workday_calendar().workday_mask(dates).tolist()
+
+        result = []
+        for i, department in enumerate(known):
+            result.append({
+                "department": department,
+                "headcount": int(headcount[i]),
+                "approved": approved[:, i].tolist(),
+                "pending": pending[:, i].tolist(),
+                "absent": absent[:, i].tolist(),
+                "coverage": np.round(coverage[:, i], 4).tolist(),
+                "peak_absent": int(absent[:, i].max()) if len(absent) else 0
+            })
+        for department in unknown:
+            zeros = [0] * len(dates)
+            result.append({
+                "department": department, "headcount": 0, "approved": zeros, "pending": zeros,
+                "absent": zeros, "coverage": [1.0] * len(dates), "peak_absent": 0
+            })
+        return {
+            "dates": [d.strftime("%Y-%m-%d") for d in dates],
+            "workdays": workdays,
+            "departments": result
+        }
+
+
+def _absence_summary(absent: np.ndarray, headcount: int) -> Dict:
+    peak = int(absent.max()) if len(absent) else 0
+    return {
+        "headcount": headcount,
+        "peak_absent": peak,
+        "min_on_duty": headcount - peak,
+        "min_coverage": round(1 - peak / headcount, 4) if headcount else None
+    }
+
+
+def department_coverage(department: Optional[str], start_date: DateLike, end_date: DateLike) -> Dict:
+    """部门在请假区间内的人员覆盖情况：部门人数、单日最多请假人数、最少在岗人数"""
+    start, end = to_ordinal(start_date), to_ordinal(end_date)
+    _check_range(start, end)
+    leave_interval_index.ensure_fresh()
+    absent, headcount = absence_matrix.absent_counts(department, start, end)
+    return {"department": department, **_absence_summary(absent, headcount)}
+
+
+def find_off_peak_window(
+    department: Optional[str],
+    start_date: DateLike,
+    end_date: DateLike,
+    max_shift_weeks: int
+) -> Optional[Tuple[date, date, Dict]]:
+    """在前后 max_shift_weeks 周内寻找部门请假人数峰值更低的同长度区间
+
+    按整周平移，保持星期分布不变；不早于今天。没有更好的区间时返回 None。
+    """
+    start, end = to_ordinal(start_date), to_ordinal(end_date)
+    _check_range(start, end)
+    leave_interval_index.ensure_fresh()
+    today = date.today().toordinal()
+    shifts = [7 * w for w in range(-max_shift_weeks, max_shift_weeks + 1) if w and start + 7 * w >= today]
+    if not shifts:
+        return None
+    # 一次取出覆盖所有候选区间的切片，再逐个取峰值
+    lo, hi = start + min(shifts + [0]), end + max(shifts + [0])
+    absent, headcount = absence_matrix.absent_counts(department, lo, hi)
+    length = end - start + 1
+    baseline = int(absent[start - lo:start - lo + length].max())
+    best = None
+    for shift in sorted(shifts, key=abs):
+        offset = start + shift - lo
+        peak = int(absent[offset:offset + length].max())
+        if peak < baseline and (best is None or peak < best[1]):
+            best = (shift, peak)
+    if best is None:
+        return None
+    shift = best[0]
+    window = absent[start + shift - lo:start + shift - lo + length]
+    return (
+        date.fromordinal(start + shift),
+        date.fromordinal(end + shift),
+        {"department": department, **_absence_summary(window, headcount)}
+    )
+
+
+# 全局部门缺勤矩阵，随请假区间索引加载和更新
+absence_matrix = AbsenceMatrix(horizon_days=settings.LEAVE_COVERAGE_HORIZON_DAYS)
+leave_interval_index.add_observer(absence_matrix)
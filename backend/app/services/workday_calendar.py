@@ -0,0 +1,102 @@
+import json
+import os
+from datetime import date, datetime
+from typing import Iterable, Optional, Sequence, Union
+
+import numpy as np
+
+from app.config import settings
+
+DateLike = Union[str, date, datetime, np.datetime64]
+
+# 内置的中国法定节假日表
+DEFAULT_HOLIDAY_FILE = os.path.join(os.path.dirname(__file__), "holidays_cn.json")
+
+
+def to_day(value: DateLike) -> np.datetime64:
+    """把字符串/日期/时间统一转换为 datetime64[D]"""
+    if isinstance(value, datetime):
+        value = value.date()
+    return np.datetime64(value, "D")
+
+
+def to_days(values: Sequence[DateLike]) -> np.ndarray:
+    """批量转换为 datetime64[D] 数组，已经是 datetime64 数组时不逐个转换"""
+    if isinstance(values, np.ndarray) and values.dtype.kind == "M":
+        return values.astype("datetime64[D]")
+    return np.asarray([to_day(d) for d in values], dtype="datetime64[D]")
+
+
+class WorkdayCalendar:
+    """工作日日历
+
+    基于 numpy 的工作日运算：周一至周五为工作日，扣除法定节假日，
+    再加上落在周末的调休上班日（补班）。
+    任意区间的工作日数都是 O(log 节假日数) 的一次计算，不逐日遍历。
+    """
+
+    def __init__(self, holidays: Iterable[DateLike] = (), workdays: Iterable[DateLike] = ()):
+        self.holidays = np.unique(np.array([to_day(d) for d in holidays], dtype="datetime64[D]"))
+        workdays = np.unique(np.array([to_day(d) for d in workdays], dtype="datetime64[D]"))
+        # 只有落在周末的补班日才需要额外计入
+        self.workdays = workdays[~np.is_busday(workdays)] if len(workdays) else workdays
+        self._busdaycal = np.busdaycalendar(weekmask="1111100", holidays=self.holidays)
+
+    @classmethod
+    def from_file(cls, path: str) -> "WorkdayCalendar":
+        """从 JSON 文件加载：{"holidays": [...], "workdays": [...]}"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("holidays", []), data.get("workdays", []))
+
+    def is_workday(self, day: DateLike) -> bool:
+        """判断某天是否需要上班"""
+        day = to_day(day)
+        if len(self.workdays) and day in self.workdays:
+            return True
+        return bool(np.is_busday(day, busdaycal=self._busdaycal))
+
+    def workday_mask(self, days: Sequence[DateLike]) -> np.ndarray:
+        """批量判断每天是否需要上班，返回布尔数组"""
+        days = to_days(days)
+        mask = np.is_busday(days, busdaycal=self._busdaycal)
+        if len(self.workdays):
+            mask |= np.isin(days, self.workdays)
+        return mask
+
+    def count(self, start: DateLike, end: DateLike) -> int:
+        """统计 [start, end] 闭区间内的工作日数"""
+        return int(self.count_batch([start], [end])[0])
+
+    def count_batch(self, starts: Sequence[DateLike], ends: Sequence[DateLike]) -> np.ndarray:
+        """批量统计工作日数，starts/ends 一一对应，均为闭区间
+
+        用于薪资、报表等一次计算成千上万个区间的场景。
+        结束早于开始的区间返回 0。
+        """
+        starts = to_days(starts)
+        ends = to_days(ends)
+        stops = ends + np.timedelta64(1, "D")
+        counts = np.busday_count(starts, stops, busdaycal=self._busdaycal)
+        if len(self.workdays):
+            counts += (
+                np.searchsorted(self.workdays, ends, side="right")
+                - np.searchsorted(self.workdays, starts, side="left")
+            )
+        return np.where(ends >= starts, counts, 0)
+
+
+# 全局工作日日历
+_calendar: Optional[WorkdayCalendar] = None
+
+def get_workday_calendar() -> WorkdayCalendar:
+    """返回全局工作日日历，节假日表取自 HOLIDAY_CALENDAR_PATH 或内置文件"""
+    global _calendar
+    if _calendar is None:
+        path = settings.HOLIDAY_CALENDAR_PATH or DEFAULT_HOLIDAY_FILE
+        try:
+            _calendar = WorkdayCalendar.from_file(path)
+        except Exception as e:
+            print(f"加载节假日表失败: {path}, 错误: {e}，将只按周末计算")
+            _calendar = WorkdayCalendar()
+    return _calendar
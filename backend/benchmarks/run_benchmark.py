@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+API 基准测试
+
+用 generate_test_data.py 在本地 SQLite 或 PostgreSQL 上生成固定种子的测试数据，
+以子进程启动 main.py 中的 app（uvicorn），然后按给定并发依次压测各个接口，
+输出每个接口的 p50/p95/p99 延迟和吞吐量（JSON），便于不同提交之间对比。
+压测前先登录请求中用到的所有用户（不计时），之后每个请求带上对应用户的访问令牌。
+
+用法（在 backend 目录下执行）:
+    python benchmarks/run_benchmark.py --db-url sqlite:///./data/bench.db --reset --seed-users 500
+    python benchmarks/run_benchmark.py --concurrency 32 --requests 2000 --endpoints recommend,requests
+    python benchmarks/run_benchmark.py --base-url http://127.0.0.1:8000 --users 500   # 压测已启动的服务
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHAT_MESSAGES = ["年假有几天？", "病假需要什么证明？", "婚假可以请多少天？", "调休怎么申请？"]
+
+# 每个接口的请求构造函数：(随机数生成器, 用户数) -> (方法, 路径, JSON 请求体, 以哪个用户的身份发送)
+Request = Tuple[str, str, Optional[Dict[str, Any]], Optional[int]]
+
+# 提交请假时每个用户依次使用的时间段序号，同一用户的请假互不重叠，不会因重叠检查被拒绝（409）
+_apply_slots: Dict[int, int] = {}
+
+def _date_range(rng: random.Random) -> Tuple[str, str]:
+    start = date(datetime.now().year + 1, 1, 1) + timedelta(days=rng.randint(0, 330))
+    end = start + timedelta(days=rng.randint(0, 6))
+    return start.isoformat(), end.isoformat()
+
+def login_request(rng: random.Random, users: int) -> Request:
+    user_id = rng.randint(1, users)
+    return "POST", "/api/auth/login", login_body(user_id), None
+
+def login_body(user_id: int) -> Dict[str, str]:
+    return {"username": f"user{user_id}", "password": f"password{user_id}"}
+
+def recommend_request(rng: random.Random, users: int) -> Request:
+    user_id = rng.randint(1, users)
+    start_date, end_date = _date_range(rng)
+    return "POST", "/api/leave/recommend", {
+        "user_id": user_id, "start_date": start_date, "end_date": end_date, "reason": "基准测试"
+    }, user_id
+
+def apply_request(rng: random.Random, users: int) -> Request:
+    # 按周分配时间段，请假最长 5 天，同一用户的请求互不重叠
+    user_id = rng.randint(1, users)
+    slot = _apply_slots.get(user_id, 0)
+    _apply_slots[user_id] = slot + 1
+    start = date(datetime.now().year + 1, 1, 1) + timedelta(weeks=slot)
+    end = start + timedelta(days=rng.randint(0, 4))
+    return "POST", "/api/leave/apply", {
+        "user_id": user_id, "leave_type_id": rng.randint(1, 7),
+        "start_date": start.isoformat(), "end_date": end.isoformat(), "reason": "基准测试"
+    }, user_id
+
+def requests_request(rng: random.Random, users: int) -> Request:
+    user_id = rng.randint(1, users)
+    return "GET", f"/api/leave/requests/{user_id}?limit=50", None, user_id
+
+def chat_request(rng: random.Random, users: int) -> Request:
+    user_id = rng.randint(1, users)
+    return "POST", "/api/chat", {"user_id": user_id, "message": rng.choice(CHAT_MESSAGES)}, user_id
+
+SCENARIOS: Dict[str, Callable[[random.Random, int], Request]] = {
+    "login": login_request,
+    "recommend": recommend_request,
+    "apply": apply_request,
+    "requests": requests_request,
+    "chat": chat_request,
+}
+
+def summarize(latencies: List[float], statuses: Dict[str, int], errors: int, elapsed: float) -> Dict[str, Any]:
+    """汇总一个接口的延迟分布和吞吐量
+
+    409（与已有请假重叠，重复压测同一个库时会出现）单独计入 conflicts，不算作错误。
+    """
+    values = np.asarray(latencies, dtype=np.float64) * 1000
+    count = len(latencies) + errors
+    summary = {
+        "count": count,
+        "errors": errors + sum(n for code, n in statuses.items() if int(code) >= 400 and code != "409"),
+        "conflicts": statuses.get("409", 0),
+        "status_codes": statuses,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+    if len(values):
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        summary["latency_ms"] = {
+            "p50": round(float(p50), 2),
+            "p95": round(float(p95), 2),
+            "p99": round(float(p99), 2),
+            "mean": round(float(values.mean()), 2),
+            "max": round(float(values.max()), 2),
+        }
+    return summary
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    name: str,
+    total: int,
+    concurrency: int,
+    users: int,
+    seed: int,
+    tokens: Dict[int, str]
+) -> Dict[str, Any]:
+    """用 concurrency 个协程发送 total 个请求，tokens 为 user_id -> 访问令牌"""
+    build = SCENARIOS[name]
+    rng = random.Random(f"{seed}:{name}")
+    requests = [build(rng, users) for _ in range(total)]
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < total:
+            method, path, body, user_id = requests[next_index]
+            next_index += 1
+            headers = {"Authorization": f"Bearer {tokens[user_id]}"} if user_id is not None else None
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body, headers=headers)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            code = str(response.status_code)
+            statuses[code] = statuses.get(code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, statuses, errors, time.perf_counter() - start)
+
+async def login_all(client: httpx.AsyncClient, user_ids: List[int], concurrency: int) -> Dict[int, str]:
+    """登录压测中用到的用户，返回 user_id -> 访问令牌（不计入各接口的计时）"""
+    semaphore = asyncio.Semaphore(concurrency)
+    tokens: Dict[int, str] = {}
+
+    async def login(user_id: int):
+        async with semaphore:
+            response = await client.post("/api/auth/login", json=login_body(user_id))
+        if response.status_code != 200:
+            raise RuntimeError(f"用户 user{user_id} 登录失败: {response.status_code} {response.text[:200]}")
+        tokens[user_id] = response.json()["access_token"]
+
+    await asyncio.gather(*(login(user_id) for user_id in user_ids))
+    return tokens
+
+async def run_benchmark(args, base_url: str) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        tokens: Dict[int, str] = {}
+        if any(name != "login" for name in args.endpoints):
+            started = time.perf_counter()
+            tokens = await login_all(client, list(range(1, args.users + 1)), args.concurrency)
+            print(f"已登录 {len(tokens)} 个用户，用时 {time.perf_counter() - started:.1f} 秒", file=sys.stderr)
+        results = {}
+        for name in args.endpoints:
+            if args.warmup:
+                await run_scenario(
+                    client, name, args.warmup, min(args.concurrency, args.warmup), args.users, args.seed + 1, tokens
+                )
+            results[name] = await run_scenario(
+                client, name, args.requests, args.concurrency, args.users, args.seed, tokens
+            )
+            print(f"{name}: {json.dumps(results[name], ensure_ascii=False)}", file=sys.stderr)
+        return results
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务启动失败，退出码 {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("等待服务启动超时")
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="API 基准测试")
+    parser.add_argument("--base-url", help="压测已启动的服务，不再启动和初始化数据库")
+    parser.add_argument("--db-url", help="数据库连接URL（设置 DB_URL），默认使用配置文件中的数据库")
+    parser.add_argument("--reset", action="store_true", help="压测前删除 SQLite 数据库文件")
+    parser.add_argument("--seed-users", type=int, default=0, help="压测前用 generate_test_data.py 生成的用户数")
+    parser.add_argument("--users", type=int, default=None, help="请求中随机使用的用户 id 范围 1..N，默认等于 --seed-users")
+    parser.add_argument("--endpoints", default=",".join(SCENARIOS), help=f"逗号分隔，可选: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发请求数")
+    parser.add_argument("--requests", type=int, default=500, help="每个接口的请求数")
+    parser.add_argument("--warmup", type=int, default=20, help="每个接口正式计时前的预热请求数")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker 数")
+    parser.add_argument("--timeout", type=float, default=60.0, help="单个请求超时（秒）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--output", help="结果 JSON 写入的文件")
+    args = parser.parse_args()
+
+    args.endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in args.endpoints if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知接口: {', '.join(unknown)}")
+    args.users = args.users or args.seed_users or 20
+
+    env = dict(os.environ)
+    if args.db_url:
+        env["DB_URL"] = args.db_url
+    process = None
+    base_url = args.base_url
+    try:
+        if base_url is None:
+            if args.reset and args.db_url and args.db_url.startswith("sqlite:///"):
+                db_file = os.path.join(BACKEND_DIR, args.db_url[len("sqlite:///"):])
+                if os.path.exists(db_file):
+                    os.remove(db_file)
+            if args.seed_users:
+                subprocess.run(
+                    [sys.executable, "generate_test_data.py", "--users", str(args.seed_users), "--seed", str(args.seed)],
+                    cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL
+                )
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            process = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+                 "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+                cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL
+            )
+            wait_until_ready(base_url, process)
+
+        results = asyncio.run(run_benchmark(args, base_url))
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "db_url": args.db_url if args.base_url is None else None,
+            "base_url": args.base_url,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "users": args.users,
+            "workers": args.workers if args.base_url is None else None,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
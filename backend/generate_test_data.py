@@ -1,249 +1,343 @@
-# #!/usr/bin/env python
-# # -*- coding: utf-8 -*-
-# """
-# 生成测试数据并导入数据库
-# """
-# import random
-# from datetime import datetime, timedelta
-# from sqlalchemy import create_engine
-# from sqlalchemy.orm import sessionmaker
-# from app.database import Base, User, AnnualLeave, LeaveType, LeaveRequest, Policy, ChatHistory
-# from app.config import settings
-
-# # 连接数据库
-# engine = create_engine(settings.DATABASE_URL, echo=False)
-# SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# def create_test_data():
-#     """创建测试数据"""
-#     # 创建所有表
-#     Base.metadata.create_all(bind=engine)
-    
-#     # 创建数据库会话
-#     db = SessionLocal()
-    
-#     try:
-#         # 1. 添加请假类型数据
-#         leave_type_data = [
-#             {"name":"年假", "description":"员工带薪年假", "max_days":15, "need_approval":True, "is_paid":True},
-#             {"name":"病假", "description":"员工因病请假", "max_days":30, "need_approval":True, "is_paid":True},
-#             {"name":"事假", "description":"员工个人事务请假", "max_days":10, "need_approval":True, "is_paid":False},
-#             {"name":"婚假", "description":"员工结婚请假", "max_days":3, "need_approval":True, "is_paid":True},
-#             {"name":"产假", "description":"女性员工产假", "max_days":98, "need_approval":True, "is_paid":True},
-#             {"name":"陪产假", "description":"男性员工陪产假", "max_days":15, "need_approval":True, "is_paid":True},
-#             {"name":"丧假", "description":"员工直系亲属去世请假", "max_days":3, "need_approval":True, "is_paid":True},
-#         ]
-        
-#         added_leave_types = 0
-#         for data in leave_type_data:
-#             # 检查是否已存在
-#             existing = db.query(LeaveType).filter(LeaveType.name == data["name"]).first()
-#             if not existing:
-#                 leave_type = LeaveType(**data)
-#                 db.add(leave_type)
-#                 added_leave_types += 1
-#         db.commit()
-#         print(f"已添加 {added_leave_types} 条请假类型数据")
-        
-#         # 2. 添加用户数据
-#         departments = ["技术部", "市场部", "人力资源部", "财务部", "销售部"]
-#         positions = ["经理", "主管", "专员", "助理", "实习生"]
-        
-#         added_users = 0
-#         # 查找已存在的最大用户ID
-#         max_id = db.query(User.id).order_by(User.id.desc()).first()
-#         start_id = max_id[0] + 1 if max_id else 1
-        
-#         for i in range(start_id, start_id + 20):
-#             username = f"user{i}"
-#             # 检查是否已存在
-#             existing = db.query(User).filter(User.username == username).first()
-#             if not existing:
-#                 hire_date = datetime.now() - timedelta(days=random.randint(365, 1825))  # 入职1-5年
-#                 user = User(
-#                     username=username,
-#                     email=f"user{i}@example.com",
-#                     hashed_password=f"password{i}",  # 实际应用中应该加密
-#                     full_name=f"员工{i}",
-#                     department=random.choice(departments),
-#                     position=random.choice(positions),
-#                     employee_id=f"EMP{i:04d}",
-#                     hire_date=hire_date,
-#                     is_active=True,
-#                     is_admin=True if i == start_id else False  # 第一个新用户是管理员
-#                 )
-#                 db.add(user)
-#                 added_users += 1
-#         db.commit()
-#         print(f"已添加 {added_users} 条用户数据")
-        
-#         # 3. 添加年假数据
-#         current_year = datetime.now().year
-        
-#         added_annual_leaves = 0
-#         # 获取所有用户
-#         all_users = db.query(User).all()
-#         for user in all_users:
-#             # 检查是否已存在今年的年假记录
-#             existing = db.query(AnnualLeave).filter(
-#                 AnnualLeave.user_id == user.id,
-#                 AnnualLeave.year == current_year
-#             ).first()
-#             if not existing:
-#                 # 根据入职年限计算年假天数 (1-5年每年10天, 5年以上15天)
-#                 hire_years = (datetime.now() - user.hire_date).days // 365
-#                 total_days = 15 if hire_years >= 5 else 10
-#                 used_days = random.uniform(0, total_days * 0.8)  # 使用0-80%的年假
-#                 remaining_days = total_days - used_days
-                
-#                 annual_leave = AnnualLeave(
-#                     user_id=user.id,
-#                     year=current_year,
-#                     total_days=total_days,
-#                     used_days=used_days,
-#                     remaining_days=remaining_days
-#                 )
-#                 db.add(annual_leave)
-#                 added_annual_leaves += 1
-#         db.commit()
-#         print(f"已添加 {added_annual_leaves} 条年假数据")
-        
-#         # 4. 添加请假申请数据
-#         statuses = ["pending", "approved", "rejected"]
-#         reasons = [
-#             "家中有事需要处理",
-#             "身体不适需要休息",
-#             "需要回家探望父母",
-#             "结婚需要请假",
-#             "妻子生产需要陪护",
-#             "亲人去世需要奔丧",
-#             "个人事务需要处理"
-#         ]
-        
-#         # 获取所有用户和请假类型
-#         all_users = db.query(User).all()
-#         all_leave_types = db.query(LeaveType).all()
-        
-#         added_leave_requests = 0
-#         for user in all_users:
-#             # 每个用户最多添加5条请假记录
-#             existing_count = db.query(LeaveRequest).filter(LeaveRequest.user_id == user.id).count()
-#             max_add = 5 - existing_count
-#             if max_add > 0:
-#                 for _ in range(random.randint(1, max_add)):
-#                     # 随机选择请假类型
-#                     leave_type = random.choice(all_leave_types)
-                    
-#                     # 随机生成请假开始和结束日期
-#                     start_date = datetime.now() - timedelta(days=random.randint(1, 365))
-#                     end_date = start_date + timedelta(days=random.randint(1, 5))
-                    
-#                     # 计算请假天数
-#                     days = (end_date - start_date).days + 1
-                    
-#                     # 随机选择状态
-#                     status = random.choice(statuses)
-                    
-#                     # 随机选择审批人 (除了自己)
-#                     approver_id = random.choice([u.id for u in all_users if u.id != user.id])
-                    
-#                     leave_request = LeaveRequest(
-#                         user_id=user.id,
-#                         leave_type_id=leave_type.id,
-#                         start_date=start_date,
-#                         end_date=end_date,
-#                         days=days,
-#                         reason=random.choice(reasons),
-#                         status=status,
-#                         approver_id=approver_id if status != "pending" else None,
-#                         approved_at=datetime.now() if status != "pending" else None,
-#                         ai_recommendation="推荐使用年假" if leave_type.name == "年假" else None,
-#                         ai_recommendation_accepted=random.choice([True, False]) if status != "pending" else False
-#                     )
-#                     db.add(leave_request)
-#                     added_leave_requests += 1
-#         db.commit()
-#         print(f"已添加 {added_leave_requests} 条请假申请数据")
-        
-#                 # 5. 添加公司政策数据
-#         policy_categories = ["请假政策", "福利政策", "考勤政策", "奖惩政策", "培训政策"]
-#         policy_titles = [
-#             "员工请假管理规定", "年度福利计划", "考勤制度实施细则",
-#             "员工奖惩办法", "培训发展计划", "差旅费报销规定",
-#             "绩效考核制度", "保密协议", "劳动合同管理办法"
-#         ]
-#         policy_descriptions = [
-#             "本规定旨在规范员工请假流程，保障公司正常运转和员工合法权益。",
-#             "公司为员工提供全面的福利保障，包括社会保险、商业保险、带薪年假等。",
-#             "为加强公司考勤管理，维护工作秩序，提高工作效率，特制定本细则。",
-#             "为激励员工积极工作，惩处违规行为，维护公司正常的工作秩序。",
-#             "公司重视员工培训与发展，为员工提供丰富的培训机会和发展空间。"
-#         ]
-#         file_types = ["pdf", "doc", "docx", "xls", "xlsx"]
-
-#         added_policies = 0
-#         for i in range(10):
-#             title = random.choice(policy_titles)
-#             # 检查是否已存在
-#             existing = db.query(Policy).filter(Policy.title == title).first()
-#             if not existing:
-#                 policy = Policy(
-#                     title=title,
-#                     description=random.choice(policy_descriptions),
-#                     file_path=f"/policies/policy_{i+1}.{random.choice(file_types)}",
-#                     file_type=random.choice(file_types),
-#                     category=random.choice(policy_categories),
-#                     is_active=random.choice([True, False])
-#                 )
-#                 db.add(policy)
-#                 added_policies += 1
-#         db.commit()
-#         print(f"已添加 {added_policies} 条公司政策数据")
-
-#         # 6. 添加聊天历史记录数据
-#         chat_messages = [
-#             "如何申请年假？",
-#             "请帮我推荐最佳请假方案。",
-#             "我的年假还剩多少天？",
-#             "病假需要提供什么证明？",
-#             "婚假可以请多少天？",
-#             "产假的薪资怎么计算？",
-#             "如何提交请假申请？",
-#             "请假审批需要多长时间？"
-#         ]
-#         chat_responses = [
-#             "您可以通过系统提交年假申请，流程通常需要1-3个工作日审批。",
-#             "根据您的情况，推荐您使用年假，剩余年假天数为5天。",
-#             "查询到您当前剩余年假天数为5天。",
-#             "病假需要提供二级以上医院开具的诊断证明。",
-#             "根据公司规定，婚假为3天，晚婚可额外享受7天。",
-#             "产假期间薪资按照基本工资的80%发放。",
-#             "您可以在系统首页点击'请假申请'按钮提交申请。",
-#             "请假审批通常需要1-3个工作日，紧急情况可联系HR加急处理。"
-#         ]
-
-#         added_chat_histories = 0
-#         # 为部分用户添加聊天记录
-#         for user in random.sample(all_users, min(10, len(all_users))):
-#             # 每个用户添加2-5条聊天记录
-#             for _ in range(random.randint(2, 5)):
-#                 chat_history = ChatHistory(
-#                     user_id=user.id,
-#                     message=random.choice(chat_messages),
-#                     response=random.choice(chat_responses),
-#                     created_at=datetime.now() - timedelta(days=random.randint(1, 90))
-#                 )
-#                 db.add(chat_history)
-#                 added_chat_histories += 1
-#         db.commit()
-#         print(f"已添加 {added_chat_histories} 条聊天历史记录数据")
-
-#         print("测试数据导入完成!")
-#     except Exception as e:
-#         print(f"导入测试数据时出错: {e}")
-#         db.rollback()
-#     finally:
-#         db.close()
-
-# if __name__ == "__main__":
-#     create_test_data()
\ No newline at end of file
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量生成测试数据并导入数据库
+
+按用户分块生成用户、年假、请假记录和聊天记录，每块用批量写入：
+PostgreSQL 用 COPY，SQLite 等其他数据库用 executemany，不经过 ORM。
+几十万用户、几百万条请假记录可以在几分钟内生成，用于在真实规模下检查查询计划、分页和索引。
+
+用户名为 user{编号}，密码为 password{编号}，编号从当前最大用户 id 之后开始。
+密码以明文写入（逐个 bcrypt 哈希太慢），首次登录时自动升级为哈希值。
+随机种子和分块大小固定时，空库上每次生成的数据完全相同。
+
+用法:
+    python generate_test_data.py --users 200 --seed 42
+    DB_URL=sqlite:///./data/bench.db python generate_test_data.py --users 300000 --requests-per-user 10
+"""
+import argparse
+import csv
+import io
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+from sqlalchemy import text
+
+from app.database import init_db, engine, SessionLocal, LeaveType, Policy
+from app.services.leave_balance import rebuild_balances
+from app.services.workday_calendar import get_workday_calendar
+
+departments = ["技术部", "市场部", "人力资源部", "财务部", "销售部", "行政部", "产品部", "客服部"]
+positions = ["经理", "主管", "专员", "助理", "实习生"]
+reasons = [
+    "家中有事需要处理",
+    "身体不适需要休息",
+    "需要回家探望父母",
+    "结婚需要请假",
+    "妻子生产需要陪护",
+    "亲人去世需要奔丧",
+    "个人事务需要处理"
+]
+policy_categories = ["请假政策", "福利政策", "考勤政策", "奖惩政策", "培训政策"]
+policy_titles = [
+    "员工请假管理规定", "年度福利计划", "考勤制度实施细则",
+    "员工奖惩办法", "培训发展计划", "差旅费报销规定",
+    "绩效考核制度", "保密协议", "劳动合同管理办法"
+]
+chat_messages = [
+    "如何申请年假？",
+    "请帮我推荐最佳请假方案。",
+    "我的年假还剩多少天？",
+    "病假需要提供什么证明？",
+    "婚假可以请多少天？",
+    "产假的薪资怎么计算？",
+    "如何提交请假申请？",
+    "请假审批需要多长时间？"
+]
+chat_responses = [
+    "您可以通过系统提交年假申请，流程通常需要1-3个工作日审批。",
+    "根据您的情况，推荐您使用年假，剩余年假天数为5天。",
+    "查询到您当前剩余年假天数为5天。",
+    "病假需要提供二级以上医院开具的诊断证明。",
+    "根据公司规定，婚假为3天，晚婚可额外享受7天。",
+    "产假期间薪资按照基本工资的80%发放。",
+    "您可以在系统首页点击'请假申请'按钮提交申请。",
+    "请假审批通常需要1-3个工作日，紧急情况可联系HR加急处理。"
+]
+
+# 请假状态及其比例
+statuses = np.array(["approved", "pending", "rejected", "cancelled"])
+status_weights = [0.6, 0.15, 0.15, 0.1]
+
+TABLES = ["users", "annual_leaves", "leave_requests", "chat_histories"]
+
+
+class BulkWriter:
+    """批量写入：PostgreSQL 用 COPY，其他数据库用 executemany"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+
+    def write(self, table: str, columns: Sequence[str], rows: List[tuple]) -> None:
+        if not rows:
+            return
+        if self.dialect == "postgresql":
+            self._copy(table, columns, rows)
+        else:
+            self._executemany(table, columns, rows)
+
+    def _copy(self, table: str, columns: Sequence[str], rows: List[tuple]) -> None:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)  # None 写成空字段，COPY 的 CSV 格式按 NULL 处理
+        buffer.seek(0)
+        raw = self.engine.raw_connection()
+        try:
+            with raw.cursor() as cursor:
+                cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+            raw.commit()
+        finally:
+            raw.close()
+
+    def _executemany(self, table: str, columns: Sequence[str], rows: List[tuple]) -> None:
+        placeholder = "?" if self.engine.dialect.paramstyle in ("qmark", "numeric") else "%s"
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join([placeholder] * len(columns))})"
+        with self.engine.begin() as conn:
+            if self.dialect == "sqlite":
+                # 导入期间不等待每次提交刷盘（只影响当前连接）
+                conn.exec_driver_sql("PRAGMA synchronous = OFF")
+            conn.exec_driver_sql(sql, rows)
+
+    def finish(self) -> None:
+        """显式指定了 id，PostgreSQL 需要把自增序列推进到最大 id 之后"""
+        if self.dialect != "postgresql":
+            return
+        with self.engine.begin() as conn:
+            for table in TABLES:
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+                ))
+
+
+def format_times(values: np.ndarray) -> List[str]:
+    """datetime64 数组转成 'YYYY-MM-DD HH:MM:SS.ffffff'，与 SQLAlchemy 在 SQLite 中的存储格式一致"""
+    return np.char.replace(np.datetime_as_string(values.astype("datetime64[us]"), unit="us"), "T", " ").tolist()
+
+
+def max_id(table: str) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {table}")).scalar()
+
+
+def generate_chunk(
+    rng: np.random.Generator,
+    user_ids: np.ndarray,
+    leave_type_ids: np.ndarray,
+    next_ids: Dict[str, int],
+    now: np.datetime64,
+    requests_per_user: float,
+    chats_per_user: float,
+    admin_id: int
+) -> Dict[str, Any]:
+    """生成一块用户及其年假、请假记录和聊天记录，返回各表的行（admin_id 为管理员用户）"""
+    n = len(user_ids)
+    year = int(str(now)[:4])
+    now_text = format_times(np.array([now]))[0]
+
+    # 1. 用户：入职 1-5 年
+    hire_dates = now - rng.integers(365, 1826, n).astype("timedelta64[D]")
+    hire_texts = format_times(hire_dates)
+    department_index = rng.integers(0, len(departments), n)
+    position_index = rng.integers(0, len(positions), n)
+    users = [
+        (
+            int(uid), f"user{uid}", f"user{uid}@example.com", f"password{uid}", f"员工{uid}",
+            departments[department_index[i]], positions[position_index[i]], f"EMP{uid:07d}",
+            hire_texts[i], True, bool(uid == admin_id), now_text, now_text
+        )
+        for i, uid in enumerate(user_ids)
+    ]
+
+    # 2. 年假：入职满 5 年 15 天，否则 10 天；已用天数由请假记录重建台账时同步
+    hire_years = (now - hire_dates).astype("timedelta64[D]").astype(np.int64) // 365
+    totals = np.where(hire_years >= 5, 15.0, 10.0)
+    annual_ids = np.arange(next_ids["annual_leaves"], next_ids["annual_leaves"] + n)
+    annual_leaves = [
+        (int(annual_ids[i]), int(uid), year, float(totals[i]), 0.0, float(totals[i]), now_text, now_text)
+        for i, uid in enumerate(user_ids)
+    ]
+
+    # 3. 请假记录：每个用户的条数服从泊松分布，开始日期落在过去一年内的工作日（按日历的工作日掩码，含调休上班日），
+    #    同一用户的请假依次排开、互不重叠
+    calendar = get_workday_calendar()
+    today = now.astype("datetime64[D]")
+    window = np.arange(today - np.timedelta64(365, "D"), today)
+    workdays = window[calendar.workday_mask(window)]
+    # 每条请假最多占 5 天，条数上限保证一年内排得下
+    counts = np.minimum(rng.poisson(requests_per_user, n), len(workdays) // 5)
+    m = int(counts.sum())
+    owners = np.repeat(user_ids, counts)
+    durations = rng.integers(0, 5, m)
+    # 在工作日序号上排布：每个用户的请假依次占用 durations + 1 个序号，剩余的序号随机分成间隔。
+    # 相邻两条的开始序号至少相差上一条的 durations + 1，对应的日期也至少相差这么多天，因此不会重叠
+    lengths = durations + 1
+    owner_index = np.repeat(np.arange(n), counts)
+    before = np.cumsum(lengths) - lengths
+    before -= before[np.repeat(np.cumsum(counts) - counts, counts)]
+    spans = np.bincount(owner_index, weights=lengths, minlength=n).astype(np.int64)
+    free = len(workdays) - spans[owner_index]
+    offsets = np.floor(rng.random(m) * (free + 1)).astype(np.int64)
+    offsets = offsets[np.lexsort((offsets, owner_index))]
+    starts = workdays[offsets + before]
+    ends = starts + durations.astype("timedelta64[D]")
+    days = calendar.count_batch(starts, ends)
+    created = starts - rng.integers(1, 15, m).astype("timedelta64[D]") + rng.integers(0, 86400, m).astype("timedelta64[s]")
+    request_statuses = statuses[rng.choice(len(statuses), m, p=status_weights)]
+    request_types = leave_type_ids[rng.integers(0, len(leave_type_ids), m)]
+    reason_index = rng.integers(0, len(reasons), m)
+    approver_ids = rng.choice(user_ids, m)
+    start_texts, end_texts, created_texts = format_times(starts), format_times(ends), format_times(created)
+    request_ids = np.arange(next_ids["leave_requests"], next_ids["leave_requests"] + m)
+    leave_requests = []
+    for i in range(m):
+        reviewed = request_statuses[i] in ("approved", "rejected")
+        leave_requests.append((
+            int(request_ids[i]), int(owners[i]), int(request_types[i]), start_texts[i], end_texts[i],
+            float(days[i]), reasons[reason_index[i]], str(request_statuses[i]),
+            int(approver_ids[i]) if reviewed else None, created_texts[i] if reviewed else None,
+            None, False, created_texts[i], created_texts[i]
+        ))
+
+    # 4. 聊天记录：过去 90 天内
+    chat_counts = rng.poisson(chats_per_user, n)
+    k = int(chat_counts.sum())
+    chat_owners = np.repeat(user_ids, chat_counts)
+    chat_times = format_times(now - rng.integers(0, 90 * 86400, k).astype("timedelta64[s]"))
+    message_index = rng.integers(0, len(chat_messages), k)
+    chat_ids = np.arange(next_ids["chat_histories"], next_ids["chat_histories"] + k)
+    chat_histories = [
+        (int(chat_ids[i]), int(chat_owners[i]), chat_messages[message_index[i]], chat_responses[message_index[i]], chat_times[i])
+        for i in range(k)
+    ]
+
+    next_ids["annual_leaves"] += n
+    next_ids["leave_requests"] += m
+    next_ids["chat_histories"] += k
+    return {
+        "users": users,
+        "annual_leaves": annual_leaves,
+        "leave_requests": leave_requests,
+        "chat_histories": chat_histories
+    }
+
+
+COLUMNS = {
+    "users": [
+        "id", "username", "email", "hashed_password", "full_name", "department", "position",
+        "employee_id", "hire_date", "is_active", "is_admin", "created_at", "updated_at"
+    ],
+    "annual_leaves": ["id", "user_id", "year", "total_days", "used_days", "remaining_days", "created_at", "updated_at"],
+    "leave_requests": [
+        "id", "user_id", "leave_type_id", "start_date", "end_date", "days", "reason", "status",
+        "approver_id", "approved_at", "ai_recommendation", "ai_recommendation_accepted", "created_at", "updated_at"
+    ],
+    "chat_histories": ["id", "user_id", "message", "response", "created_at"],
+}
+
+
+def seed_policies() -> None:
+    """添加几条政策元数据（文件不存在，不参与知识库索引）"""
+    db = SessionLocal()
+    try:
+        if db.query(Policy).count() == 0:
+            db.add_all([
+                Policy(
+                    title=title,
+                    description=f"{title}（测试数据）",
+                    file_path=f"/policies/policy_{i + 1}.pdf",
+                    file_type="pdf",
+                    category=policy_categories[i % len(policy_categories)],
+                    is_active=False
+                )
+                for i, title in enumerate(policy_titles)
+            ])
+            db.commit()
+    finally:
+        db.close()
+
+
+def create_test_data(
+    users: int = 20,
+    requests_per_user: float = 3.0,
+    chats_per_user: float = 3.0,
+    chunk_size: int = 10000,
+    seed: int = 42,
+    rebuild: bool = True
+) -> Dict[str, int]:
+    """分块批量生成测试数据，返回各表新增行数"""
+    init_db()
+    seed_policies()
+    writer = BulkWriter(engine)
+
+    db = SessionLocal()
+    try:
+        leave_type_ids = np.array([lt.id for lt in db.query(LeaveType).order_by(LeaveType.id)], dtype=np.int64)
+    finally:
+        db.close()
+
+    # 以固定日期为基准，同一种子在不同日期生成的数据也相同
+    now = np.datetime64(f"{datetime.now().year}-06-30T12:00:00", "s")
+    first_user = max_id("users") + 1
+    next_ids = {table: max_id(table) + 1 for table in ("annual_leaves", "leave_requests", "chat_histories")}
+    totals = {table: 0 for table in TABLES}
+
+    start = time.perf_counter()
+    for chunk_index, offset in enumerate(range(0, users, chunk_size)):
+        rng = np.random.default_rng([seed, chunk_index])
+        user_ids = np.arange(first_user + offset, first_user + min(offset + chunk_size, users), dtype=np.int64)
+        rows = generate_chunk(
+            rng, user_ids, leave_type_ids, next_ids, now, requests_per_user, chats_per_user, admin_id=first_user
+        )
+        # 按外键依赖顺序写入
+        for table in TABLES:
+            writer.write(table, COLUMNS[table], rows[table])
+            totals[table] += len(rows[table])
+        print(f"已写入 {offset + len(user_ids)}/{users} 个用户，"
+              f"请假记录 {totals['leave_requests']} 条，用时 {time.perf_counter() - start:.1f} 秒")
+    writer.finish()
+
+    if rebuild:
+        db = SessionLocal()
+        try:
+            stats = rebuild_balances(db)
+            print(f"已重建额度台账，共 {stats['rows']} 行")
+        finally:
+            db.close()
+
+    print(f"测试数据导入完成! {totals}")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量生成测试数据并导入数据库")
+    parser.add_argument("--users", type=int, default=20, help="新增用户数")
+    parser.add_argument("--requests-per-user", type=float, default=3.0, help="每个用户平均的请假记录数")
+    parser.add_argument("--chats-per-user", type=float, default=3.0, help="每个用户平均的聊天记录数")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="每块的用户数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--no-rebuild", action="store_true", help="不重建请假额度台账")
+    args = parser.parse_args()
+    create_test_data(
+        users=args.users,
+        requests_per_user=args.requests_per_user,
+        chats_per_user=args.chats_per_user,
+        chunk_size=args.chunk_size,
+        seed=args.seed,
+        rebuild=not args.no_rebuild
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量导入政策文件
+
+扫描目录下的政策文件，登记到 policies 表，并用多进程流水线解析、分块、嵌入，
+最后写入知识库快照。API 进程下次启动时直接加载快照，不会再解析这些文件。
+
+用法:
+    python import_policies.py ./regulations --category 请假政策 --workers 8
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from typing import List, Optional
+
+from app.config import settings
+from app.database import init_db, SessionLocal, Policy
+from app.rag.ingest import SUPPORTED_EXTENSIONS
+from app.rag.knowledge_base import index_policies, save_knowledge_base
+
+def collect_files(directory: str, recursive: bool = True) -> List[str]:
+    """收集目录下所有支持的政策文件"""
+    files = []
+    if recursive:
+        for root, _, names in os.walk(directory):
+            for name in names:
+                files.append(os.path.join(root, name))
+    else:
+        files = [os.path.join(directory, name) for name in os.listdir(directory)]
+    return sorted(
+        path for path in files
+        if os.path.isfile(path) and os.path.splitext(path)[1].lower() in SUPPORTED_EXTENSIONS
+    )
+
+def register_policies(db, directory: str, files: List[str], category: Optional[str], copy: bool) -> List[Policy]:
+    """为每个文件创建或复用一条政策记录，一次提交"""
+    existing = {policy.file_path: policy for policy in db.query(Policy).all()}
+    policies = []
+    for path in files:
+        rel_path = os.path.relpath(path, directory)
+        file_path = path
+        if copy:
+            file_path = os.path.join(settings.POLICY_DIR, rel_path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            shutil.copyfile(path, file_path)
+
+        policy = existing.get(file_path)
+        if policy is None:
+            parent = os.path.basename(os.path.dirname(rel_path))
+            policy = Policy(
+                title=os.path.splitext(os.path.basename(path))[0],
+                description=f"批量导入: {rel_path}",
+                file_path=file_path,
+                file_type=os.path.splitext(path)[1].lower()[1:],
+                category=category or parent or "导入",
+                is_active=True
+            )
+            db.add(policy)
+        else:
+            policy.is_active = True
+        policies.append(policy)
+
+    db.commit()
+    return policies
+
+def main():
+    parser = argparse.ArgumentParser(description="批量导入政策文件到知识库")
+    parser.add_argument("directory", help="政策文件所在目录")
+    parser.add_argument("--category", help="政策分类，默认使用文件所在子目录名")
+    parser.add_argument("--workers", type=int, default=None, help="解析进程数，默认为 CPU 核数")
+    parser.add_argument("--max-pending", type=int, default=None, help="最大在途文件数，默认为进程数的 2 倍")
+    parser.add_argument("--no-recursive", action="store_true", help="不递归扫描子目录")
+    parser.add_argument("--copy", action="store_true", help=f"先把文件复制到 POLICY_DIR ({settings.POLICY_DIR})")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"目录不存在: {args.directory}")
+
+    init_db()
+    files = collect_files(args.directory, recursive=not args.no_recursive)
+    print(f"发现 {len(files)} 个政策文件")
+
+    start = time.perf_counter()
+    db = SessionLocal()
+    try:
+        policies = register_policies(db, args.directory, files, args.category, args.copy)
+        stats = index_policies(policies, max_workers=args.workers, max_pending=args.max_pending)
+    finally:
+        db.close()
+
+    save_knowledge_base()
+    stats["files"] = len(files)
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    print(json.dumps(stats, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,12 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
-from app.database import init_db
+from app.database import init_db, get_pool_stats, close_async_engine
+from app.rag.knowledge_base import init_knowledge_base, save_knowledge_base
+from app.rag.llm_gateway import close_llm_gateway, get_gateway_stats
+from app.services.chat_history import chat_history_writer
+from app.services.leave_intervals import leave_interval_index
+from app.services.passwords import password_hasher
 from app.api.routes import router as api_router
 
 # 初始化FastAPI应用
@@ -19,6 +24,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # 注册API路由
@@ -33,6 +39,17 @@ async def startup_event():
     print("开始初始化数据库...")
     init_db()
     print("数据库初始化完成")
+    init_knowledge_base()
+    chat_history_writer.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时写完排队的聊天记录，保存知识库快照，关闭大模型、密码哈希线程池和数据库连接池"""
+    await chat_history_writer.stop()
+    save_knowledge_base()
+    await close_llm_gateway()
+    password_hasher.shutdown()
+    await close_async_engine()
 
 @app.get("/")
 async def root():
@@ -44,6 +61,17 @@ async def health_check():
     """健康检查接口"""
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def metrics():
+    """运行指标：数据库连接池、大模型网关、聊天记录写入队列、请假区间索引和密码哈希线程池的统计"""
+    return {
+        "db_pool": get_pool_stats(),
+        "llm_gateway": get_gateway_stats(),
+        "chat_history_writer": chat_history_writer.get_stats(),
+        "leave_intervals": leave_interval_index.stats(),
+        "password_hasher": password_hasher.get_stats()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
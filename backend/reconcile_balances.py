@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+请假额度台账对账
+
+按请假记录重新汇总每个员工、每种请假类型、每年的已批准和待审批天数，
+修正与台账不一致的行，并同步 AnnualLeave 的已用和剩余天数。
+台账在提交、审批、取消时增量维护，这个脚本用于定期对账或手工修改数据之后修复。
+
+用法:
+    python reconcile_balances.py
+    python reconcile_balances.py --year 2025 --user-id 1 --user-id 2
+"""
+import argparse
+import json
+import time
+
+from app.database import init_db, SessionLocal
+from app.services.leave_balance import rebuild_balances
+
+def main():
+    parser = argparse.ArgumentParser(description="从请假记录重建请假额度台账")
+    parser.add_argument("--user-id", type=int, action="append", dest="user_ids", help="只对账指定员工，可重复")
+    parser.add_argument("--year", type=int, help="只对账指定年份")
+    args = parser.parse_args()
+
+    init_db()
+    start = time.perf_counter()
+    db = SessionLocal()
+    try:
+        stats = rebuild_balances(db, user_ids=args.user_ids, year=args.year)
+    finally:
+        db.close()
+
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    print(json.dumps(stats, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
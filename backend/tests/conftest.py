@@ -0,0 +1,79 @@
+"""测试公共配置
+
+导入应用之前切换到临时目录并指定临时 SQLite 数据库，测试不读取 backend/.env，
+不访问真实的数据库和大模型接口（未配置大模型时问答走模拟回答）。
+"""
+import itertools
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix="leave-tests-")
+os.chdir(WORK_DIR)
+# main.py 在导入时挂载 ./policies
+os.makedirs("policies", exist_ok=True)
+os.environ.update({
+    "DB_URL": f"sqlite:///{WORK_DIR}/test.db",
+    "DB_PORT": "5432",
+    "OPENAI_API_KEY": "",
+    "OPENAI_API_BASE": "",
+    "PASSWORD_HASH_ROUNDS": "4",
+})
+sys.path.insert(0, BACKEND_DIR)
+
+import pytest
+from fastapi.testclient import TestClient
+
+_user_ids = itertools.count(1000)
+
+
+@pytest.fixture(scope="session")
+def client():
+    """启动一次应用（执行 startup 事件），所有测试共用"""
+    import main
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def make_user(client):
+    """创建一个员工，返回 user_id；密码为明文 password{user_id}"""
+    from app.database import SessionLocal, User
+
+    def make(department: str = "研发部", is_admin: bool = False) -> int:
+        user_id = next(_user_ids)
+        db = SessionLocal()
+        try:
+            db.add(User(
+                id=user_id,
+                username=f"user{user_id}",
+                email=f"user{user_id}@example.com",
+                hashed_password=f"password{user_id}",
+                full_name=f"员工{user_id}",
+                department=department,
+                is_admin=is_admin
+            ))
+            db.commit()
+        finally:
+            db.close()
+        return user_id
+
+    return make
+
+
+@pytest.fixture
+def auth_headers(client):
+    """为员工签发访问令牌，返回请求头"""
+    from app.database import SessionLocal, User
+    from app.services.auth import create_access_token
+
+    def headers(user_id: int) -> dict:
+        db = SessionLocal()
+        try:
+            token = create_access_token(db.get(User, user_id))
+        finally:
+            db.close()
+        return {"Authorization": f"Bearer {token}"}
+
+    return headers
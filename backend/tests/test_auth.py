@@ -0,0 +1,80 @@
+import pytest
+
+
+def apply(client, user_id: int, start_date: str, headers):
+    response = client.post("/api/leave/apply", headers=headers, json={
+        "user_id": user_id, "leave_type_id": 3, "start_date": start_date, "end_date": start_date, "reason": "事"
+    })
+    assert response.status_code == 200
+    return response.json()["leave_request"]["id"]
+
+
+def test_cancel_requires_login(client, make_user, auth_headers):
+    user_id = make_user()
+    leave_id = apply(client, user_id, "2032-01-05", auth_headers(user_id))
+    assert client.post(f"/api/leaves/{leave_id}/cancel").status_code == 401
+    assert client.post("/api/leaves/bulk/cancel", json={"ids": [leave_id]}).status_code == 401
+
+
+def test_cancel_only_own_leave_unless_admin(client, make_user, auth_headers):
+    owner, other, admin = make_user(), make_user(), make_user(is_admin=True)
+    first = apply(client, owner, "2032-01-12", auth_headers(owner))
+    second = apply(client, owner, "2032-01-13", auth_headers(owner))
+
+    response = client.post(f"/api/leaves/{first}/cancel", headers=auth_headers(other))
+    assert response.status_code == 403
+
+    response = client.post("/api/leaves/bulk/cancel", json={"ids": [first, second]}, headers=auth_headers(other))
+    assert response.status_code == 200
+    assert response.json()["updated"] == []
+    assert [item["id"] for item in response.json()["skipped"]] == [first, second]
+
+    response = client.post(f"/api/leaves/{first}/cancel", headers=auth_headers(owner))
+    assert response.status_code == 200
+    assert response.json()["leave_request"]["status"] == "cancelled"
+
+    response = client.post("/api/leaves/bulk/cancel", json={"ids": [second]}, headers=auth_headers(admin))
+    assert [item["id"] for item in response.json()["updated"]] == [second]
+
+
+@pytest.mark.parametrize("method, path, body", [
+    ("post", "/api/leave/apply", lambda uid, day: {
+        "user_id": uid, "leave_type_id": 3, "start_date": f"2032-02-{day:02d}", "end_date": f"2032-02-{day:02d}",
+        "reason": "事"
+    }),
+    ("get", "/api/leave/requests/{uid}", None),
+    ("get", "/api/chat/history/{uid}", None),
+    ("post", "/api/chat/history/{uid}/clear", None),
+    ("post", "/api/leave/recommend/batch", lambda uid, day: {
+        "items": [{"user_id": uid, "start_date": f"2032-02-{day:02d}", "end_date": f"2032-02-{day:02d}", "reason": "事"}]
+    }),
+])
+def test_user_routes_reject_other_users_token(client, make_user, auth_headers, method, path, body):
+    owner, other, admin = make_user(), make_user(), make_user(is_admin=True)
+    url = path.format(uid=owner)
+
+    def call(headers, day):
+        kwargs = {"json": body(owner, day)} if body else {}
+        return getattr(client, method)(url, headers=headers, **kwargs).status_code
+
+    assert call(None, 1) == 401
+    assert call(auth_headers(other), 2) == 403
+    # 本人和管理员可以访问（每次换一天，避免重复申请被判定为重叠）
+    assert call(auth_headers(owner), 3) == 200
+    assert call(auth_headers(admin), 4) == 200
+
+
+@pytest.mark.parametrize("method, path, kwargs", [
+    ("post", "/api/policies/upload", {
+        "data": {"title": "t", "description": "d", "category": "c"},
+        "files": {"file": ("policy.txt", "内容".encode("utf-8"), "text/plain")}
+    }),
+    ("put", "/api/policies/999999", {"json": {"title": "t"}}),
+    ("delete", "/api/policies/999999", {}),
+])
+def test_policy_changes_require_admin(client, make_user, auth_headers, method, path, kwargs):
+    call = getattr(client, method)
+    assert call(path, **kwargs).status_code == 401
+    assert call(path, headers=auth_headers(make_user()), **kwargs).status_code == 403
+    if method != "post":
+        assert call(path, headers=auth_headers(make_user(is_admin=True)), **kwargs).status_code == 404
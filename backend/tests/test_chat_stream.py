@@ -0,0 +1,68 @@
+import json
+import time
+
+from app.database import ChatHistory, SessionLocal
+
+
+def parse_sse(body: str):
+    """把 SSE 响应体解析为 [(事件名, 数据), ...]"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def count_history(user_id: int) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(ChatHistory).filter(ChatHistory.user_id == user_id).count()
+    finally:
+        db.close()
+
+
+def test_stream_sends_sources_then_tokens_then_done(client, make_user, auth_headers):
+    user_id = make_user()
+    with client.stream(
+        "POST", "/api/chat/stream", headers=auth_headers(user_id), json={"user_id": user_id, "message": "年假有几天？"}
+    ) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = parse_sse("".join(response.iter_text()))
+
+    names = [name for name, _ in events]
+    assert names[0] == "sources"
+    assert names[-1] == "done"
+    assert len(names) > 2 and set(names[1:-1]) == {"token"}
+    assert isinstance(events[0][1], list)
+    tokens = "".join(data for name, data in events if name == "token")
+    assert events[-1][1]["result"] == tokens
+
+
+def test_stream_saves_one_history_row_after_completion(client, make_user, auth_headers):
+    user_id = make_user()
+    with client.stream(
+        "POST", "/api/chat/stream", headers=auth_headers(user_id), json={"user_id": user_id, "message": "病假需要什么证明？"}
+    ) as response:
+        events = parse_sse("".join(response.iter_text()))
+
+    # 聊天记录由后台写入器批量落库，等待一次刷新
+    deadline = time.monotonic() + 5
+    while count_history(user_id) == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.3)
+    assert count_history(user_id) == 1
+
+    db = SessionLocal()
+    try:
+        row = db.query(ChatHistory).filter(ChatHistory.user_id == user_id).one()
+    finally:
+        db.close()
+    assert row.message == "病假需要什么证明？"
+    assert row.response == events[-1][1]["result"]
+
+
+def test_stream_unknown_user_is_404(client, make_user, auth_headers):
+    admin = make_user(is_admin=True)
+    response = client.post("/api/chat/stream", headers=auth_headers(admin), json={"user_id": 999999, "message": "hi"})
+    assert response.status_code == 404
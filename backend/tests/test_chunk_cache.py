@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from app.rag.chunk_cache import ChunkCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ChunkCache(str(tmp_path), dim=8)
+
+
+def snapshot(cache: ChunkCache) -> str:
+    path = cache.new_snapshot_dir()
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        f.write("{}")
+    return path
+
+
+def listing(cache: ChunkCache):
+    return sorted(name for name in os.listdir(cache.root) if "index-" in name or name.startswith(".building-"))
+
+
+def test_publish_keeps_replaced_snapshot_and_removes_older_ones(cache):
+    first = cache.publish_snapshot(snapshot(cache))
+    assert cache.snapshot_dir() == first
+
+    second = cache.publish_snapshot(snapshot(cache))
+    assert cache.snapshot_dir() == second
+    assert os.path.isdir(first)  # 被替换的快照保留，可能有进程刚读到指针
+
+    third = cache.publish_snapshot(snapshot(cache))
+    assert cache.snapshot_dir() == third
+    assert not os.path.exists(first)
+    assert os.path.isdir(second)
+
+
+def test_publish_never_removes_snapshots_of_other_workers(cache):
+    initial = cache.publish_snapshot(snapshot(cache))
+    # 另一个 worker 先创建、还在写入的快照
+    building = snapshot(cache)
+    # 两个 worker 几乎同时保存：后创建的先发布，先创建的后发布
+    older = snapshot(cache)
+    newer = snapshot(cache)
+    newer_published = cache.publish_snapshot(newer)
+    older_published = cache.publish_snapshot(older)
+
+    assert cache.snapshot_dir() == older_published
+    assert os.path.isdir(newer_published)
+    assert os.path.isdir(building)
+    # 只删除比被替换快照更旧的已发布快照
+    assert not os.path.exists(initial)
+    assert len(listing(cache)) == 3
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base, SessionLocal, User, AnnualLeave, LeaveRequest, LeaveType
+from app.rag.leave_recommender import LeaveRecommender
+from app.services.leave_catalog import leave_type_catalog
+
+HISTORY_ROWS = 25
+
+
+@pytest.fixture
+def memory_db():
+    """独立的内存 SQLite 库：用户 1 没有请假记录，用户 2 有 HISTORY_ROWS 条"""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    now = datetime.now()
+    # 用 Core 插入种子数据，不触发 ORM 写入钩子，避免污染进程内的区间索引
+    with engine.begin() as conn:
+        conn.execute(LeaveType.__table__.insert(), [
+            {"id": 1, "name": "年假", "max_days": 15},
+            {"id": 2, "name": "事假", "max_days": 10}
+        ])
+        conn.execute(User.__table__.insert(), [
+            {"id": i, "username": f"u{i}", "email": f"u{i}@example.com", "hashed_password": "x",
+             "full_name": f"员工{i}", "department": "研发部", "hire_date": now}
+            for i in (1, 2)
+        ])
+        conn.execute(AnnualLeave.__table__.insert(), [
+            {"user_id": i, "year": now.year, "total_days": 10, "used_days": 0, "remaining_days": 10}
+            for i in (1, 2)
+        ])
+        conn.execute(LeaveRequest.__table__.insert(), [
+            {"user_id": 2, "leave_type_id": 1 + i % 2, "start_date": now + timedelta(days=2 * i),
+             "end_date": now + timedelta(days=2 * i), "days": 1, "reason": "测试",
+             "status": "approved" if i % 2 else "pending"}
+            for i in range(HISTORY_ROWS)
+        ])
+
+    session = sessionmaker(bind=engine)()
+    leave_type_catalog.load(session)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    try:
+        yield session, statements
+    finally:
+        session.close()
+        engine.dispose()
+        # 换回测试库的请假类型（失效后在后台重新加载，这里同步加载，避免后续测试读到内存库的数据）
+        db = SessionLocal()
+        try:
+            leave_type_catalog.load(db)
+        finally:
+            db.close()
+
+
+def count_statements(statements, func):
+    statements.clear()
+    result = func()
+    return result, len(statements)
+
+
+def test_statement_count_does_not_grow_with_history(memory_db):
+    session, statements = memory_db
+    recommender = LeaveRecommender()
+
+    empty, empty_count = count_statements(statements, lambda: recommender.get_employee_info(session, 1))
+    session.expunge_all()
+    full, full_count = count_statements(statements, lambda: recommender.get_employee_info(session, 2))
+
+    assert empty["leave_history"] == []
+    assert len(full["leave_history"]) == HISTORY_ROWS
+    assert {item["leave_type"] for item in full["leave_history"]} == {"年假", "事假"}
+    assert empty_count == full_count == 2
+
+
+def test_cached_profile_skips_user_query(memory_db):
+    session, statements = memory_db
+    recommender = LeaveRecommender()
+    profile = {"id": 2, "full_name": "员工2", "department": "研发部", "position": None,
+               "hire_date": None, "employee_id": None}
+
+    info, count = count_statements(statements, lambda: recommender.get_employee_info(session, 2, profile))
+
+    assert len(info["leave_history"]) == HISTORY_ROWS
+    assert count == 2
+    assert not any("FROM users" in sql for sql in statements)
@@ -0,0 +1,67 @@
+from datetime import datetime
+
+from app.database import LeaveRequest, SessionLocal, engine
+
+
+def apply(client, headers, user_id: int, start_date: str, end_date: str):
+    return client.post("/api/leave/apply", headers=headers(user_id), json={
+        "user_id": user_id, "leave_type_id": 3, "start_date": start_date, "end_date": end_date, "reason": "事"
+    })
+
+
+def test_overlapping_leave_is_rejected(client, make_user, auth_headers):
+    user_id = make_user()
+    assert apply(client, auth_headers, user_id, "2031-05-05", "2031-05-07").status_code == 200
+    response = apply(client, auth_headers, user_id, "2031-05-07", "2031-05-08")
+    assert response.status_code == 409
+    assert "2031-05-05 至 2031-05-07" in response.json()["detail"]
+
+
+def test_leave_committed_outside_the_index_is_still_rejected(client, make_user, auth_headers):
+    # 模拟其他进程刚提交、或早于 lookback 窗口的请假：直接写表，不经过 ORM 钩子，进程内索引看不到
+    user_id = make_user()
+    with engine.begin() as conn:
+        conn.execute(LeaveRequest.__table__.insert(), {
+            "user_id": user_id, "leave_type_id": 3, "start_date": datetime(2031, 6, 2),
+            "end_date": datetime(2031, 6, 4), "days": 3, "reason": "事", "status": "approved"
+        })
+
+    response = apply(client, auth_headers, user_id, "2031-06-04", "2031-06-05")
+    assert response.status_code == 409
+    assert "2031-06-02 至 2031-06-04" in response.json()["detail"]
+
+    assert apply(client, auth_headers, user_id, "2031-06-05", "2031-06-06").status_code == 200
+    db = SessionLocal()
+    try:
+        assert db.query(LeaveRequest).filter(LeaveRequest.user_id == user_id).count() == 2
+    finally:
+        db.close()
+
+
+def test_batch_recommend_isolates_bad_items(client, make_user, auth_headers):
+    admin = make_user(is_admin=True)
+    user_id = make_user()
+    response = client.post("/api/leave/recommend/batch", headers=auth_headers(admin), json={"items": [
+        {"user_id": user_id, "start_date": "2031-05-05", "end_date": "2031-05-06", "reason": "事"},
+        {"user_id": user_id, "start_date": "2031-05-10", "end_date": "2031-05-05", "reason": "事"},
+        {"user_id": user_id, "start_date": "2031/05/05", "end_date": "2031-05-06", "reason": "事"},
+        {"user_id": user_id, "reason": "事"},
+    ]})
+    assert response.status_code == 200
+    first, reversed_item, bad_format, missing = response.json()["results"]
+    assert "error" not in first and first["recommendations"]
+    assert "结束日期不能早于开始日期" in reversed_item["error"]
+    assert "YYYY-MM-DD" in bad_format["error"]
+    assert "error" in missing
+
+
+def test_reversed_range_is_rejected_before_conflict_check(client, make_user, auth_headers):
+    user_id = make_user()
+    response = apply(client, auth_headers, user_id, "2031-07-10", "2031-07-05")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "结束日期不能早于开始日期"
+    db = SessionLocal()
+    try:
+        assert db.query(LeaveRequest).filter(LeaveRequest.user_id == user_id).count() == 0
+    finally:
+        db.close()
@@ -0,0 +1,38 @@
+import threading
+import time
+
+from app.database import SessionLocal
+from app.services import leave_catalog
+from app.services.leave_catalog import LeaveTypeCatalog
+
+
+def test_stale_catalog_is_served_while_reloading_in_background(client, monkeypatch):
+    catalog = LeaveTypeCatalog(ttl=300)
+    db = SessionLocal()
+    try:
+        catalog.load(db)
+    finally:
+        db.close()
+    names = [lt["name"] for lt in catalog.all()]
+
+    # 重新加载在后台线程中进行：调用方线程上打开会话就失败
+    caller = threading.current_thread()
+    opened = []
+    session_local = leave_catalog.SessionLocal
+
+    def tracking_session_local():
+        assert threading.current_thread() is not caller, "调用方线程上不应查询数据库"
+        opened.append(threading.current_thread().name)
+        return session_local()
+    monkeypatch.setattr(leave_catalog, "SessionLocal", tracking_session_local)
+
+    version = catalog.version
+    catalog.invalidate()
+    assert [lt["name"] for lt in catalog.all()] == names
+    for _ in range(100):
+        if catalog.version > version and not catalog._reloading:
+            break
+        time.sleep(0.02)
+    assert catalog.version == version + 1
+    assert opened == ["leave-type-reload"]
+    assert not catalog._stale
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from app.database import SessionLocal, User, engine
+from app.services import leave_intervals
+from app.services.leave_intervals import LeaveIntervalIndex, leave_interval_index
+
+
+def forbid_new_sessions(monkeypatch):
+    def session_local():
+        raise AssertionError("调用方线程上不应另开数据库会话")
+    monkeypatch.setattr(leave_intervals, "SessionLocal", session_local)
+
+
+def test_commit_hook_resolves_unknown_user_without_new_session(client, auth_headers, monkeypatch):
+    # 直接写表的员工不在索引中（相当于其他进程新建的员工），部门在登记变更时用本事务的连接查询
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), {
+            "id": 5201, "username": "intervals5201", "email": "intervals5201@example.com",
+            "hashed_password": "x", "department": "外部新建部门"
+        })
+    assert leave_interval_index.known_department(5201) == (False, None)
+
+    headers = auth_headers(5201)
+    forbid_new_sessions(monkeypatch)
+    response = client.post("/api/leave/apply", headers=headers, json={
+        "user_id": 5201, "leave_type_id": 3, "start_date": "2031-08-05", "end_date": "2031-08-05", "reason": "事"
+    })
+    assert response.status_code == 200
+    assert leave_interval_index.known_department(5201) == (True, "外部新建部门")
+    absences = leave_interval_index.department_absences("外部新建部门", "2031-08-01", "2031-08-31")
+    assert [a["user_id"] for a in absences] == [5201]
+
+
+def test_stale_index_reloads_in_background_and_replays_changes(client, make_user, monkeypatch):
+    index = LeaveIntervalIndex(ttl=300)
+    db = SessionLocal()
+    try:
+        index.load(db)
+    finally:
+        db.close()
+
+    # 后台加载卡在查询快照之前，期间提交的变更应在切换后保留
+    release = threading.Event()
+    load = index._load
+
+    def slow_load(db):
+        release.wait(5)
+        load(db)
+    monkeypatch.setattr(index, "_load", slow_load)
+
+    user_id = make_user(department="重放测试部")
+    index.invalidate()
+    started = time.perf_counter()
+    assert index.user_conflicts(user_id, "2031-09-01", "2031-09-03") == []
+    assert time.perf_counter() - started < 1  # 没有等待重新加载
+
+    index.apply(900001, user_id, "重放测试部", "2031-09-02", "2031-09-02", "pending")
+    release.set()
+    for _ in range(100):
+        if not index._reloading:
+            break
+        time.sleep(0.05)
+    assert not index._reloading and not index._stale
+    assert [c["id"] for c in index.user_conflicts(user_id, "2031-09-01", "2031-09-03")] == [900001]
+
+
+def test_concurrent_cold_starts_load_once(monkeypatch):
+    index = LeaveIntervalIndex(ttl=300)
+    loads = []
+    load = index._load
+
+    def slow_load(db):
+        loads.append(threading.current_thread().name)
+        time.sleep(0.2)
+        load(db)
+    monkeypatch.setattr(index, "_load", slow_load)
+
+    threads = [threading.Thread(target=index.ensure_fresh) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1
+    assert index._loaded_at is not None
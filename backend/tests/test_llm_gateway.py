@@ -0,0 +1,140 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.rag.llm_gateway import LLMGateway, LLMGatewayError
+
+
+class StubUpstream:
+    """本地的 OpenAI 兼容桩服务，按顺序返回预设的响应
+
+    responses 中每项为 (状态码, 响应体)；响应体为列表时按 SSE 逐条发送。
+    """
+
+    def __init__(self, responses, delay: float = 0.0):
+        self.responses = list(responses)
+        self.delay = delay
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                stub.requests.append(json.loads(body))
+                status, payload = stub.responses.pop(0) if len(stub.responses) > 1 else stub.responses[0]
+                time.sleep(stub.delay)
+                if isinstance(payload, list):
+                    self.send_response(status)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    for chunk in payload:
+                        self.wfile.write(f"data: {chunk}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                    return
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def completion(content: str) -> dict:
+    return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+
+def delta(content: str) -> str:
+    return json.dumps({"choices": [{"delta": {"content": content}}]}, ensure_ascii=False)
+
+
+async def run_with_gateway(upstream: StubUpstream, coro_factory, **kwargs):
+    gateway = LLMGateway(upstream.url, api_key="test", backoff_base=0.01, **kwargs)
+    try:
+        return gateway, await coro_factory(gateway)
+    finally:
+        await gateway.aclose()
+
+
+async def collect(gateway: LLMGateway):
+    return [token async for token in gateway.stream_chat([{"role": "user", "content": "你好"}])]
+
+
+def test_retries_retryable_status_then_succeeds():
+    with StubUpstream([(503, {"error": "busy"}), (200, completion("好的"))]) as upstream:
+        gateway, answer = asyncio.run(run_with_gateway(
+            upstream, lambda g: g.chat([{"role": "user", "content": "你好"}])
+        ))
+    assert answer == "好的"
+    assert len(upstream.requests) == 2
+    assert gateway.stats["retries"] == 1
+    assert gateway.stats["failures"] == 0
+
+
+def test_client_error_is_not_retried_and_counted():
+    with StubUpstream([(400, {"error": "bad request"})]) as upstream:
+        gateway = LLMGateway(upstream.url, api_key="test", backoff_base=0.01)
+        with pytest.raises(LLMGatewayError):
+            asyncio.run(gateway.chat([{"role": "user", "content": "你好"}]))
+    assert len(upstream.requests) == 1
+    assert gateway.stats["failures"] == 1
+
+
+def test_identical_concurrent_calls_share_one_request():
+    async def call_many(gateway):
+        messages = [{"role": "user", "content": "年假有几天？"}]
+        return await asyncio.gather(*(gateway.chat(messages) for _ in range(5)))
+
+    with StubUpstream([(200, completion("5 天"))], delay=0.2) as upstream:
+        gateway, answers = asyncio.run(run_with_gateway(upstream, call_many))
+    assert answers == ["5 天"] * 5
+    assert len(upstream.requests) == 1
+    assert gateway.stats["coalesced"] == 4
+
+
+def test_stream_yields_tokens_until_done():
+    chunks = [delta("年假"), delta("5"), delta("天"), "[DONE]"]
+    with StubUpstream([(503, {"error": "busy"}), (200, chunks)]) as upstream:
+        gateway, tokens = asyncio.run(run_with_gateway(upstream, collect))
+    assert tokens == ["年假", "5", "天"]
+    assert upstream.requests[-1]["stream"] is True
+    assert gateway.stats["retries"] == 1
+
+
+def test_stream_malformed_chunk_raises_gateway_error():
+    chunks = [delta("年假"), "{not json", "[DONE]"]
+    with StubUpstream([(200, chunks)]) as upstream:
+        gateway = LLMGateway(upstream.url, api_key="test", backoff_base=0.01)
+        with pytest.raises(LLMGatewayError):
+            asyncio.run(collect(gateway))
+    assert gateway.stats["failures"] == 1
+
+
+def test_stream_client_error_counts_failure():
+    with StubUpstream([(401, {"error": "invalid api key"})]) as upstream:
+        gateway = LLMGateway(upstream.url, api_key="test", backoff_base=0.01)
+        with pytest.raises(LLMGatewayError):
+            asyncio.run(collect(gateway))
+    assert len(upstream.requests) == 1
+    assert gateway.stats["failures"] == 1
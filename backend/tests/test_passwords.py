@@ -0,0 +1,34 @@
+import pytest
+
+from app.services.passwords import PasswordHasher
+
+
+@pytest.fixture(scope="module")
+def hasher():
+    return PasswordHasher(rounds=4, workers=1)
+
+
+def test_hashed_and_legacy_passwords(hasher):
+    stored = hasher.hash_sync("secret")
+    assert hasher.verify_sync("secret", stored) == (True, None)
+    assert hasher.verify_sync("wrong", stored) == (False, None)
+
+    ok, new_hash = hasher.verify_sync("secret", "secret")
+    assert ok and hasher.is_hashed(new_hash)
+
+
+@pytest.mark.parametrize("stored", [None, ""])
+def test_missing_password_still_runs_a_hash(hasher, monkeypatch, stored):
+    calls = []
+    verify = hasher.context.verify
+    monkeypatch.setattr(hasher.context, "verify", lambda *args: calls.append(args) or verify(*args))
+
+    assert hasher.verify_sync("secret", stored) == (False, None)
+    assert len(calls) == 1
+    assert calls[0][1] == hasher._get_dummy_hash()
+
+
+def test_malformed_hash_is_a_failed_login(hasher):
+    stored = hasher.hash_sync("secret")
+    assert hasher.is_hashed(stored[:29])
+    assert hasher.verify_sync("secret", stored[:29]) == (False, None)
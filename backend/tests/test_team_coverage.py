@@ -0,0 +1,89 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.database import SessionLocal, User
+from app.services.team_coverage import AbsenceMatrix, department_coverage, find_off_peak_window
+
+
+def test_commit_user_in_new_department_updates_coverage(client):
+    # 一次提交多个新部门员工，提交钩子依次给矩阵追加新部门列
+    db = SessionLocal()
+    try:
+        db.add_all([
+            User(id=user_id, username=f"coverage{user_id}", email=f"coverage{user_id}@example.com",
+                 hashed_password="x", department="新成立部门")
+            for user_id in (5001, 5002, 5003)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+    response = client.get(
+        "/api/departments/coverage",
+        params={"start_date": "2030-03-04", "end_date": "2030-03-06", "department": "新成立部门"}
+    )
+    assert response.status_code == 200
+    department = response.json()["departments"][0]
+    assert department["department"] == "新成立部门"
+    assert department["headcount"] == 3
+    assert department["absent"] == [0, 0, 0]
+
+
+def test_leave_in_new_department_counts_as_absent(client, auth_headers):
+    db = SessionLocal()
+    try:
+        db.add(User(id=5101, username="coverage5101", email="coverage5101@example.com",
+                    hashed_password="x", department="另一个新部门"))
+        db.commit()
+    finally:
+        db.close()
+
+    # 矩阵只覆盖到今天之后 LEAVE_COVERAGE_HORIZON_DAYS 天，用相对日期
+    day = date.today() + timedelta(days=60)
+    response = client.post("/api/leave/apply", headers=auth_headers(5101), json={
+        "user_id": 5101, "leave_type_id": 3, "start_date": str(day), "end_date": str(day), "reason": "事"
+    })
+    assert response.status_code == 200
+
+    department = client.get(
+        "/api/departments/coverage",
+        params={"start_date": str(day - timedelta(days=1)), "end_date": str(day + timedelta(days=1)),
+                "department": "另一个新部门"}
+    ).json()["departments"][0]
+    assert department["headcount"] == 1
+    assert department["pending"] == [0, 1, 0]
+
+
+def test_reversed_range_is_rejected(client, make_user, auth_headers):
+    user_id = make_user()
+    response = client.post("/api/leave/recommend", headers=auth_headers(user_id), json={
+        "user_id": user_id, "start_date": "2031-05-10", "end_date": "2031-05-05", "reason": "事"
+    })
+    assert response.status_code == 400
+
+    with pytest.raises(ValueError):
+        department_coverage("研发部", "2031-05-10", "2031-05-05")
+    with pytest.raises(ValueError):
+        find_off_peak_window("研发部", "2031-05-10", "2031-05-05", 2)
+
+
+def test_far_future_leave_does_not_grow_the_matrix():
+    matrix = AbsenceMatrix(horizon_days=30)
+    today = date.today().toordinal()
+    matrix.reset({}, {1: "研发部"}, today - 10)
+    rows = len(matrix._approved)
+
+    far = date(9999, 12, 31).toordinal()
+    matrix.add("研发部", today + 5, far, "approved")
+    assert len(matrix._approved) == rows
+    absent, headcount = matrix.absent_counts("研发部", today + 4, today + 6)
+    assert absent.tolist() == [0, 1, 1] and headcount == 1
+
+    # 删除时按同样的范围截断，计数回到 0
+    matrix.remove("研发部", today + 5, far, "approved")
+    assert matrix.absent_counts("研发部", today - 10, today + 30)[0].max() == 0
+
+    matrix.reset({7: (1, "研发部", today - 400, far, "pending")}, {1: "研发部"}, today - 10)
+    assert len(matrix._approved) == rows
+    assert matrix.absent_counts("研发部", today - 10, today + 30)[0].min() == 1